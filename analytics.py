@@ -0,0 +1,131 @@
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from utils import WEEK_DAYS, Shift
+
+# Агрегат часов (таблица schedule_hours): для каждого сотрудника, недели и месяца -
+# число смен и минуты по дням недели. Неделя на стыке месяцев дает две строки,
+# поэтому суммы за месяц и квартал точные и считаются без разбора смен.
+HOURS_COLUMNS = [f"{day}_minutes" for day in WEEK_DAYS]
+PERIODS = {
+    'month': 'month', 'месяц': 'month', 'месяцы': 'month',
+    'quarter': 'quarter', 'квартал': 'quarter', 'кварталы': 'quarter',
+    'year': 'year', 'год': 'year',
+}
+MONTH_PATTERN = re.compile(r'^(\d{4})(?:-(\d{1,2}))?$')
+
+
+def as_date(value) -> date:
+    """Дата из date, datetime или строки ISO (как приходят недели из БД и обработчиков)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def period_start(month_start: date, period: Optional[str]) -> Optional[date]:
+    """Начало периода (month, quarter, year), в который входит месяц; None - весь диапазон"""
+    if period is None:
+        return None
+    if period == 'month':
+        return month_start
+    if period == 'quarter':
+        return month_start.replace(month=(month_start.month - 1) // 3 * 3 + 1)
+    if period == 'year':
+        return month_start.replace(month=1)
+    raise ValueError(f"Неизвестный период: {period}")
+
+
+def format_period(start: Optional[date], period: Optional[str]) -> str:
+    if start is None:
+        return "Итого"
+    if period == 'quarter':
+        return f"{start.year} Q{(start.month - 1) // 3 + 1}"
+    if period == 'year':
+        return str(start.year)
+    return f"{start:%m.%Y}"
+
+
+def week_hours(week_start_date, shifts: Dict[str, Optional[Shift]]) -> List[Tuple[date, int, List[int]]]:
+    """Строки агрегата для недели: (первое число месяца, число смен, минуты по дням).
+
+    День относится к месяцу своей даты; смена через полночь целиком
+    засчитывается дню, в который началась.
+    """
+    week_start = as_date(week_start_date)
+    months: Dict[date, List[int]] = {}
+    for index, day in enumerate(WEEK_DAYS):
+        month = (week_start + timedelta(days=index)).replace(day=1)
+        row = months.get(month)
+        if row is None:
+            row = months[month] = [0] * (len(WEEK_DAYS) + 1)
+        shift = shifts.get(day)
+        if shift is not None:
+            row[0] += 1
+            row[index + 1] = shift.duration
+    return [(month, row[0], row[1:]) for month, row in months.items()]
+
+
+def summarize_hours(rows: Iterable[Dict], period: Optional[str]) -> List[Dict]:
+    """Сводит строки агрегата по месяцам (Database.get_hours_by_month) к периодам.
+
+    Возвращает по записи на сотрудника и период с числом смен, минутами
+    всего (minutes) и по дням недели, отсортированные по ФИО и периоду.
+    При period=None - одна запись на сотрудника за весь диапазон.
+    """
+    totals: Dict[Tuple[int, Optional[date]], Dict] = {}
+    for row in rows:
+        start = period_start(as_date(row['month_start']), period)
+        entry = totals.get((row['user_id'], start))
+        if entry is None:
+            entry = totals[(row['user_id'], start)] = {
+                'user_id': row['user_id'],
+                'first_name': row['first_name'],
+                'last_name': row['last_name'],
+                'period': start,
+                'shifts': 0,
+                'minutes': 0,
+                **{column: 0 for column in HOURS_COLUMNS},
+            }
+        # MySQL возвращает SUM как Decimal
+        entry['shifts'] += int(row['shifts'])
+        for column in HOURS_COLUMNS:
+            minutes = int(row[column])
+            entry[column] += minutes
+            entry['minutes'] += minutes
+    return sorted(
+        totals.values(),
+        key=lambda entry: (entry['last_name'], entry['first_name'], entry['user_id'], entry['period'] or date.min)
+    )
+
+
+def parse_timesheet_args(text: str, today: Optional[date] = None) -> Tuple[date, date, str]:
+    """Разбирает аргументы /timesheet: [ГГГГ | ГГГГ-ММ [ГГГГ-ММ]] [месяц|квартал|год].
+
+    Возвращает первый и последний месяц диапазона (первые числа) и период.
+    Без дат - текущий год, без периода - по месяцам.
+    """
+    today = today or datetime.now().date()
+    period = 'month'
+    bounds = []
+    for token in text.lower().split():
+        if token in PERIODS:
+            period = PERIODS[token]
+            continue
+        match = MONTH_PATTERN.match(token)
+        if not match or len(bounds) == 2:
+            raise ValueError(f"Непонятный аргумент: {token}")
+        year = int(match.group(1))
+        if match.group(2):
+            month = date(year, int(match.group(2)), 1)
+            bounds.append((month, month))
+        else:
+            bounds.append((date(year, 1, 1), date(year, 12, 1)))
+
+    if not bounds:
+        bounds = [(date(today.year, 1, 1), date(today.year, 12, 1))]
+    first, last = bounds[0][0], bounds[-1][1]
+    if first > last:
+        raise ValueError("Начало диапазона позже конца")
+    return first, last, period
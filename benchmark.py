@@ -0,0 +1,221 @@
+"""Микробенчмарки разбора, проверки и форматирования расписаний и выгрузок Excel.
+
+Работает без БД и Telegram на синтетических данных. Примеры:
+
+    python benchmark.py                          # все размеры, сравнение с базовой линией
+    python benchmark.py --sizes 10,1000 --save   # сохранить новую базовую линию
+    python benchmark.py --only excel             # только операции, содержащие "excel"
+
+После прогревочного запуска для каждой операции выводится медиана времени
+нескольких повторов и пиковое выделение памяти (tracemalloc, отдельным прогоном).
+Если время или память выросли больше чем в --threshold раз относительно базовой линии, операция
+помечается как регрессия и скрипт завершается с кодом 1. Время операций
+быстрее MIN_COMPARABLE_TIME не сравнивается: на них разброс замеров больше порога.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+from utils import WEEK_DAYS, DAY_NAMES_RU, Shift, parse_schedule, format_schedule_for_tomorrow
+from coverage import Coverage
+from excel_generator import (
+    generate_week_schedule_excel, generate_day_schedule_excel,
+    stream_week_schedule_excel, stream_day_schedule_excel
+)
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 50000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+# Операции быстрее этого порога слишком шумные, чтобы сравнивать их время
+MIN_COMPARABLE_TIME = 0.1
+WEEK = date(2024, 1, 1)
+
+FIRST_NAMES = ['Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена', 'Дмитрий']
+LAST_NAMES = ['Иванов', 'Петрова', 'Сидоров', 'Кузнецова', 'Смирнов', 'Попова', 'Волков']
+RU_DAYS = list(DAY_NAMES_RU)
+MALFORMED_LINES = [
+    '{day} 9-18',           # нет двоеточия
+    '{day}: 25-30',         # часы вне диапазона
+    '{day}: с утра',        # не время
+    '{day}: 9-18-20',       # лишний интервал
+    'понедельникк: 9:61-18',  # опечатка в дне и минутах
+    ':',
+    '',
+]
+
+
+def make_roster(size: int, seed: int = 0) -> List[Dict]:
+    """Синтетическое расписание недели: смены, выходные и ночные смены"""
+    rng = random.Random(seed)
+    roster = []
+    for user_id in range(1, size + 1):
+        entry = {
+            'user_id': user_id,
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': f"{rng.choice(LAST_NAMES)}{user_id}",
+        }
+        for day in WEEK_DAYS:
+            kind = rng.random()
+            if kind < 0.25:
+                entry[day] = None
+            elif kind < 0.35:
+                entry[day] = Shift(rng.randrange(20, 24) * 60, rng.randrange(2, 8) * 60)
+            else:
+                start = rng.randrange(6 * 60, 14 * 60, 30)
+                entry[day] = Shift(start, start + rng.randrange(4, 11) * 60)
+        roster.append(entry)
+    return roster
+
+
+def make_texts(roster: List[Dict], malformed_ratio: float = 0.1, seed: int = 0) -> List[str]:
+    """Тексты расписаний, как их вводят пользователи; часть из них некорректна"""
+    rng = random.Random(seed)
+    texts = []
+    for entry in roster:
+        lines = [
+            f"{ru_day.capitalize()}: {entry[en_day] if entry[en_day] is not None else 'выходной'}"
+            for ru_day, en_day in DAY_NAMES_RU.items()
+        ]
+        if rng.random() < malformed_ratio:
+            broken = rng.randrange(len(lines))
+            lines[broken] = rng.choice(MALFORMED_LINES).format(day=RU_DAYS[broken])
+        texts.append('\n'.join(lines))
+    return texts
+
+
+def build_operations(size: int) -> Dict[str, Callable[[], object]]:
+    """Операции для одного размера; входные данные готовятся заранее и в замер не входят"""
+    roster = make_roster(size)
+    texts = make_texts(roster)
+    return {
+        'parse_schedule': lambda: [parse_schedule(text) for text in texts],
+        'format_schedule_for_tomorrow': lambda: format_schedule_for_tomorrow(roster, 'tuesday'),
+        'generate_week_schedule_excel': lambda: generate_week_schedule_excel(roster, WEEK),
+        # Как выгрузка недели в боте: расчет покрытия и лист «Покрытие»
+        'week_excel_with_coverage': lambda: generate_week_schedule_excel(roster, WEEK, Coverage(roster)),
+        'generate_day_schedule_excel': lambda: generate_day_schedule_excel(roster, 'tuesday'),
+        'stream_week_schedule_excel': lambda: stream_week_schedule_excel(iter(roster), WEEK),
+        'stream_week_excel_with_coverage': lambda: stream_week_schedule_excel(iter(roster), WEEK, Coverage(roster)),
+        'stream_day_schedule_excel': lambda: stream_day_schedule_excel(iter(roster), 'tuesday'),
+    }
+
+
+def measure(func: Callable[[], object], repeat: int) -> Tuple[float, int]:
+    """Медиана времени repeat запусков и пиковая память отдельного запуска.
+
+    Перед замерами идет прогревочный запуск: ленивые импорты и кэши не
+    попадают ни во время, ни в память.
+    """
+    func()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), peak
+
+
+def compare(result: Dict, baseline: Optional[Dict], threshold: float) -> List[str]:
+    """Причины считать результат регрессией относительно базовой линии"""
+    if baseline is None:
+        return []
+    reasons = []
+    if max(result['time'], baseline['time']) >= MIN_COMPARABLE_TIME and result['time'] > baseline['time'] * threshold:
+        reasons.append(f"время x{result['time'] / baseline['time']:.2f}")
+    if baseline['peak_memory'] and result['peak_memory'] > baseline['peak_memory'] * threshold:
+        reasons.append(f"память x{result['peak_memory'] / baseline['peak_memory']:.2f}")
+    return reasons
+
+
+def format_bytes(value: int) -> str:
+    for unit in ('Б', 'КБ', 'МБ'):
+        if value < 1024:
+            return f"{value:.0f} {unit}"
+        value /= 1024
+    return f"{value:.1f} ГБ"
+
+
+def load_baseline(path: str) -> Dict[str, Dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('results', {})
+
+
+def save_baseline(path: str, results: Dict[str, Dict]):
+    payload = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки разбора расписаний и выгрузок Excel")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="размеры синтетических расписаний через запятую")
+    parser.add_argument('--only', default='', help="запускать только операции, содержащие эту строку")
+    parser.add_argument('--repeat', type=int, default=5, help="число повторов для замера времени (берется медиана)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="файл базовой линии")
+    parser.add_argument('--save', action='store_true', help="сохранить результаты как базовую линию")
+    parser.add_argument('--threshold', type=float, default=2.0,
+                        help="допустимый рост времени и памяти относительно базовой линии")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    baseline = load_baseline(args.baseline)
+    results: Dict[str, Dict] = {}
+    regressions = 0
+
+    print(f"{'операция':<32}{'размер':>8}{'время, с':>12}{'память':>12}  сравнение")
+    for size in sizes:
+        for name, func in build_operations(size).items():
+            if args.only not in name:
+                continue
+            # Крупные выгрузки идут секундами: для них хватает трех повторов
+            repeat = args.repeat if size <= 1000 else min(args.repeat, 3)
+            elapsed, peak = measure(func, repeat)
+            key = f"{name}@{size}"
+            results[key] = {'time': round(elapsed, 6), 'peak_memory': peak}
+
+            reasons = compare(results[key], baseline.get(key), args.threshold)
+            if reasons:
+                regressions += 1
+                status = "РЕГРЕССИЯ: " + ", ".join(reasons)
+            elif key in baseline:
+                status = f"x{elapsed / baseline[key]['time']:.2f}" if baseline[key]['time'] else "ok"
+            else:
+                status = "нет базовой линии"
+            print(f"{name:<32}{size:>8}{elapsed:>12.4f}{format_bytes(peak):>12}  {status}", flush=True)
+
+    if args.save:
+        baseline_results = {**baseline, **results}
+        save_baseline(args.baseline, baseline_results)
+        print(f"Базовая линия сохранена в {args.baseline}")
+    if regressions:
+        print(f"Найдено регрессий: {regressions}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Union
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from config import Config
+from metrics import BROADCAST_MESSAGES, BROADCAST_RETRIES, BROADCAST_RATE
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Глобальный ограничитель скорости отправки сообщений.
+
+    Помимо обычного пополнения токенов поддерживает паузу для всех отправителей
+    после ответа RetryAfter от Telegram.
+    """
+
+    def __init__(self, rate: float = Config.BROADCAST_RATE, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов на seconds секунд"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def _iterate(items: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    """Единый async-обход для обычных и асинхронных последовательностей"""
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def _pages(items: Union[Iterable, AsyncIterable], size: int) -> AsyncIterator[List]:
+    """Разбивает последовательность на списки по size элементов"""
+    page = []
+    async for item in _iterate(items):
+        page.append(item)
+        if len(page) == size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+@dataclass
+class BroadcastResult:
+    broadcast_id: str
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+class Broadcaster:
+    """Рассылка сообщений всем пользователям.
+
+    Отправляет сообщения из нескольких задач с общим ограничением скорости,
+    учитывает RetryAfter, повторяет отправку при сетевых ошибках и сохраняет
+    прогресс в БД, чтобы после перезапуска не отправлять сообщения повторно.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        db,
+        concurrency: int = Config.BROADCAST_CONCURRENCY,
+        rate: float = Config.BROADCAST_RATE,
+        max_retries: int = Config.BROADCAST_MAX_RETRIES
+    ):
+        self.bot = bot
+        self.db = db
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate)
+
+    async def _send(self, user_id: int, text: str, kwargs: dict) -> bool:
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(user_id, text, **kwargs)
+                return True
+            except TelegramRetryAfter as e:
+                logger.warning(f"Flood limit, пауза {e.retry_after} с (пользователь {user_id})")
+                self.bucket.pause(e.retry_after)
+                BROADCAST_RETRIES.inc(reason='retry_after')
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                logger.error(f"Сообщение пользователю {user_id} не доставлено: {e}")
+                return False
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Сообщение пользователю {user_id} не доставлено после {attempt + 1} попыток: {e}")
+                    return False
+                delay = 2 ** attempt
+                BROADCAST_RETRIES.inc(reason='network')
+                logger.warning(f"Ошибка отправки пользователю {user_id}: {e}. Повтор через {delay} с")
+                await asyncio.sleep(delay)
+        return False
+
+    async def _recipients(
+        self,
+        broadcast_id: str,
+        user_ids: Optional[Union[Iterable[int], AsyncIterable[int]]],
+        result: BroadcastResult
+    ) -> AsyncIterator[int]:
+        """Получатели рассылки без тех, кому она уже доставлена"""
+        if user_ids is None:
+            # Все пользователи: доставленные отсеиваются в запросе страницы
+            async for user_id in self.db.iter_undelivered_users(broadcast_id):
+                result.total += 1
+                yield user_id
+            return
+
+        async for page in _pages(user_ids, Config.USER_PAGE_SIZE):
+            delivered = await self.db.get_delivered_users(broadcast_id, page)
+            for user_id in page:
+                result.total += 1
+                if user_id in delivered:
+                    result.skipped += 1
+                    BROADCAST_MESSAGES.inc(result='skipped')
+                    continue
+                yield user_id
+
+    async def run(
+        self,
+        broadcast_id: str,
+        user_ids: Optional[Union[Iterable[int], AsyncIterable[int]]],
+        text: str,
+        **kwargs
+    ) -> BroadcastResult:
+        """Рассылает text пользователям, пропуская тех, кому broadcast_id уже доставлен.
+
+        user_ids=None - всем пользователям: БД отдает страницы только тех, кому
+        рассылка еще не доставлена (уже доставленные не попадают и в total).
+        Иначе user_ids проверяются по БД страницами по USER_PAGE_SIZE; это может
+        быть и асинхронный итератор. В памяти держится одна страница.
+        """
+        result = BroadcastResult(broadcast_id)
+        started = time.monotonic()
+        pending: List[int] = []
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def flush():
+            batch = pending[:]
+            del pending[:]
+            if batch and not await self.db.mark_delivered(broadcast_id, batch):
+                pending.extend(batch)
+
+        async def worker():
+            while True:
+                user_id = await queue.get()
+                try:
+                    if await self._send(user_id, text, kwargs):
+                        result.sent += 1
+                        BROADCAST_MESSAGES.inc(result='sent')
+                        pending.append(user_id)
+                        if len(pending) >= Config.BROADCAST_CHECKPOINT_BATCH:
+                            await flush()
+                    else:
+                        result.failed += 1
+                        BROADCAST_MESSAGES.inc(result='failed')
+                    done = result.sent + result.failed
+                    if done % Config.BROADCAST_PROGRESS_EVERY == 0:
+                        elapsed = time.monotonic() - started
+                        logger.info(
+                            f"Рассылка {broadcast_id}: {done}/{result.total - result.skipped}, "
+                            f"{done / elapsed:.1f} сообщений/с"
+                        )
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            async for user_id in self._recipients(broadcast_id, user_ids, result):
+                await queue.put(user_id)
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await flush()
+
+        result.elapsed = time.monotonic() - started
+        if result.sent:
+            BROADCAST_RATE.observe(result.rate)
+        logger.info(
+            f"Рассылка {broadcast_id} завершена: отправлено {result.sent}, ошибок {result.failed}, "
+            f"пропущено {result.skipped} из {result.total} за {result.elapsed:.1f} с "
+            f"({result.rate:.1f} сообщений/с)"
+        )
+        return result
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+from analytics import as_date
+from config import Config
+from database import AsyncDatabase, CalendarFeed
+from metrics import CALENDAR_REQUESTS
+from utils import WEEK_DAYS, get_week_start_date
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/calendar'
+FEED_PREFIX = '/calendar/'
+FEED_PATH = FEED_PREFIX + '{token:[0-9a-f]{32}}.ics'
+# Клиенты могут хранить ленту, но перед показом проверяют ее условным запросом
+CACHE_CONTROL = 'private, no-cache'
+# Запас при выборке изменений: подписки, записанные в другой реплике с
+# отстающими часами или поздним коммитом, попадают в следующую выборку
+SYNC_OVERLAP = timedelta(seconds=Config.CALENDAR_SYNC_INTERVAL)
+EPOCH = datetime(1970, 1, 1)
+
+
+def feed_url(token: str) -> str:
+    """Публичная ссылка на календарь для подписки"""
+    return f"{Config.CALENDAR_URL.rstrip('/')}{FEED_PREFIX}{token}.ics"
+
+
+def feed_window(today: Optional[date] = None) -> date:
+    """Первая неделя ленты: Config.CALENDAR_PAST_WEEKS недель до текущей"""
+    return get_week_start_date(today) - timedelta(weeks=Config.CALENDAR_PAST_WEEKS)
+
+
+def feed_validators(feed: CalendarFeed, window: date) -> Tuple[str, datetime]:
+    """ETag и Last-Modified ленты: меняются с версией расписания и со сдвигом окна по неделям"""
+    window_moved = datetime.combine(window + timedelta(weeks=Config.CALENDAR_PAST_WEEKS), time())
+    last_modified = max(feed.updated_at, window_moved).replace(tzinfo=timezone.utc)
+    return f"{feed.version}-{window:%Y%m%d}", last_modified
+
+
+def is_not_modified(request: web.Request, etag: str, last_modified: datetime) -> bool:
+    """Условный GET: If-None-Match, а без него If-Modified-Since (RFC 9110, 13.2.2)"""
+    if request.if_none_match is not None:
+        return any(tag.value in (etag, '*') for tag in request.if_none_match)
+    if request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def render_ics(feed: CalendarFeed, entries: List[Dict]) -> bytes:
+    """Лента iCalendar (RFC 5545) со сменами сотрудника.
+
+    Время смен «плавающее» (без часового пояса): календарь покажет его в поясе
+    устройства, как сотрудники и вводят расписание. UID события - сотрудник и
+    дата, поэтому измененная смена заменяет событие, а не дублирует его.
+    """
+    stamp = f"{feed.updated_at:%Y%m%dT%H%M%SZ}"
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//schedulebot//Schedule//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{_escape('Мои смены')}",
+        'REFRESH-INTERVAL;VALUE=DURATION:PT1H',
+        'X-PUBLISHED-TTL:PT1H',
+    ]
+    for entry in entries:
+        week_start = as_date(entry['week_start_date'])
+        for index, day in enumerate(WEEK_DAYS):
+            shift = entry.get(day)
+            if shift is None:
+                continue
+            start = datetime.combine(week_start + timedelta(days=index), time()) + timedelta(minutes=shift.start)
+            end = start + timedelta(minutes=shift.duration)
+            lines += [
+                'BEGIN:VEVENT',
+                f"UID:{feed.user_id}-{start:%Y%m%d}@schedulebot",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART:{start:%Y%m%dT%H%M%S}",
+                f"DTEND:{end:%Y%m%dT%H%M%S}",
+                f"SUMMARY:{_escape(f'Смена {shift}')}",
+                'END:VEVENT',
+            ]
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+
+def create_calendar_app(db: AsyncDatabase) -> web.Application:
+    """aiohttp-приложение с лентами календаря на FEED_PATH.
+
+    Версии подписок берутся из кэша db, поэтому ответ 304 не обращается к БД
+    и не формирует ленту. Кэш заполняется при старте и затем раз в
+    CALENDAR_SYNC_INTERVAL секунд получает подписки, измененные другими репликами.
+    """
+
+    async def feed_handler(request: web.Request) -> web.Response:
+        feed = await db.get_calendar_feed(request.match_info['token'])
+        if feed is None:
+            CALENDAR_REQUESTS.inc(status='404')
+            return web.Response(status=404)
+
+        window = feed_window()
+        etag, last_modified = feed_validators(feed, window)
+        if is_not_modified(request, etag, last_modified):
+            response = web.Response(status=304, headers={'Cache-Control': CACHE_CONTROL})
+        else:
+            entries = await db.get_user_schedules(feed.user_id, window)
+            if entries is None:
+                CALENDAR_REQUESTS.inc(status='503')
+                return web.Response(status=503, headers={'Retry-After': '60'})
+            response = web.Response(
+                body=render_ics(feed, entries), content_type=CONTENT_TYPE, charset='utf-8',
+                headers={'Cache-Control': CACHE_CONTROL}
+            )
+        response.etag = etag
+        response.last_modified = last_modified
+        CALENDAR_REQUESTS.inc(status=str(response.status))
+        return response
+
+    async def sync_feeds(app: web.Application):
+        async def sync():
+            since, warmed = EPOCH, False
+            while True:
+                changed = await db.refresh_calendar_feeds(since)
+                if changed is not None:
+                    if not warmed:
+                        warmed = True
+                        logger.info(f"Кэш подписок на календарь прогрет: {db.sync.calendar_feeds.stats()['size']} записей")
+                    since = max(EPOCH, changed - SYNC_OVERLAP)
+                await asyncio.sleep(Config.CALENDAR_SYNC_INTERVAL)
+
+        task = asyncio.create_task(sync())
+        yield
+        task.cancel()
+
+    app = web.Application()
+    app.router.add_get(FEED_PATH, feed_handler)
+    app.cleanup_ctx.append(sync_feeds)
+    return app
+
+
+async def start_calendar_server(db: AsyncDatabase, host: str = Config.CALENDAR_HOST, port: int = Config.CALENDAR_PORT):
+    """Запускает HTTP-сервер лент календаря на host:port (port=0 - не запускать).
+
+    Возвращает aiohttp AppRunner, который нужно закрыть через cleanup().
+    """
+    if not port:
+        return None
+    runner = web.AppRunner(create_calendar_app(db), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Календарь смен доступен на http://{host}:{port}{FEED_PREFIX}")
+    return runner
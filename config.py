@@ -7,18 +7,86 @@ class Config:
     # Настройки бота
     BOT_TOKEN: str = os.getenv('BOT_TOKEN')
     ADMIN_ID: str = os.getenv('ADMIN_ID', '')
+    BOT_MODE: str = os.getenv('BOT_MODE', 'polling')  # polling или webhook
+    FSM_STORAGE: str = os.getenv('FSM_STORAGE', 'database')  # database или memory
+    FSM_FLUSH_INTERVAL: float = 0.2  # Секунды накопления изменений FSM перед записью в БД
+    FSM_CACHE_TTL: float = float(os.getenv('FSM_CACHE_TTL', '2'))  # Секунды чтения из памяти состояния FSM, измененного на этой реплике
+    
+    # Настройки вебхука (BOT_MODE=webhook)
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')  # Публичный адрес, например https://bot.example.com
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')
+    WEBHOOK_HOST: str = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', '8080'))
+    
+    # Метрики Prometheus (METRICS_PORT=0 отключает сервер метрик)
+    METRICS_HOST: str = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT: int = int(os.getenv('METRICS_PORT', '9100'))
     
     # Настройки базы данных
+    DB_BACKEND: str = os.getenv('DB_BACKEND', 'mysql')  # mysql или sqlite (встроенная БД в файле)
+    SQLITE_PATH: str = os.getenv('SQLITE_PATH', 'schedule_bot.sqlite3')
+    SQLITE_BUSY_TIMEOUT: float = float(os.getenv('SQLITE_BUSY_TIMEOUT', '5'))  # Секунды ожидания блокировки записи
+    SQLITE_CACHE_MB: int = int(os.getenv('SQLITE_CACHE_MB', '64'))  # Кэш страниц на одно соединение
     DB_HOST: str = os.getenv('DB_HOST', 'localhost')
     DB_USER: str = os.getenv('DB_USER', 'root')
     DB_PASSWORD: str = os.getenv('DB_PASSWORD', '')
     DB_NAME: str = os.getenv('DB_NAME', 'schedule_bot')
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_POOL_IDLE_CHECK: float = float(os.getenv('DB_POOL_IDLE_CHECK', '30'))  # Секунды простоя до проверки соединения
+    USER_CACHE_SIZE: int = int(os.getenv('USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL: float = float(os.getenv('USER_CACHE_TTL', '3600'))
+    ROSTER_CACHE_WEEKS: int = int(os.getenv('ROSTER_CACHE_WEEKS', '8'))
+    ROSTER_REVALIDATE: float = float(os.getenv('ROSTER_REVALIDATE', '5'))  # Секунды между сверками кэша недели с версией в БД
+    USER_PAGE_SIZE: int = 1000  # Пользователей в одной странице при обходе списка (рассылки)
+    BULK_INSERT_BATCH: int = 500  # Строк в одном запросе массовой загрузки расписаний
+    IMPORT_ERRORS_IN_MESSAGE: int = 30  # Сколько ошибок импорта показывать в сообщении
+    
+    # Настройки выгрузок
+    EXPORT_STREAMING_ROWS: int = int(os.getenv('EXPORT_STREAMING_ROWS', '500'))  # С какого числа строк файл выгрузки пишется в режиме write-only
+    EXPORT_POOL: str = os.getenv('EXPORT_POOL', 'thread')  # thread или process
+    EXPORT_WORKERS: int = int(os.getenv('EXPORT_WORKERS', '2'))
+    EXPORT_QUEUE_SIZE: int = int(os.getenv('EXPORT_QUEUE_SIZE', '8'))  # Выгрузок в очереди сверх занятых воркеров
+    EXPORT_TIMEOUT: float = float(os.getenv('EXPORT_TIMEOUT', '60'))  # Секунды до отказа в выгрузке
+    
+    # Календарь смен в формате iCalendar (CALENDAR_PORT=0 отключает сервер календаря)
+    CALENDAR_URL: str = os.getenv('CALENDAR_URL', '')  # Публичный адрес, например https://calendar.example.com
+    CALENDAR_HOST: str = os.getenv('CALENDAR_HOST', '0.0.0.0')
+    CALENDAR_PORT: int = int(os.getenv('CALENDAR_PORT', '0'))
+    CALENDAR_PAST_WEEKS: int = int(os.getenv('CALENDAR_PAST_WEEKS', '4'))  # Сколько прошедших недель в календаре
+    CALENDAR_CACHE_SIZE: int = int(os.getenv('CALENDAR_CACHE_SIZE', '10000'))  # Подписок в памяти
+    CALENDAR_SYNC_INTERVAL: float = 60  # Секунды между проверками изменений подписок в БД (другие реплики)
+
+    # Ограничение частоты обновлений от одного пользователя
+    THROTTLE_RATE: float = float(os.getenv('THROTTLE_RATE', '1'))  # Обновлений в секунду после исчерпания запаса
+    THROTTLE_BURST: int = int(os.getenv('THROTTLE_BURST', '5'))    # Обновлений подряд без ограничения
+    THROTTLE_CONCURRENCY: int = 2  # Обработчиков одного пользователя одновременно
+    THROTTLE_MAX_USERS: int = 10000  # Сколько пользователей помнит ограничитель
     
     # Настройки расписания
     WORK_START_HOUR: int = 9
     WORK_END_HOUR: int = 18
     REMINDER_DAY: str = 'wednesday'  # День напоминания (среда)
     REMINDER_HOUR: int = 10          # Час отправки напоминания
+    DAILY_SCHEDULE_HOUR: int = 18    # Час рассылки расписания на завтра
+    JOB_MISFIRE_GRACE: int = 6 * 3600  # Секунды, в течение которых пропущенный запуск догоняется
+    JOB_LEASE: int = 300               # Секунды без heartbeat, после которых запуск можно перехватить
+    JOB_RUNS_KEEP_DAYS: int = 14       # Сколько дней хранить записи о запусках (больше 8 дней, которые просматривает догон)
+    PURGE_HOUR: int = 4                # Час ежедневной очистки истории рассылок и запусков задач
+    COVERAGE_SLOT_MINUTES: int = 15  # Шаг сетки покрытия смен
+    SHIFT_ALERT_LEAD: int = int(os.getenv('SHIFT_ALERT_LEAD', '30'))  # Минут до смены по умолчанию (/remind)
+    SHIFT_ALERT_MAX_LEAD: int = 12 * 60  # Самое раннее напоминание, минут до смены
+    SHIFT_ALERT_WINDOW: int = 24 * 3600  # Секунды вперед, на которые загружаются смены
+    SHIFT_ALERT_RELOAD: int = 3600       # Секунды между полными перезагрузками окна
+    MIN_STAFF: int = int(os.getenv('MIN_STAFF', '2'))  # Минимум сотрудников на смене
+    
+    # Настройки рассылок
+    BROADCAST_CONCURRENCY: int = int(os.getenv('BROADCAST_CONCURRENCY', '10'))
+    BROADCAST_RATE: float = float(os.getenv('BROADCAST_RATE', '25'))  # Сообщений в секунду (лимит Bot API ~30)
+    BROADCAST_MAX_RETRIES: int = int(os.getenv('BROADCAST_MAX_RETRIES', '3'))
+    BROADCAST_CHECKPOINT_BATCH: int = 50   # Доставок между сохранениями прогресса
+    BROADCAST_PROGRESS_EVERY: int = 100    # Доставок между записями в лог
+    BROADCAST_KEEP_DAYS: int = 7           # Сколько дней хранить прогресс рассылок
     
     class Messages:
         WELCOME = "👋 Добро пожаловать в бот для управления расписанием!"
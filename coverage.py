@@ -0,0 +1,114 @@
+import numpy as np
+from typing import Dict, List, Tuple, Iterable, TYPE_CHECKING
+from config import Config
+from utils import WEEK_DAYS, MINUTES_IN_DAY, format_minute
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class Coverage:
+    """Покрытие смен за неделю.
+
+    Для каждого дня хранит число сотрудников по временным слотам (slot_minutes),
+    посчитанное через разностный массив и префиксные суммы. Слот считается
+    занятым сотрудником, если смена пересекается с ним хотя бы частично.
+    Смена через полночь переносит остаток на следующий день; остаток смены
+    воскресенья относится к следующей неделе и не учитывается.
+    """
+
+    def __init__(self, roster: Iterable[Dict], slot_minutes: int = Config.COVERAGE_SLOT_MINUTES):
+        self.slot_minutes = slot_minutes
+        self.slots_per_day = MINUTES_IN_DAY // slot_minutes
+
+        names, seg_person, seg_day, seg_start, seg_end = [], [], [], [], []
+        for person, entry in enumerate(roster):
+            names.append(f"{entry['last_name']} {entry['first_name']}")
+            for day_index, day in enumerate(WEEK_DAYS):
+                shift = entry.get(day)
+                if shift is None:
+                    continue
+                for part, (start, end) in enumerate(shift.segments()):
+                    # Вторая часть смены через полночь приходится на следующий день
+                    target_day = day_index + part
+                    if target_day >= len(WEEK_DAYS) or start == end:
+                        continue
+                    seg_person.append(person)
+                    seg_day.append(target_day)
+                    seg_start.append(start)
+                    seg_end.append(end)
+
+        self.names = np.array(names, dtype=object)
+        self.seg_person = np.array(seg_person, dtype=np.int32)
+        self.seg_day = np.array(seg_day, dtype=np.int8)
+        self.seg_start = np.array(seg_start, dtype=np.int16)
+        self.seg_end = np.array(seg_end, dtype=np.int16)
+
+        diff = np.zeros((len(WEEK_DAYS), self.slots_per_day + 1), dtype=np.int32)
+        first_slot = self.seg_start // slot_minutes
+        last_slot = -(-self.seg_end // slot_minutes)  # Округление вверх
+        np.add.at(diff, (self.seg_day, first_slot), 1)
+        np.add.at(diff, (self.seg_day, last_slot), -1)
+        self.counts = np.cumsum(diff[:, :-1], axis=1)
+
+    def _slot(self, minute: int) -> int:
+        return minute // self.slot_minutes
+
+    def headcount(self, day: str, minute: int) -> int:
+        """Число сотрудников на смене в слоте, содержащем minute"""
+        return int(self.counts[WEEK_DAYS.index(day), self._slot(minute)])
+
+    def who(self, day: str, minute: int) -> List[str]:
+        """Кто на смене в день day в слоте, содержащем minute (как в headcount)"""
+        slot_start = self._slot(minute) * self.slot_minutes
+        mask = (
+            (self.seg_day == WEEK_DAYS.index(day))
+            & (self.seg_start < slot_start + self.slot_minutes)
+            & (slot_start < self.seg_end)
+        )
+        return sorted(self.names[np.unique(self.seg_person[mask])])
+
+    def gaps(self, threshold: int, start_minute: int = 0, end_minute: int = MINUTES_IN_DAY) -> List[Tuple[str, int, int, int]]:
+        """Интервалы, где на смене меньше threshold человек.
+
+        Возвращает (день, начало, конец, минимальное число сотрудников) в минутах,
+        рассматривая только окно [start_minute, end_minute) каждого дня.
+        """
+        first, last = self._slot(start_minute), -(-end_minute // self.slot_minutes)
+        window = self.counts[:, first:last]
+        below = np.pad(window < threshold, ((0, 0), (1, 1))).astype(np.int8)
+        edges = np.diff(below, axis=1)
+        days, run_starts = np.nonzero(edges == 1)
+        _, run_ends = np.nonzero(edges == -1)
+
+        result = []
+        for day_index, run_start, run_end in zip(days, run_starts, run_ends):
+            lowest = int(window[day_index, run_start:run_end].min())
+            result.append((
+                WEEK_DAYS[day_index],
+                (first + run_start) * self.slot_minutes,
+                (first + run_end) * self.slot_minutes,
+                lowest
+            ))
+        return result
+
+    def peaks(self) -> List[Tuple[str, int, int, int]]:
+        """Максимум одновременно работающих по дням: (день, число, начало, конец первого пика)"""
+        maxima = self.counts.max(axis=1)
+        at_peak = np.pad(self.counts == maxima[:, None], ((0, 0), (0, 1)))
+        starts = at_peak.argmax(axis=1)
+        result = []
+        for day_index, day in enumerate(WEEK_DAYS):
+            if not maxima[day_index]:
+                continue
+            start = int(starts[day_index])
+            end = start + int(np.argmin(at_peak[day_index, start:]))
+            result.append((day, int(maxima[day_index]), start * self.slot_minutes, end * self.slot_minutes))
+        return result
+
+    def table(self, start_minute: int = 0, end_minute: int = MINUTES_IN_DAY) -> 'pd.DataFrame':
+        """Таблица покрытия: строки - время начала слота, столбцы - дни недели"""
+        import pandas as pd  # pandas нужен только для таблицы, не для бота
+        first, last = self._slot(start_minute), -(-end_minute // self.slot_minutes)
+        index = [format_minute(slot * self.slot_minutes) for slot in range(first, last)]
+        return pd.DataFrame(self.counts[:, first:last].T, index=index, columns=WEEK_DAYS)
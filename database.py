@@ -1,186 +1,1544 @@
+import abc
+import asyncio
+import functools
+import secrets
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
 import mysql.connector
+from mysql.connector import errors as mysql_errors
+from analytics import HOURS_COLUMNS, week_hours
 from config import Config
+from metrics import instrument_methods
+from singleflight import SingleFlight
+from migrations import Migration, add_index, explain_problems, migrate, server_lock, server_table_exists
+from utils import WEEK_DAYS, Shift, parse_shift
 import time
-from typing import Optional, Dict, List
+from types import MappingProxyType
+from typing import Optional, Dict, List, Set, Tuple, Callable, Any, Iterator, AsyncIterator, Iterable, NamedTuple
 import logging
 
 logger = logging.getLogger(__name__)
 
-class Database:
-    def __init__(self):
-        self.connection = None
-        self.cursor = None
+# Ошибки, после которых соединение нельзя возвращать в пул
+CONNECTION_ERRORS = (mysql_errors.InterfaceError, mysql_errors.OperationalError)
+
+# Смены хранятся как минуты от начала суток: <день>_start/<день>_end.
+# Бит i в days_off означает выходной в i-й день недели (0 - понедельник).
+SHIFT_COLUMNS = [f"{day}_{edge}" for day in WEEK_DAYS for edge in ('start', 'end')]
+
+# CROSS JOIN закрепляет в SQLite порядок соединения: строки недели по idx_week_user,
+# затем пользователи по ключу, а не обход всего индекса users по ФИО.
+# В MySQL CROSS JOIN с ON равносилен обычному JOIN.
+WEEK_SCHEDULE_QUERY = f"""
+    SELECT u.first_name, u.last_name, s.id, s.user_id, s.week_start_date,
+           s.days_off, {', '.join('s.' + column for column in SHIFT_COLUMNS)}
+    FROM schedules s
+    CROSS JOIN users u ON s.user_id = u.user_id
+    WHERE s.week_start_date = %s
+    ORDER BY u.last_name, u.first_name
+"""
+WEEK_VERSION_QUERY = "SELECT version FROM week_versions WHERE week_start_date = %s"
+USER_NAME_QUERY = "SELECT first_name, last_name FROM users WHERE user_id = %s"
+FSM_RECORD_QUERY = "SELECT state, data FROM fsm_states WHERE storage_key = %s"
+# Постраничный обход по первичному ключу: каждая страница - короткий range scan без OFFSET
+USERS_PAGE_QUERY = """
+    SELECT user_id, first_name, last_name FROM users
+    WHERE user_id > %s ORDER BY user_id LIMIT %s
+"""
+# Та же страница без пользователей, которым рассылка уже доставлена: доставка
+# проверяется по первичному ключу broadcast_deliveries для каждой строки страницы
+UNDELIVERED_USERS_PAGE_QUERY = """
+    SELECT u.user_id FROM users u
+    LEFT JOIN broadcast_deliveries d ON d.broadcast_id = %s AND d.user_id = u.user_id
+    WHERE u.user_id > %s AND d.user_id IS NULL
+    ORDER BY u.user_id LIMIT %s
+"""
+
+# Часы по месяцам за диапазон месяцев (аналитика, табель)
+HOURS_BY_MONTH_QUERY = f"""
+    SELECT h.month_start, h.user_id, u.first_name, u.last_name,
+           SUM(h.shifts) AS shifts, {', '.join(f'SUM(h.{column}) AS {column}' for column in HOURS_COLUMNS)}
+    FROM schedule_hours h
+    JOIN users u ON h.user_id = u.user_id
+    WHERE h.month_start BETWEEN %s AND %s
+    GROUP BY h.month_start, h.user_id, u.first_name, u.last_name
+"""
+
+# Расписания одного сотрудника начиная с недели (календарь смен): range scan по unique_user_week
+USER_SCHEDULES_QUERY = f"""
+    SELECT week_start_date, days_off, {', '.join(SHIFT_COLUMNS)}
+    FROM schedules
+    WHERE user_id = %s AND week_start_date >= %s
+    ORDER BY week_start_date
+"""
+CALENDAR_FEED_QUERY = "SELECT token, user_id, version, updated_at FROM calendar_feeds WHERE token = %s"
+CALENDAR_TOKEN_QUERY = "SELECT token FROM calendar_feeds WHERE user_id = %s"
+# Подписки, измененные начиная с момента (синхронизация кэша между репликами), новые первыми
+CHANGED_CALENDAR_FEEDS_QUERY = """
+    SELECT token, user_id, version, updated_at FROM calendar_feeds
+    WHERE updated_at >= %s ORDER BY updated_at DESC LIMIT %s
+"""
+
+# Подписанные на напоминания о сменах и их расписания на диапазон недель - одним запросом.
+# LEFT JOIN: подписка без расписаний на эти недели дает строку с week_start_date NULL
+SHIFT_ALERTS_QUERY = f"""
+    SELECT a.user_id, a.lead_minutes, s.week_start_date, s.days_off,
+           {', '.join('s.' + column for column in SHIFT_COLUMNS)}
+    FROM shift_alerts a
+    LEFT JOIN schedules s ON s.user_id = a.user_id AND s.week_start_date BETWEEN %s AND %s
+"""
+SHIFT_ALERT_QUERY = "SELECT lead_minutes FROM shift_alerts WHERE user_id = %s"
+
+USERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        first_name VARCHAR(50) NOT NULL,
+        last_name VARCHAR(50) NOT NULL,
+        registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+SCHEDULES_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS schedules (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id BIGINT,
+        week_start_date DATE,
+        days_off TINYINT UNSIGNED NOT NULL DEFAULT 0,
+        {', '.join(column + ' SMALLINT UNSIGNED NULL' for column in SHIFT_COLUMNS)},
+        FOREIGN KEY (user_id) REFERENCES users(user_id),
+        UNIQUE KEY unique_user_week (user_id, week_start_date)
+    )
+"""
+
+# Состояния FSM (регистрация, ввод расписания)
+FSM_STATES_TABLE = """
+    CREATE TABLE IF NOT EXISTS fsm_states (
+        storage_key VARCHAR(255) PRIMARY KEY,
+        state VARCHAR(255) NULL,
+        data TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+# Плановые запуски периодических задач (выбор реплики-исполнителя)
+JOB_RUNS_TABLE = """
+    CREATE TABLE IF NOT EXISTS job_runs (
+        job_id VARCHAR(64) NOT NULL,
+        run_at DATETIME NOT NULL,
+        owner VARCHAR(128) NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        heartbeat_at DATETIME NOT NULL,
+        finished_at DATETIME NULL,
+        PRIMARY KEY (job_id, run_at)
+    )
+"""
+
+# Доставленные сообщения рассылок (для продолжения после перезапуска)
+BROADCAST_DELIVERIES_TABLE = """
+    CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+        broadcast_id VARCHAR(64) NOT NULL,
+        user_id BIGINT NOT NULL,
+        delivered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (broadcast_id, user_id),
+        KEY idx_delivered_at (delivered_at)
+    )
+"""
+
+# Агрегат часов по сотрудникам, неделям и месяцам (см. analytics.week_hours).
+# Первичный ключ начинается с месяца: выборка диапазона месяцев - один range scan
+# по кластерному индексу без обращений к другим индексам.
+SCHEDULE_HOURS_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS schedule_hours (
+        month_start DATE NOT NULL,
+        user_id BIGINT NOT NULL,
+        week_start_date DATE NOT NULL,
+        shifts TINYINT UNSIGNED NOT NULL,
+        {', '.join(column + ' SMALLINT UNSIGNED NOT NULL' for column in HOURS_COLUMNS)},
+        PRIMARY KEY (month_start, user_id, week_start_date),
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+"""
+# Подписки на календарь смен: секретный токен ссылки и версия расписания сотрудника.
+# version и updated_at (UTC) меняются при каждом сохранении расписания и дают
+# ETag и Last-Modified ленты без чтения самих расписаний.
+CALENDAR_FEEDS_TABLE = """
+    CREATE TABLE IF NOT EXISTS calendar_feeds (
+        token CHAR(32) PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        version INT UNSIGNED NOT NULL DEFAULT 0,
+        updated_at DATETIME NOT NULL,
+        UNIQUE KEY unique_user (user_id),
+        KEY idx_updated_at (updated_at),
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+"""
+
+# Напоминания о начале смены: за сколько минут предупреждать сотрудника
+SHIFT_ALERTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS shift_alerts (
+        user_id BIGINT PRIMARY KEY,
+        lead_minutes SMALLINT UNSIGNED NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+"""
+
+# Версии расписаний недель: растут при каждой записи в неделю, по ним реплики
+# сверяют кэш недели одним запросом по ключу вместо перечитывания расписания
+WEEK_VERSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS week_versions (
+        week_start_date DATE PRIMARY KEY,
+        version INT UNSIGNED NOT NULL
+    )
+"""
+
+HOURS_INSERT_COLUMNS = ['month_start', 'user_id', 'week_start_date', 'shifts'] + HOURS_COLUMNS
+INSERT_HOURS_SQL = f"""
+    INSERT INTO schedule_hours ({', '.join(HOURS_INSERT_COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(HOURS_INSERT_COLUMNS))})
+"""
+
+def _shift_text_sql(day: str, bit: int) -> str:
+    """SQL-выражение со сменой в текстовом виде «H:MM-H:MM» или «выходной»"""
+    def minutes(column: str) -> str:
+        return f"CONCAT({column} DIV 60, ':', LPAD({column} MOD 60, 2, '0'))"
+    return (
+        f"IF(days_off & {1 << bit} OR {day}_start IS NULL, 'выходной', "
+        f"CONCAT({minutes(day + '_start')}, '-', {minutes(day + '_end')})) AS {day}"
+    )
+
+# Представление со сменами в прежнем строковом формате для внешних отчетов и скриптов
+SCHEDULES_TEXT_VIEW = f"""
+    CREATE OR REPLACE VIEW schedules_text AS
+    SELECT id, user_id, week_start_date,
+           {', '.join(_shift_text_sql(day, bit) for bit, day in enumerate(WEEK_DAYS))}
+    FROM schedules
+"""
+
+def upsert_schedules_sql(rows: int) -> str:
+    """INSERT ... ON DUPLICATE KEY UPDATE для rows расписаний одним запросом"""
+    placeholders = '(' + ', '.join(['%s'] * (len(SHIFT_COLUMNS) + 3)) + ')'
+    return f"""
+        INSERT INTO schedules (user_id, week_start_date, days_off, {', '.join(SHIFT_COLUMNS)})
+        VALUES {', '.join([placeholders] * rows)}
+        ON DUPLICATE KEY UPDATE
+        days_off = VALUES(days_off),
+        {', '.join(f'{column} = VALUES({column})' for column in SHIFT_COLUMNS)}
+    """
+
+# Один и тот же объект строки: подготовленный оператор переиспользуется только для него
+UPSERT_SCHEDULE_SQL = upsert_schedules_sql(1)
+UPSERT_HOURS_SQL = INSERT_HOURS_SQL + f"""
+    ON DUPLICATE KEY UPDATE
+    shifts = VALUES(shifts),
+    {', '.join(f'{column} = VALUES({column})' for column in HOURS_COLUMNS)}
+"""
+
+def touch_calendar_feeds_sql(rows: int) -> str:
+    """Новая версия календарей rows сотрудников (после изменения их расписаний)"""
+    return f"""
+        UPDATE calendar_feeds SET version = version + 1, updated_at = %s
+        WHERE user_id IN ({', '.join(['%s'] * rows)})
+    """
+
+TOUCH_CALENDAR_FEED_SQL = touch_calendar_feeds_sql(1)
+
+def utc_now() -> datetime:
+    """Текущее время UTC с точностью до секунды (как хранится в DATETIME)"""
+    return datetime.utcnow().replace(microsecond=0)
+
+def encode_shifts(shifts: Dict[str, Optional[Shift]]) -> List[Optional[int]]:
+    """Переводит смены по дням в значения столбцов: days_off и пары start/end"""
+    days_off = 0
+    values = []
+    for bit, day in enumerate(WEEK_DAYS):
+        shift = shifts.get(day)
+        if shift is None:
+            days_off |= 1 << bit
+            values.extend((None, None))
+        else:
+            values.extend((shift.start, shift.end))
+    return [days_off] + values
+
+def decode_shifts(row: Dict) -> Dict:
+    """Заменяет столбцы смен в строке БД на значения Shift (None - выходной)"""
+    entry = {key: value for key, value in row.items() if key != 'days_off' and key not in SHIFT_COLUMNS}
+    days_off = row['days_off']
+    for bit, day in enumerate(WEEK_DAYS):
+        start = row[f'{day}_start']
+        entry[day] = None if days_off >> bit & 1 or start is None else Shift(start, row[f'{day}_end'])
+    return entry
+
+def encode_hours(user_id: int, week_start_date, shifts: Dict[str, Optional[Shift]]) -> List[List]:
+    """Параметры строк schedule_hours (в порядке HOURS_INSERT_COLUMNS) для расписания недели"""
+    return [
+        [month, user_id, week_start_date, count] + minutes
+        for month, count, minutes in week_hours(week_start_date, shifts)
+    ]
+
+def backfill_schedule_hours(cursor):
+    """Заполняет агрегат часов по всем сохраненным расписаниям"""
+    cursor.execute("DELETE FROM schedule_hours")
+    last_id, total = 0, 0
+    while True:
+        cursor.execute(
+            f"SELECT id, user_id, week_start_date, days_off, {', '.join(SHIFT_COLUMNS)} FROM schedules "
+            "WHERE id > %s ORDER BY id LIMIT %s",
+            (last_id, Config.BULK_INSERT_BATCH)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany(INSERT_HOURS_SQL, [
+            values
+            for entry in map(decode_shifts, rows)
+            for values in encode_hours(entry['user_id'], entry['week_start_date'], entry)
+        ])
+        last_id = rows[-1]['id']
+        total += len(rows)
+    logger.info(f"Агрегат часов заполнен: {total} расписаний")
+
+def migrate_legacy_schedules(cursor):
+    """Переносит смены из старых VARCHAR-столбцов (monday, ...) в минуты"""
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'schedules'
+    """)
+    columns = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+    if 'monday' not in columns:
+        return
+    
+    logger.info("Миграция расписаний из строкового формата в минуты...")
+    if 'days_off' not in columns:
+        cursor.execute(
+            "ALTER TABLE schedules ADD COLUMN days_off TINYINT UNSIGNED NOT NULL DEFAULT 0, "
+            + ", ".join(f"ADD COLUMN {column} SMALLINT UNSIGNED NULL" for column in SHIFT_COLUMNS)
+        )
+    
+    cursor.execute(f"SELECT id, {', '.join(WEEK_DAYS)} FROM schedules")
+    updates = []
+    for row in cursor.fetchall():
+        shifts = {}
+        for day in WEEK_DAYS:
+            try:
+                shifts[day] = parse_shift(row[day] or 'выходной')
+            except ValueError:
+                logger.warning(f"Расписание {row['id']}, {day}: некорректное значение {row[day]!r}, считаем выходным")
+                shifts[day] = None
+        updates.append(encode_shifts(shifts) + [row['id']])
+    
+    if updates:
+        cursor.executemany(
+            f"UPDATE schedules SET days_off = %s, {', '.join(column + ' = %s' for column in SHIFT_COLUMNS)} "
+            "WHERE id = %s",
+            updates
+        )
+    cursor.execute("ALTER TABLE schedules " + ", ".join(f"DROP COLUMN {day}" for day in WEEK_DAYS))
+    logger.info(f"Миграция расписаний завершена: {len(updates)} записей")
+
+# Миграции схемы. Применяются по порядку и один раз; новые изменения схемы
+# добавляются только новой миграцией с большим номером.
+MIGRATIONS = [
+    # CREATE TABLE IF NOT EXISTS: на существующих БД миграция ничего не меняет
+    Migration(1, 'initial_schema', (
+        USERS_TABLE, SCHEDULES_TABLE, migrate_legacy_schedules, SCHEDULES_TEXT_VIEW,
+        FSM_STATES_TABLE, JOB_RUNS_TABLE, BROADCAST_DELIVERIES_TABLE
+    )),
+    # Индексы под расписание недели: выборка по неделе (week_start_date ведущий
+    # столбец) и сортировка по ФИО, которую покрывает индекс users по имени
+    Migration(2, 'hot_query_indexes', (
+        add_index('schedules', 'idx_week_user', ['week_start_date', 'user_id']),
+        add_index('users', 'idx_name', ['last_name', 'first_name']),
+    )),
+    Migration(3, 'schedule_hours', (SCHEDULE_HOURS_TABLE, backfill_schedule_hours)),
+    Migration(4, 'calendar_feeds', (CALENDAR_FEEDS_TABLE,)),
+    Migration(5, 'shift_alerts', (SHIFT_ALERTS_TABLE,)),
+    Migration(6, 'week_versions', (WEEK_VERSIONS_TABLE,)),
+]
+
+# Частые запросы с примерными параметрами для проверки планов (python migrations.py --explain)
+HOT_QUERIES = {
+    'week_schedule': (WEEK_SCHEDULE_QUERY, ('2024-01-01',)),
+    'week_version': (WEEK_VERSION_QUERY, ('2024-01-01',)),
+    'user_name': (USER_NAME_QUERY, (0,)),
+    'fsm_record': (FSM_RECORD_QUERY, ('',)),
+    'users_page': (USERS_PAGE_QUERY, (0, Config.USER_PAGE_SIZE)),
+    'undelivered_users_page': (UNDELIVERED_USERS_PAGE_QUERY, ('', 0, Config.USER_PAGE_SIZE)),
+    'hours_by_month': (HOURS_BY_MONTH_QUERY, ('2024-01-01', '2024-12-01')),
+    'user_schedules': (USER_SCHEDULES_QUERY, (0, '2024-01-01')),
+    'calendar_feed': (CALENDAR_FEED_QUERY, ('',)),
+    'changed_calendar_feeds': (CHANGED_CALENDAR_FEEDS_QUERY, ('2024-01-01', Config.CALENDAR_CACHE_SIZE)),
+}
+
+class ConnectionPool:
+    """Ограниченный пул соединений с БД.
+
+    Соединение проверяется ping-ом только если оно простаивало дольше
+    idle_check секунд, а не перед каждым запросом. Для каждого соединения
+    хранятся подготовленные на сервере операторы частых запросов.
+    Пул потокобезопасен.
+    """
+
+    def __init__(self, size: int = Config.DB_POOL_SIZE, idle_check: float = Config.DB_POOL_IDLE_CHECK):
+        self.size = size
+        self.idle_check = idle_check
+        self._idle = deque()  # (соединение, время последнего использования)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+        self._statements: Dict[int, Dict[str, Any]] = {}  # id соединения -> SQL -> курсор
+
+    def _connect(self):
+        return mysql.connector.connect(
+            host=Config.DB_HOST,
+            user=Config.DB_USER,
+            password=Config.DB_PASSWORD,
+            database=Config.DB_NAME,
+            connection_timeout=5
+        )
+
+    def _close_quietly(self, connection):
+        self._statements.pop(id(connection), None)
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+            if item is None:
+                return self._connect()
+
+            connection, last_used = item
+            if time.monotonic() - last_used > self.idle_check:
+                try:
+                    # Без reconnect: после переподключения подготовленные операторы недействительны
+                    connection.ping(reconnect=False)
+                except mysql.connector.Error:
+                    logger.warning("Соединение с БД потеряно. Переподключаемся...")
+                    self._close_quietly(connection)
+                    return self._connect()
+            return connection
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, connection, broken: bool = False):
+        try:
+            if broken or self._closed:
+                self._close_quietly(connection)
+            else:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def statement(self, connection, sql: str):
+        """Курсор с подготовленным на сервере оператором sql для этого соединения.
+
+        Оператор готовится при первом использовании и затем только выполняется
+        с новыми параметрами. Результат нужно читать полностью (fetchall).
+        """
+        statements = self._statements.setdefault(id(connection), {})
+        cursor = statements.get(sql)
+        if cursor is None:
+            cursor = statements[sql] = connection.cursor(prepared=True, dictionary=True)
+        return cursor
+
+    @contextmanager
+    def connection(self):
+        """Выдает соединение из пула и возвращает его обратно после использования"""
+        connection = self._acquire()
+        broken = False
+        try:
+            yield connection
+            if connection.in_transaction:
+                # Завершает транзакцию, открытую чтением: иначе (REPEATABLE READ) следующий
+                # пользователь соединения видел бы данные на момент этого чтения
+                connection.rollback()
+        except BaseException as err:
+            broken = isinstance(err, CONNECTION_ERRORS)
+            if not broken:
+                try:
+                    connection.rollback()
+                except mysql.connector.Error:
+                    broken = True
+            raise
+        finally:
+            self._release(connection, broken)
+
+    def migration_lock(self, cursor):
+        """Блокировка на время миграций, общая для всех реплик"""
+        return server_lock(cursor)
+
+    def table_exists(self, cursor, table: str) -> bool:
+        return server_table_exists(cursor, table)
+
+    def close(self):
+        """Закрывает все простаивающие соединения"""
+        self._closed = True
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+
+class UserCache:
+    """Кэш зарегистрированных пользователей: user_id -> ФИО.
+
+    Ограничен по размеру (LRU) и по времени жизни записи (TTL), потокобезопасен.
+    """
+
+    def __init__(self, max_size: int = Config.USER_CACHE_SIZE, ttl: float = Config.USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> (ФИО, время истечения)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[str]:
+        """Возвращает ФИО из кэша или None, если записи нет или она устарела"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, user_id: int, name: str):
+        with self._lock:
+            self._entries[user_id] = (name, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class CalendarFeed(NamedTuple):
+    """Подписка на календарь смен сотрудника"""
+    token: str
+    user_id: int
+    version: int
+    updated_at: datetime  # UTC, последнее изменение расписания или ссылки
+
+    @classmethod
+    def from_row(cls, row: Dict) -> 'CalendarFeed':
+        updated_at = row['updated_at']
+        if not isinstance(updated_at, datetime):
+            updated_at = datetime.fromisoformat(str(updated_at))  # SQLite возвращает строку
+        return cls(row['token'], row['user_id'], row['version'], updated_at)
+
+
+class CalendarFeedCache:
+    """Кэш подписок на календарь: токен -> CalendarFeed.
+
+    Ограничен по размеру (LRU), потокобезопасен. Записи не устаревают по времени:
+    сохранение расписания в этом процессе сбрасывает запись сотрудника, а
+    изменения из других реплик приходят периодической выборкой
+    (Database.refresh_calendar_feeds).
+    """
+
+    def __init__(self, max_size: int = Config.CALENDAR_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # токен -> CalendarFeed
+        self._tokens: Dict[int, str] = {}  # user_id -> токен
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[CalendarFeed]:
+        with self._lock:
+            feed = self._entries.get(token)
+            if feed is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return feed
+
+    def put(self, feed: CalendarFeed):
+        """Сохраняет подписку; старая ссылка сотрудника (после замены токена) забывается"""
+        with self._lock:
+            previous = self._tokens.get(feed.user_id)
+            if previous is not None and previous != feed.token:
+                self._entries.pop(previous, None)
+            self._entries[feed.token] = feed
+            self._entries.move_to_end(feed.token)
+            self._tokens[feed.user_id] = feed.token
+            while len(self._entries) > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._tokens.pop(evicted.user_id, None)
+
+    def discard_users(self, user_ids: Iterable[int]):
+        """Сбрасывает подписки сотрудников, чьи расписания изменились"""
+        with self._lock:
+            for user_id in user_ids:
+                token = self._tokens.pop(user_id, None)
+                if token is not None:
+                    self._entries.pop(token, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class Roster(tuple):
+    """Неизменяемый снимок расписания недели с номером версии недели в БД"""
+
+    def __new__(cls, rows, week_start_date, version: int):
+        roster = super().__new__(cls, (MappingProxyType(dict(row)) for row in rows))
+        roster.week_start_date = week_start_date
+        roster.version = version
+        return roster
+
+
+class RosterCache:
+    """Кэш расписаний по неделям с версионированием.
+
+    Версия недели хранится в БД (week_versions) и растет при каждой записи в
+    неделю с любой реплики. Снимок отдается из кэша не дольше revalidate секунд
+    после последней сверки с этой версией, затем Database.load_week_schedule
+    сверяет ее одним запросом по ключу и перечитывает неделю, только если она
+    изменилась. Запись на этой реплике сразу сбрасывает снимок недели.
+    Производные представления (текст, файлы) кэшируются вместе со снимком.
+    """
+
+    def __init__(self, max_weeks: int = Config.ROSTER_CACHE_WEEKS, revalidate: float = Config.ROSTER_REVALIDATE):
+        self.max_weeks = max_weeks
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        # Число записей в неделю на этой реплике: снимок, прочитанный до записи, не сохраняется
+        self._generations: Dict[str, int] = {}
+        self._entries = OrderedDict()  # неделя -> [снимок, представления, время последней сверки]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(week_start_date) -> str:
+        return str(week_start_date)
+
+    def generation(self, week_start_date) -> int:
+        with self._lock:
+            return self._generations.get(self._key(week_start_date), 0)
+
+    def get(self, week_start_date) -> Optional[Roster]:
+        """Снимок недели, если он сверялся с БД не раньше revalidate секунд назад"""
+        key = self._key(week_start_date)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.revalidate:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, week_start_date) -> Optional[Roster]:
+        """Снимок недели без проверки срока сверки (например, при недоступной БД)"""
+        with self._lock:
+            entry = self._entries.get(self._key(week_start_date))
+            return entry[0] if entry is not None else None
+
+    def confirm(self, week_start_date, generation: int, version: int) -> Optional[Roster]:
+        """Продлевает снимок, если его версия совпадает с версией в БД; иначе None"""
+        key = self._key(week_start_date)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0].version != version or self._generations.get(key, 0) != generation:
+                return None
+            entry[2] = time.monotonic()
+            return entry[0]
+
+    def put(self, week_start_date, generation: int, version: int, rows) -> Roster:
+        """Сохраняет снимок, если с момента чтения неделя не менялась на этой реплике"""
+        roster = Roster(rows, week_start_date, version)
+        key = self._key(week_start_date)
+        with self._lock:
+            if self._generations.get(key, 0) == generation:
+                self._entries[key] = [roster, {}, time.monotonic()]
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_weeks:
+                    self._entries.popitem(last=False)
+        return roster
+
+    def invalidate(self, week_start_date):
+        """Сбрасывает снимок недели после записи в нее"""
+        key = self._key(week_start_date)
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.pop(key, None)
+
+    def _current_views(self, roster: Roster) -> Optional[Dict]:
+        entry = self._entries.get(self._key(roster.week_start_date))
+        if entry is None or entry[0].version != roster.version:
+            return None
+        return entry[1]
+
+    def get_view(self, roster: Roster, view_key) -> Any:
+        """Возвращает сохраненное представление снимка или None"""
+        with self._lock:
+            views = self._current_views(roster)
+            return views.get(view_key) if views is not None else None
+
+    def set_view(self, roster: Roster, view_key, value: Any):
+        """Сохраняет представление, если снимок еще актуален"""
+        with self._lock:
+            views = self._current_views(roster)
+            if views is not None:
+                views[view_key] = value
+
+    def memoize(self, roster: Roster, view_key, factory: Callable[[], Any]) -> Any:
+        """Возвращает представление снимка, вычисляя его один раз на версию"""
+        value = self.get_view(roster, view_key)
+        if value is None:
+            value = factory()
+            self.set_view(roster, view_key, value)
+        return value
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'weeks': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+@instrument_methods
+class Database(abc.ABC):
+    """Синхронный доступ к хранилищу через пул соединений (для скриптов и потоков).
+
+    Общий интерфейс и логика (кэши, разбор смен, обработка ошибок) для всех СУБД.
+    Подклассы задают пул соединений, класс ошибок драйвера, миграции и SQL,
+    который отличается между СУБД. Экземпляр нужного типа создает create_database().
+    """
+
+    # Базовый класс ошибок драйвера СУБД
+    Error: type = Exception
+    MIGRATIONS: List[Migration] = []
+
+    # SQL, зависящий от СУБД (общие запросы - константы модуля)
+    REGISTER_USER_SQL: str
+    UPSERT_SCHEDULE_SQL: str
+    UPSERT_HOURS_SQL: str
+    SAVE_FSM_RECORD_SQL: str
+    MARK_DELIVERED_SQL: str
+    PURGE_DELIVERIES_SQL: str
+    PURGE_JOB_RUNS_SQL: str
+    CLAIM_JOB_INSERT_SQL: str
+    CLAIM_JOB_TAKEOVER_SQL: str
+    HEARTBEAT_JOB_SQL: str
+    FINISH_JOB_SQL: str
+    MARK_JOB_MISSED_SQL: str
+    SAVE_CALENDAR_TOKEN_SQL: str
+    SAVE_SHIFT_ALERT_SQL: str
+    BUMP_WEEK_VERSION_SQL: str
+
+    def __init__(self, migrate: bool = True, connect: bool = True):
+        self.pool = self._create_pool()
+        self.users = UserCache()
+        self.rosters = RosterCache()
+        self.calendar_feeds = CalendarFeedCache()
+        if connect:
+            self.connect(migrate)
+
+    @abc.abstractmethod
+    def _create_pool(self):
+        """Пул соединений СУБД"""
+
+    @staticmethod
+    @abc.abstractmethod
+    def upsert_schedules_sql(rows: int) -> str:
+        """Upsert rows расписаний одним запросом"""
+
+    @abc.abstractmethod
+    def check_query_plans(self) -> List[str]:
+        """Проверяет планы частых запросов (HOT_QUERIES), возвращает найденные проблемы"""
+
+    def connect(self, migrate: bool = True):
+        """Проверяет подключение к БД (с повторами) и применяет миграции"""
         self._connect_with_retry()
-        self._create_tables()
+        if migrate:
+            self.migrate()
 
     def _connect_with_retry(self, max_retries: int = 5, delay: int = 5):
         for attempt in range(max_retries):
             try:
-                self.connection = mysql.connector.connect(
-                    host=Config.DB_HOST,
-                    user=Config.DB_USER,
-                    password=Config.DB_PASSWORD,
-                    database=Config.DB_NAME,
-                    connection_timeout=5
-                )
-                self.cursor = self.connection.cursor(dictionary=True)
+                with self.pool.connection():
+                    pass
                 logger.info("Успешное подключение к БД")
                 return
-            except mysql.connector.Error as err:
+            except self.Error as err:
                 logger.error(f"Попытка {attempt + 1} из {max_retries}: Ошибка подключения к БД: {err}")
                 if attempt < max_retries - 1:
                     time.sleep(delay)
                 else:
                     raise
 
-    def _ensure_connection(self):
-        if not self.connection or not self.connection.is_connected():
-            logger.warning("Соединение с БД потеряно. Переподключаемся...")
-            self._connect_with_retry()
-
-    def _create_tables(self):
-        try:
-            self._ensure_connection()
-            
-            # Таблица пользователей
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    first_name VARCHAR(50) NOT NULL,
-                    last_name VARCHAR(50) NOT NULL,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Таблица расписания
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS schedules (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id BIGINT,
-                    week_start_date DATE,
-                    monday VARCHAR(50),
-                    tuesday VARCHAR(50),
-                    wednesday VARCHAR(50),
-                    thursday VARCHAR(50),
-                    friday VARCHAR(50),
-                    saturday VARCHAR(50),
-                    sunday VARCHAR(50),
-                    FOREIGN KEY (user_id) REFERENCES users(user_id),
-                    UNIQUE KEY unique_user_week (user_id, week_start_date)
-                )
-            """)
-            
-            self.connection.commit()
-            logger.info("Таблицы успешно созданы")
-        except mysql.connector.Error as err:
-            logger.error(f"Ошибка при создании таблиц: {err}")
+    @contextmanager
+    def _cursor(self, commit: bool = False):
+        """Курсор на соединении из пула; при commit=True фиксирует транзакцию"""
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                yield cursor
+                if commit:
+                    connection.commit()
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def _statement(self, sql: str, commit: bool = False):
+        """Подготовленный оператор sql на соединении из пула (для частых запросов)"""
+        with self.pool.connection() as connection:
+            yield self.pool.statement(connection, sql)
+            if commit:
+                connection.commit()
+
+    def migrate(self, dry_run: bool = False) -> List[Migration]:
+        """Применяет ожидающие миграции схемы (при dry_run только пишет их в лог)"""
+        try:
+            return migrate(self.pool, self.MIGRATIONS, dry_run)
+        except self.Error as err:
+            logger.error(f"Ошибка при миграции схемы БД: {err}")
             raise
 
     def register_user(self, user_id: int, first_name: str, last_name: str) -> bool:
         """Регистрирует нового пользователя"""
         try:
-            self._ensure_connection()
-            self.cursor.execute("""
-                INSERT INTO users (user_id, first_name, last_name)
-                VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE 
-                first_name = VALUES(first_name),
-                last_name = VALUES(last_name)
-            """, (user_id, first_name[:50], last_name[:50]))
-            self.connection.commit()
+            with self._cursor(commit=True) as cursor:
+                cursor.execute(self.REGISTER_USER_SQL, (user_id, first_name[:50], last_name[:50]))
+            self.users.put(user_id, f"{last_name[:50]} {first_name[:50]}")
             return True
-        except mysql.connector.Error as err:
+        except self.Error as err:
             logger.error(f"Ошибка при регистрации пользователя: {err}")
             return False
 
     def is_user_registered(self, user_id: int) -> bool:
         """Проверяет, зарегистрирован ли пользователь"""
-        try:
-            self._ensure_connection()
-            self.cursor.execute("SELECT 1 FROM users WHERE user_id = %s", (user_id,))
-            return bool(self.cursor.fetchone())
-        except mysql.connector.Error as err:
-            logger.error(f"Ошибка при проверке регистрации пользователя: {err}")
-            return False
+        return self.get_user_name(user_id) is not None
 
     def get_user_name(self, user_id: int) -> Optional[str]:
         """Получает ФИО пользователя"""
+        name = self.users.get(user_id)
+        if name is not None:
+            return name
+        return self.load_user_name(user_id)
+
+    def load_user_name(self, user_id: int) -> Optional[str]:
+        """Читает ФИО пользователя из БД в обход кэша и кладет результат в кэш"""
         try:
-            self._ensure_connection()
-            self.cursor.execute("SELECT first_name, last_name FROM users WHERE user_id = %s", (user_id,))
-            user = self.cursor.fetchone()
-            return f"{user['last_name']} {user['first_name']}" if user else None
-        except mysql.connector.Error as err:
+            with self._statement(USER_NAME_QUERY) as cursor:
+                cursor.execute(USER_NAME_QUERY, (user_id,))
+                rows = cursor.fetchall()
+            user = rows[0] if rows else None
+        except self.Error as err:
             logger.error(f"Ошибка при получении имени пользователя: {err}")
             return None
+        if not user:
+            return None
+        name = f"{user['last_name']} {user['first_name']}"
+        self.users.put(user_id, name)
+        return name
 
     def save_schedule(self, user_id: int, week_start_date: str, schedule_data: Dict) -> bool:
-        """Сохраняет расписание пользователя"""
+        """Сохраняет расписание пользователя.
+
+        Значения дней - строки ("9-18", "выходной") или уже разобранные Shift/None;
+        строки разбираются и проверяются здесь один раз. Агрегат часов недели,
+        версия недели и версия календаря сотрудника обновляются в той же транзакции.
+        """
         try:
-            self._ensure_connection()
-            self.cursor.execute("""
-                INSERT INTO schedules (
-                    user_id, week_start_date, 
-                    monday, tuesday, wednesday, thursday, friday, saturday, sunday
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                monday = VALUES(monday),
-                tuesday = VALUES(tuesday),
-                wednesday = VALUES(wednesday),
-                thursday = VALUES(thursday),
-                friday = VALUES(friday),
-                saturday = VALUES(saturday),
-                sunday = VALUES(sunday)
-            """, (
-                user_id, week_start_date,
-                schedule_data.get('monday', 'выходной')[:50],
-                schedule_data.get('tuesday', 'выходной')[:50],
-                schedule_data.get('wednesday', 'выходной')[:50],
-                schedule_data.get('thursday', 'выходной')[:50],
-                schedule_data.get('friday', 'выходной')[:50],
-                schedule_data.get('saturday', 'выходной')[:50],
-                schedule_data.get('sunday', 'выходной')[:50]
-            ))
-            self.connection.commit()
+            shifts = {
+                day: parse_shift(value) if isinstance(value, str) else value
+                for day, value in ((day, schedule_data.get(day, 'выходной')) for day in WEEK_DAYS)
+            }
+        except ValueError as err:
+            logger.error(f"Некорректное расписание пользователя {user_id}: {err}")
+            return False
+        
+        try:
+            with self.pool.connection() as connection:
+                statement = self.pool.statement(connection, self.UPSERT_SCHEDULE_SQL)
+                statement.execute(self.UPSERT_SCHEDULE_SQL, [user_id, week_start_date] + encode_shifts(shifts))
+                statement = self.pool.statement(connection, self.UPSERT_HOURS_SQL)
+                for values in encode_hours(user_id, week_start_date, shifts):
+                    statement.execute(self.UPSERT_HOURS_SQL, values)
+                statement = self.pool.statement(connection, TOUCH_CALENDAR_FEED_SQL)
+                statement.execute(TOUCH_CALENDAR_FEED_SQL, (utc_now(), user_id))
+                statement = self.pool.statement(connection, self.BUMP_WEEK_VERSION_SQL)
+                statement.execute(self.BUMP_WEEK_VERSION_SQL, (week_start_date,))
+                connection.commit()
+            self.rosters.invalidate(week_start_date)
+            self.calendar_feeds.discard_users((user_id,))
             return True
-        except mysql.connector.Error as err:
+        except self.Error as err:
             logger.error(f"Ошибка при сохранении расписания: {err}")
             return False
 
-    def get_week_schedule(self, week_start_date: str) -> List[Dict]:
+    def save_schedules_bulk(self, week_start_date: str, entries: List[Tuple[int, Dict[str, Optional[Shift]]]]) -> bool:
+        """Сохраняет расписания многих пользователей на неделю в одной транзакции.
+
+        Записи вставляются многострочными upsert-запросами по Config.BULK_INSERT_BATCH строк;
+        агрегат часов и версии календарей обновляются пачками вместе с ними.
+        Версия недели увеличивается один раз на всю загрузку.
+        """
+        try:
+            updated_at = utc_now()
+            with self._cursor(commit=True) as cursor:
+                for offset in range(0, len(entries), Config.BULK_INSERT_BATCH):
+                    batch = entries[offset:offset + Config.BULK_INSERT_BATCH]
+                    params, hours = [], []
+                    for user_id, shifts in batch:
+                        params.extend([user_id, week_start_date] + encode_shifts(shifts))
+                        hours.extend(encode_hours(user_id, week_start_date, shifts))
+                    cursor.execute(self.upsert_schedules_sql(len(batch)), params)
+                    cursor.executemany(self.UPSERT_HOURS_SQL, hours)
+                    cursor.execute(
+                        touch_calendar_feeds_sql(len(batch)),
+                        [updated_at] + [user_id for user_id, _ in batch]
+                    )
+                cursor.execute(self.BUMP_WEEK_VERSION_SQL, (week_start_date,))
+            self.rosters.invalidate(week_start_date)
+            self.calendar_feeds.discard_users(user_id for user_id, _ in entries)
+            return True
+        except self.Error as err:
+            logger.error(f"Ошибка при массовом сохранении расписаний: {err}")
+            return False
+
+    def get_week_schedule(self, week_start_date: str) -> Roster:
         """Получает расписание всех на неделю"""
+        roster = self.rosters.get(week_start_date)
+        if roster is not None:
+            return roster
+        return self.load_week_schedule(week_start_date)
+
+    def load_week_schedule(self, week_start_date: str) -> Roster:
+        """Сверяет снимок недели с версией в БД и перечитывает расписание, если оно изменилось.
+
+        Версия читается до строк: если неделю изменят между запросами, снимок
+        получит старую версию и будет перечитан при следующей сверке.
+        При ошибке БД отдается прежний снимок, если он есть.
+        """
+        generation = self.rosters.generation(week_start_date)
         try:
-            self._ensure_connection()
-            self.cursor.execute("""
-                SELECT u.first_name, u.last_name, s.* 
-                FROM schedules s
-                JOIN users u ON s.user_id = u.user_id
-                WHERE s.week_start_date = %s
-                ORDER BY u.last_name, u.first_name
-            """, (week_start_date,))
-            return self.cursor.fetchall()
-        except mysql.connector.Error as err:
+            with self.pool.connection() as connection:
+                statement = self.pool.statement(connection, WEEK_VERSION_QUERY)
+                statement.execute(WEEK_VERSION_QUERY, (week_start_date,))
+                rows = statement.fetchall()
+                version = rows[0]['version'] if rows else 0
+                roster = self.rosters.confirm(week_start_date, generation, version)
+                if roster is not None:
+                    return roster
+                statement = self.pool.statement(connection, WEEK_SCHEDULE_QUERY)
+                statement.execute(WEEK_SCHEDULE_QUERY, (week_start_date,))
+                rows = statement.fetchall()
+        except self.Error as err:
             logger.error(f"Ошибка при получении расписания: {err}")
-            return []
+            return self.rosters.peek(week_start_date) or Roster((), week_start_date, 0)
+        return self.rosters.put(week_start_date, generation, version, map(decode_shifts, rows))
+
+    def get_hours_by_month(self, first_month, last_month) -> Optional[List[Dict]]:
+        """Часы сотрудников по месяцам с first_month по last_month (первые числа) из агрегата.
+
+        Строка на сотрудника и месяц: число смен и минуты по дням недели
+        (см. analytics.summarize_hours). None при ошибке БД.
+        """
+        try:
+            with self._cursor() as cursor:
+                cursor.execute(HOURS_BY_MONTH_QUERY, (first_month, last_month))
+                return cursor.fetchall()
+        except self.Error as err:
+            logger.error(f"Ошибка при получении часов сотрудников: {err}")
+            return None
+
+    def get_user_schedules(self, user_id: int, first_week: date) -> Optional[List[Dict]]:
+        """Расписания сотрудника по неделям начиная с first_week (None при ошибке БД)"""
+        try:
+            with self._statement(USER_SCHEDULES_QUERY) as cursor:
+                cursor.execute(USER_SCHEDULES_QUERY, (user_id, first_week))
+                rows = cursor.fetchall()
+        except self.Error as err:
+            logger.error(f"Ошибка при получении расписаний пользователя {user_id}: {err}")
+            return None
+        return list(map(decode_shifts, rows))
+
+    def get_calendar_feed(self, token: str) -> Optional[CalendarFeed]:
+        """Подписка на календарь по токену ссылки (из кэша или из БД)"""
+        feed = self.calendar_feeds.get(token)
+        if feed is not None:
+            return feed
+        return self.load_calendar_feed(token)
+
+    def load_calendar_feed(self, token: str) -> Optional[CalendarFeed]:
+        """Читает подписку из БД в обход кэша и кладет ее в кэш"""
+        try:
+            with self._statement(CALENDAR_FEED_QUERY) as cursor:
+                cursor.execute(CALENDAR_FEED_QUERY, (token,))
+                rows = cursor.fetchall()
+        except self.Error as err:
+            logger.error(f"Ошибка при получении подписки на календарь: {err}")
+            return None
+        if not rows:
+            return None
+        feed = CalendarFeed.from_row(rows[0])
+        self.calendar_feeds.put(feed)
+        return feed
+
+    def get_calendar_token(self, user_id: int, renew: bool = False) -> Optional[str]:
+        """Токен ссылки на календарь сотрудника; создает его при первом запросе.
+
+        renew=True выдает новый токен, старая ссылка перестает работать.
+        """
+        try:
+            with self._cursor(commit=True) as cursor:
+                if not renew:
+                    cursor.execute(CALENDAR_TOKEN_QUERY, (user_id,))
+                    row = cursor.fetchone()
+                    if row:
+                        return row['token']
+                token = secrets.token_hex(16)
+                cursor.execute(self.SAVE_CALENDAR_TOKEN_SQL, (token, user_id, utc_now()))
+        except self.Error as err:
+            logger.error(f"Ошибка при создании ссылки на календарь: {err}")
+            return None
+        self.calendar_feeds.discard_users((user_id,))
+        return token
+
+    def refresh_calendar_feeds(self, since: datetime) -> Optional[datetime]:
+        """Кладет в кэш подписки, измененные начиная с since (UTC).
+
+        Возвращает время последнего изменения среди них (since, если изменений нет)
+        или None при ошибке БД.
+        """
+        try:
+            with self._cursor() as cursor:
+                cursor.execute(CHANGED_CALENDAR_FEEDS_QUERY, (since, self.calendar_feeds.max_size))
+                rows = cursor.fetchall()
+        except self.Error as err:
+            logger.error(f"Ошибка при обновлении подписок на календарь: {err}")
+            return None
+        # Старые первыми: в LRU-кэше дольше останутся недавно измененные
+        feeds = [CalendarFeed.from_row(row) for row in reversed(rows)]
+        for feed in feeds:
+            self.calendar_feeds.put(feed)
+        return feeds[-1].updated_at if feeds else since
+
+    def get_shift_alerts(self, first_week: date, last_week: date) -> Optional[List[Dict]]:
+        """Подписки на напоминания о сменах с расписаниями на недели с first_week по last_week.
+
+        Строка на сотрудника и неделю: user_id, lead_minutes, week_start_date и
+        смены по дням; у подписки без расписаний на эти недели week_start_date
+        равен None. None при ошибке БД.
+        """
+        try:
+            with self._cursor() as cursor:
+                cursor.execute(SHIFT_ALERTS_QUERY, (first_week, last_week))
+                rows = cursor.fetchall()
+        except self.Error as err:
+            logger.error(f"Ошибка при получении напоминаний о сменах: {err}")
+            return None
+        return [
+            decode_shifts(row) if row['week_start_date'] is not None
+            else {'user_id': row['user_id'], 'lead_minutes': row['lead_minutes'], 'week_start_date': None}
+            for row in rows
+        ]
+
+    def get_shift_alert(self, user_id: int) -> Optional[int]:
+        """За сколько минут до смены предупреждать сотрудника (None - напоминания выключены)"""
+        try:
+            with self._cursor() as cursor:
+                cursor.execute(SHIFT_ALERT_QUERY, (user_id,))
+                row = cursor.fetchone()
+        except self.Error as err:
+            logger.error(f"Ошибка при получении настройки напоминаний: {err}")
+            return None
+        return row['lead_minutes'] if row else None
+
+    def set_shift_alert(self, user_id: int, lead_minutes: Optional[int]) -> bool:
+        """Включает напоминания о сменах за lead_minutes минут (None - выключает)"""
+        try:
+            with self._cursor(commit=True) as cursor:
+                if lead_minutes is None:
+                    cursor.execute("DELETE FROM shift_alerts WHERE user_id = %s", (user_id,))
+                else:
+                    cursor.execute(self.SAVE_SHIFT_ALERT_SQL, (user_id, lead_minutes))
+            return True
+        except self.Error as err:
+            logger.error(f"Ошибка при сохранении настройки напоминаний: {err}")
+            return False
 
     def get_all_users(self) -> List[Dict]:
         """Получает список всех пользователей"""
         try:
-            self._ensure_connection()
-            self.cursor.execute("SELECT user_id, first_name, last_name FROM users")
-            return self.cursor.fetchall()
-        except mysql.connector.Error as err:
+            with self._cursor() as cursor:
+                cursor.execute("SELECT user_id, first_name, last_name FROM users")
+                return cursor.fetchall()
+        except self.Error as err:
             logger.error(f"Ошибка при получении списка пользователей: {err}")
             return []
 
+    def get_users_page(self, after_user_id: int, limit: int) -> Optional[List[Dict]]:
+        """Следующие limit пользователей с user_id больше after_user_id (None при ошибке БД)"""
+        try:
+            with self._statement(USERS_PAGE_QUERY) as cursor:
+                cursor.execute(USERS_PAGE_QUERY, (after_user_id, limit))
+                return cursor.fetchall()
+        except self.Error as err:
+            logger.error(f"Ошибка при получении страницы пользователей: {err}")
+            return None
+
+    def iter_users(self, batch_size: int = Config.USER_PAGE_SIZE) -> Iterator[Dict]:
+        """Обходит всех пользователей по возрастанию user_id страницами по batch_size"""
+        after = 0
+        while True:
+            page = self.get_users_page(after, batch_size)
+            if page is None:
+                raise RuntimeError(f"Не удалось прочитать пользователей после user_id={after}")
+            yield from page
+            if len(page) < batch_size:
+                return
+            after = page[-1]['user_id']
+
+    def get_undelivered_users_page(self, broadcast_id: str, after_user_id: int, limit: int) -> Optional[List[int]]:
+        """Следующие limit пользователей после after_user_id, которым рассылка еще не доставлена (None при ошибке БД)"""
+        try:
+            with self._statement(UNDELIVERED_USERS_PAGE_QUERY) as cursor:
+                cursor.execute(UNDELIVERED_USERS_PAGE_QUERY, (broadcast_id, after_user_id, limit))
+                return [row['user_id'] for row in cursor.fetchall()]
+        except self.Error as err:
+            logger.error(f"Ошибка при получении страницы получателей рассылки: {err}")
+            return None
+
+    def get_delivered_users(self, broadcast_id: str, user_ids: List[int]) -> Set[int]:
+        """Получает пользователей из user_ids, которым рассылка уже доставлена"""
+        if not user_ids:
+            return set()
+        try:
+            with self._cursor() as cursor:
+                cursor.execute(
+                    "SELECT user_id FROM broadcast_deliveries "
+                    f"WHERE broadcast_id = %s AND user_id IN ({', '.join(['%s'] * len(user_ids))})",
+                    (broadcast_id, *user_ids)
+                )
+                return {row['user_id'] for row in cursor.fetchall()}
+        except self.Error as err:
+            logger.error(f"Ошибка при получении состояния рассылки: {err}")
+            return set()
+
+    def mark_delivered(self, broadcast_id: str, user_ids: List[int]) -> bool:
+        """Отмечает доставку рассылки пачкой пользователей"""
+        if not user_ids:
+            return True
+        try:
+            with self._cursor(commit=True) as cursor:
+                cursor.executemany(
+                    self.MARK_DELIVERED_SQL,
+                    [(broadcast_id, user_id) for user_id in user_ids]
+                )
+            return True
+        except self.Error as err:
+            logger.error(f"Ошибка при сохранении состояния рассылки: {err}")
+            return False
+
+    def purge_deliveries(self, keep_days: int) -> bool:
+        """Удаляет отметки о доставке старше keep_days дней"""
+        try:
+            with self._cursor(commit=True) as cursor:
+                cursor.execute(self.PURGE_DELIVERIES_SQL, (keep_days,))
+            return True
+        except self.Error as err:
+            logger.error(f"Ошибка при очистке состояния рассылок: {err}")
+            return False
+
+    def purge_job_runs(self, keep_days: int) -> bool:
+        """Удаляет записи о запусках задач, запланированных больше keep_days дней назад"""
+        try:
+            with self._cursor(commit=True) as cursor:
+                cursor.execute(self.PURGE_JOB_RUNS_SQL, (keep_days,))
+            return True
+        except self.Error as err:
+            logger.error(f"Ошибка при очистке истории запусков задач: {err}")
+            return False
+
+    def get_fsm_record(self, storage_key: str) -> Optional[Tuple[Optional[str], str]]:
+        """Получает состояние FSM и данные (JSON) по ключу"""
+        try:
+            with self._statement(FSM_RECORD_QUERY) as cursor:
+                cursor.execute(FSM_RECORD_QUERY, (storage_key,))
+                rows = cursor.fetchall()
+            row = rows[0] if rows else None
+            return (row['state'], row['data']) if row else None
+        except self.Error as err:
+            logger.error(f"Ошибка при получении состояния FSM: {err}")
+            return None
+
+    def save_fsm_records(self, records: List[Tuple[str, Optional[str], str]]) -> bool:
+        """Сохраняет пачку состояний FSM; пустые записи удаляются"""
+        upserts = [record for record in records if record[1] is not None or record[2] != '{}']
+        deletes = [(record[0],) for record in records if record[1] is None and record[2] == '{}']
+        try:
+            with self._cursor(commit=True) as cursor:
+                if upserts:
+                    cursor.executemany(self.SAVE_FSM_RECORD_SQL, upserts)
+                if deletes:
+                    cursor.executemany("DELETE FROM fsm_states WHERE storage_key = %s", deletes)
+            return True
+        except self.Error as err:
+            logger.error(f"Ошибка при сохранении состояний FSM: {err}")
+            return False
+
+    def claim_job_run(self, job_id: str, run_at: datetime, owner: str, lease: int) -> bool:
+        """Занимает плановый запуск задачи.
+
+        Успешно, если запуска еще нет, он завершился ошибкой или его владелец
+        не обновлял heartbeat дольше lease секунд.
+        """
+        try:
+            with self._cursor(commit=True) as cursor:
+                cursor.execute(self.CLAIM_JOB_INSERT_SQL, (job_id, run_at, owner))
+                if cursor.rowcount == 1:
+                    return True
+                cursor.execute(self.CLAIM_JOB_TAKEOVER_SQL, (owner, job_id, run_at, lease))
+                return cursor.rowcount == 1
+        except self.Error as err:
+            logger.error(f"Ошибка при захвате задачи {job_id}: {err}")
+            return False
+
+    def heartbeat_job_run(self, job_id: str, run_at: datetime, owner: str) -> bool:
+        """Продлевает владение запуском задачи"""
+        try:
+            with self._cursor(commit=True) as cursor:
+                cursor.execute(self.HEARTBEAT_JOB_SQL, (job_id, run_at, owner))
+            return True
+        except self.Error as err:
+            logger.error(f"Ошибка при обновлении heartbeat задачи {job_id}: {err}")
+            return False
+
+    def finish_job_run(self, job_id: str, run_at: datetime, owner: str, status: str) -> bool:
+        """Фиксирует результат запуска задачи (done/failed)"""
+        try:
+            with self._cursor(commit=True) as cursor:
+                cursor.execute(self.FINISH_JOB_SQL, (status, job_id, run_at, owner))
+            return True
+        except self.Error as err:
+            logger.error(f"Ошибка при завершении задачи {job_id}: {err}")
+            return False
+
+    def mark_job_missed(self, job_id: str, run_at: datetime) -> bool:
+        """Отмечает пропущенный запуск; False, если запись о нем уже есть"""
+        try:
+            with self._cursor(commit=True) as cursor:
+                cursor.execute(self.MARK_JOB_MISSED_SQL, (job_id, run_at))
+                return cursor.rowcount == 1
+        except self.Error as err:
+            logger.error(f"Ошибка при записи пропуска задачи {job_id}: {err}")
+            return False
+
+    def warm_user_cache(self) -> int:
+        """Заполняет кэш пользователей из БД, возвращает число загруженных записей"""
+        total = 0
+        try:
+            # Кэш вытесняет самые старые записи, поэтому в нем останутся последние max_size
+            for user in self.iter_users():
+                self.users.put(user['user_id'], f"{user['last_name']} {user['first_name']}")
+                total += 1
+        except RuntimeError as err:
+            logger.error(f"Кэш пользователей прогрет не полностью: {err}")
+        logger.info(f"Кэш пользователей прогрет: {min(total, self.users.max_size)} записей")
+        return total
+
     def close(self):
-        """Закрывает соединение с БД"""
+        """Закрывает соединения с БД"""
         try:
-            if self.cursor:
-                self.cursor.close()
-            if self.connection and self.connection.is_connected():
-                self.connection.close()
+            self.pool.close()
             logger.info("Соединение с БД закрыто")
-        except mysql.connector.Error as err:
+        except self.Error as err:
             logger.error(f"Ошибка при закрытии соединения с БД: {err}")
+
+
+@instrument_methods
+class MySQLDatabase(Database):
+    """Хранилище на сервере MySQL"""
+
+    Error = mysql.connector.Error
+    MIGRATIONS = MIGRATIONS
+
+    REGISTER_USER_SQL = """
+        INSERT INTO users (user_id, first_name, last_name)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE 
+        first_name = VALUES(first_name),
+        last_name = VALUES(last_name)
+    """
+    UPSERT_SCHEDULE_SQL = UPSERT_SCHEDULE_SQL
+    UPSERT_HOURS_SQL = UPSERT_HOURS_SQL
+    upsert_schedules_sql = staticmethod(upsert_schedules_sql)
+    SAVE_FSM_RECORD_SQL = """
+        INSERT INTO fsm_states (storage_key, state, data) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE state = VALUES(state), data = VALUES(data)
+    """
+    MARK_DELIVERED_SQL = "INSERT IGNORE INTO broadcast_deliveries (broadcast_id, user_id) VALUES (%s, %s)"
+    PURGE_DELIVERIES_SQL = "DELETE FROM broadcast_deliveries WHERE delivered_at < NOW() - INTERVAL %s DAY"
+    PURGE_JOB_RUNS_SQL = "DELETE FROM job_runs WHERE run_at < UTC_TIMESTAMP() - INTERVAL %s DAY"
+    CLAIM_JOB_INSERT_SQL = """
+        INSERT IGNORE INTO job_runs (job_id, run_at, owner, status, heartbeat_at)
+        VALUES (%s, %s, %s, 'running', UTC_TIMESTAMP())
+    """
+    CLAIM_JOB_TAKEOVER_SQL = """
+        UPDATE job_runs
+        SET owner = %s, status = 'running', heartbeat_at = UTC_TIMESTAMP(), finished_at = NULL
+        WHERE job_id = %s AND run_at = %s
+        AND (status = 'failed'
+             OR (status = 'running' AND heartbeat_at < UTC_TIMESTAMP() - INTERVAL %s SECOND))
+    """
+    HEARTBEAT_JOB_SQL = """
+        UPDATE job_runs SET heartbeat_at = UTC_TIMESTAMP()
+        WHERE job_id = %s AND run_at = %s AND owner = %s
+    """
+    FINISH_JOB_SQL = """
+        UPDATE job_runs SET status = %s, finished_at = UTC_TIMESTAMP()
+        WHERE job_id = %s AND run_at = %s AND owner = %s
+    """
+    MARK_JOB_MISSED_SQL = """
+        INSERT IGNORE INTO job_runs (job_id, run_at, owner, status, heartbeat_at)
+        VALUES (%s, %s, '', 'missed', UTC_TIMESTAMP())
+    """
+    SAVE_CALENDAR_TOKEN_SQL = """
+        INSERT INTO calendar_feeds (token, user_id, version, updated_at) VALUES (%s, %s, 0, %s)
+        ON DUPLICATE KEY UPDATE
+        token = VALUES(token), version = version + 1, updated_at = VALUES(updated_at)
+    """
+    SAVE_SHIFT_ALERT_SQL = """
+        INSERT INTO shift_alerts (user_id, lead_minutes) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE lead_minutes = VALUES(lead_minutes)
+    """
+    BUMP_WEEK_VERSION_SQL = """
+        INSERT INTO week_versions (week_start_date, version) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """
+
+    def _create_pool(self):
+        return ConnectionPool()
+
+    def check_query_plans(self) -> List[str]:
+        """Проверяет планы частых запросов через EXPLAIN"""
+        return explain_problems(self.pool, HOT_QUERIES)
+
+
+def create_database(migrate: bool = True, connect: bool = True) -> Database:
+    """Создает хранилище СУБД, выбранной в Config.DB_BACKEND (mysql или sqlite)"""
+    if Config.DB_BACKEND == 'mysql':
+        return MySQLDatabase(migrate, connect)
+    if Config.DB_BACKEND == 'sqlite':
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(migrate, connect)
+    raise ValueError(f"Неизвестный DB_BACKEND: {Config.DB_BACKEND!r} (ожидается mysql или sqlite)")
+
+
+class AsyncDatabase:
+    """Асинхронный доступ к БД для обработчиков бота.
+
+    Запросы выполняются в пуле потоков размером с пул соединений, поэтому
+    обработчики не блокируют event loop и не конкурируют за одно соединение.
+    Создание объекта не обращается к БД: подключение и миграции выполняет
+    start(), а запросы до его завершения ждут готовности (ready).
+    """
+
+    def __init__(self, database: Optional[Database] = None):
+        self.sync = database or create_database(connect=False)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.sync.pool.size,
+            thread_name_prefix="db"
+        )
+        self.ready = asyncio.Event()
+        if database is not None:
+            self.ready.set()
+        self._week_loads = SingleFlight('week_schedule')
+
+    async def start(self, migrate: bool = True):
+        """Подключается к БД и применяет миграции в пуле потоков, затем открывает доступ к запросам"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.sync.connect, migrate)
+        self.ready.set()
+
+    async def _run(self, func, *args):
+        if not self.ready.is_set():
+            await self.ready.wait()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def register_user(self, user_id: int, first_name: str, last_name: str) -> bool:
+        """Регистрирует нового пользователя"""
+        return await self._run(self.sync.register_user, user_id, first_name, last_name)
+
+    async def is_user_registered(self, user_id: int) -> bool:
+        """Проверяет, зарегистрирован ли пользователь"""
+        return await self.get_user_name(user_id) is not None
+
+    async def get_user_name(self, user_id: int) -> Optional[str]:
+        """Получает ФИО пользователя (из кэша без обращения к пулу потоков)"""
+        name = self.sync.users.get(user_id)
+        if name is not None:
+            return name
+        return await self._run(self.sync.load_user_name, user_id)
+
+    async def save_schedule(self, user_id: int, week_start_date: str, schedule_data: Dict) -> bool:
+        """Сохраняет расписание пользователя"""
+        return await self._run(self.sync.save_schedule, user_id, week_start_date, schedule_data)
+
+    async def save_schedules_bulk(self, week_start_date: str, entries: List[Tuple[int, Dict[str, Optional[Shift]]]]) -> bool:
+        """Сохраняет расписания многих пользователей на неделю в одной транзакции"""
+        return await self._run(self.sync.save_schedules_bulk, week_start_date, entries)
+
+    async def get_week_schedule(self, week_start_date: str) -> Roster:
+        """Получает расписание всех на неделю (из кэша без обращения к пулу потоков).
+
+        Одновременные промахи кэша по одной неделе выполняют один запрос к БД.
+        """
+        roster = self.sync.rosters.get(week_start_date)
+        if roster is not None:
+            return roster
+        return await self._week_loads.run(
+            str(week_start_date), lambda: self._run(self.sync.load_week_schedule, week_start_date)
+        )
+
+    async def get_hours_by_month(self, first_month, last_month) -> Optional[List[Dict]]:
+        """Часы сотрудников по месяцам из агрегата (None при ошибке БД)"""
+        return await self._run(self.sync.get_hours_by_month, first_month, last_month)
+
+    async def get_user_schedules(self, user_id: int, first_week: date) -> Optional[List[Dict]]:
+        """Расписания сотрудника по неделям начиная с first_week (None при ошибке БД)"""
+        return await self._run(self.sync.get_user_schedules, user_id, first_week)
+
+    async def get_calendar_feed(self, token: str) -> Optional[CalendarFeed]:
+        """Подписка на календарь по токену (из кэша без обращения к пулу потоков)"""
+        feed = self.sync.calendar_feeds.get(token)
+        if feed is not None:
+            return feed
+        return await self._run(self.sync.load_calendar_feed, token)
+
+    async def get_calendar_token(self, user_id: int, renew: bool = False) -> Optional[str]:
+        """Токен ссылки на календарь сотрудника"""
+        return await self._run(self.sync.get_calendar_token, user_id, renew)
+
+    async def refresh_calendar_feeds(self, since: datetime) -> Optional[datetime]:
+        """Кладет в кэш подписки, измененные начиная с since"""
+        return await self._run(self.sync.refresh_calendar_feeds, since)
+
+    async def get_shift_alerts(self, first_week: date, last_week: date) -> Optional[List[Dict]]:
+        """Подписки на напоминания о сменах с расписаниями на диапазон недель"""
+        return await self._run(self.sync.get_shift_alerts, first_week, last_week)
+
+    async def get_shift_alert(self, user_id: int) -> Optional[int]:
+        """За сколько минут до смены предупреждать сотрудника"""
+        return await self._run(self.sync.get_shift_alert, user_id)
+
+    async def set_shift_alert(self, user_id: int, lead_minutes: Optional[int]) -> bool:
+        """Включает или выключает напоминания о сменах"""
+        return await self._run(self.sync.set_shift_alert, user_id, lead_minutes)
+
+    async def get_all_users(self) -> List[Dict]:
+        """Получает список всех пользователей"""
+        return await self._run(self.sync.get_all_users)
+
+    async def iter_users(self, batch_size: int = Config.USER_PAGE_SIZE) -> AsyncIterator[Dict]:
+        """Асинхронно обходит всех пользователей страницами по user_id.
+
+        В памяти держится одна страница; следующая запрашивается, когда
+        предыдущая выдана. При ошибке БД выбрасывает RuntimeError.
+        """
+        after = 0
+        while True:
+            page = await self._run(self.sync.get_users_page, after, batch_size)
+            if page is None:
+                raise RuntimeError(f"Не удалось прочитать пользователей после user_id={after}")
+            for user in page:
+                yield user
+            if len(page) < batch_size:
+                return
+            after = page[-1]['user_id']
+
+    async def iter_undelivered_users(self, broadcast_id: str, batch_size: int = Config.USER_PAGE_SIZE) -> AsyncIterator[int]:
+        """Асинхронно обходит user_id пользователей, которым рассылка еще не доставлена.
+
+        Как iter_users, но уже доставленные отсеиваются в запросе страницы.
+        При ошибке БД выбрасывает RuntimeError.
+        """
+        after = 0
+        while True:
+            page = await self._run(self.sync.get_undelivered_users_page, broadcast_id, after, batch_size)
+            if page is None:
+                raise RuntimeError(f"Не удалось прочитать получателей рассылки после user_id={after}")
+            for user_id in page:
+                yield user_id
+            if len(page) < batch_size:
+                return
+            after = page[-1]
+
+    async def get_delivered_users(self, broadcast_id: str, user_ids: List[int]) -> Set[int]:
+        """Получает пользователей из user_ids, которым рассылка уже доставлена"""
+        return await self._run(self.sync.get_delivered_users, broadcast_id, user_ids)
+
+    async def mark_delivered(self, broadcast_id: str, user_ids: List[int]) -> bool:
+        """Отмечает доставку рассылки пачкой пользователей"""
+        return await self._run(self.sync.mark_delivered, broadcast_id, user_ids)
+
+    async def purge_deliveries(self, keep_days: int) -> bool:
+        """Удаляет отметки о доставке старше keep_days дней"""
+        return await self._run(self.sync.purge_deliveries, keep_days)
+
+    async def purge_job_runs(self, keep_days: int) -> bool:
+        """Удаляет записи о запусках задач старше keep_days дней"""
+        return await self._run(self.sync.purge_job_runs, keep_days)
+
+    async def get_fsm_record(self, storage_key: str) -> Optional[Tuple[Optional[str], str]]:
+        """Получает состояние FSM и данные (JSON) по ключу"""
+        return await self._run(self.sync.get_fsm_record, storage_key)
+
+    async def save_fsm_records(self, records: List[Tuple[str, Optional[str], str]]) -> bool:
+        """Сохраняет пачку состояний FSM; пустые записи удаляются"""
+        return await self._run(self.sync.save_fsm_records, records)
+
+    async def claim_job_run(self, job_id: str, run_at: datetime, owner: str, lease: int) -> bool:
+        """Занимает плановый запуск задачи"""
+        return await self._run(self.sync.claim_job_run, job_id, run_at, owner, lease)
+
+    async def heartbeat_job_run(self, job_id: str, run_at: datetime, owner: str) -> bool:
+        """Продлевает владение запуском задачи"""
+        return await self._run(self.sync.heartbeat_job_run, job_id, run_at, owner)
+
+    async def finish_job_run(self, job_id: str, run_at: datetime, owner: str, status: str) -> bool:
+        """Фиксирует результат запуска задачи (done/failed)"""
+        return await self._run(self.sync.finish_job_run, job_id, run_at, owner, status)
+
+    async def mark_job_missed(self, job_id: str, run_at: datetime) -> bool:
+        """Отмечает пропущенный запуск задачи"""
+        return await self._run(self.sync.mark_job_missed, job_id, run_at)
+
+    async def warm_user_cache(self) -> int:
+        """Заполняет кэш пользователей из БД"""
+        return await self._run(self.sync.warm_user_cache)
+
+    async def close(self):
+        """Дожидается начатых запросов и закрывает пул потоков и соединения с БД.
+
+        Ожидание идет в потоке по умолчанию: event loop в это время продолжает
+        завершать остальные задачи.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown, True)
+        await loop.run_in_executor(None, self.sync.close)
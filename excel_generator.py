@@ -1,8 +1,16 @@
+import io
+from copy import copy
 import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, NamedStyle
 from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Iterable, Optional
+from analytics import HOURS_COLUMNS, format_period
+from config import Config
+from metrics import measure_export
+from utils import WEEK_DAYS, Shift, format_shift
 
 # Стили для Excel
 HEADER_FONT = Font(bold=True, color="FFFFFF")
@@ -11,16 +19,63 @@ CELL_ALIGNMENT = Alignment(horizontal='center', vertical='center')
 WORKING_FILL = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
 DAY_OFF_FILL = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
 
-def generate_week_schedule_excel(schedule_data: List[Dict], week_start_date: datetime.date) -> str:
-    """Генерирует Excel файл с расписанием на неделю"""
+DAYS_RU = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
+DAYS_EN = WEEK_DAYS
+DAY_HOURS = range(8, 23)
+
+# Именованные стили для потоковой выгрузки: (имя, шрифт, заливка)
+NAMED_STYLES = [
+    ('schedule_header', HEADER_FONT, HEADER_FILL),
+    ('schedule_working', None, WORKING_FILL),
+    ('schedule_day_off', None, DAY_OFF_FILL),
+    ('schedule_center', None, None),
+]
+
+def _workbook_bytes(wb: openpyxl.Workbook) -> bytes:
+    """Сохраняет книгу в память и возвращает содержимое файла"""
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+def _coverage_rows(coverage) -> List[List]:
+    """Строки листа покрытия: время слота и число сотрудников по дням"""
+    table = coverage.table(DAY_HOURS.start * 60, DAY_HOURS.stop * 60)
+    return [[time] + [int(count) for count in counts] for time, counts in zip(table.index, table.values)]
+
+def _add_coverage_sheet(wb: openpyxl.Workbook, coverage):
+    """Добавляет лист с числом сотрудников на смене по времени и дням"""
+    ws = wb.create_sheet("Покрытие")
+    headers = ['Время'] + DAYS_RU
+    
+    for col_num, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col_num, value=header)
+        cell.font = HEADER_FONT
+        cell.fill = HEADER_FILL
+        cell.alignment = CELL_ALIGNMENT
+    
+    for row_num, row in enumerate(_coverage_rows(coverage), 2):
+        ws.cell(row=row_num, column=1, value=row[0]).alignment = CELL_ALIGNMENT
+        for col_num, count in enumerate(row[1:], 2):
+            cell = ws.cell(row=row_num, column=col_num, value=count)
+            cell.alignment = CELL_ALIGNMENT
+            cell.fill = DAY_OFF_FILL if count < Config.MIN_STAFF else WORKING_FILL
+    
+    ws.column_dimensions['A'].width = 10
+    for col_num in range(2, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = 15
+
+@measure_export('week')
+def generate_week_schedule_excel(schedule_data: List[Dict], week_start_date: datetime.date, coverage=None) -> bytes:
+    """Генерирует Excel файл с расписанием на неделю и возвращает его содержимое.
+
+    Если передан coverage (coverage.Coverage), добавляется лист покрытия смен.
+    """
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = "Расписание"
     
     # Заголовки
-    days_ru = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
-    days_en = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-    headers = ['Фамилия Имя'] + days_ru
+    headers = ['Фамилия Имя'] + DAYS_RU
     
     # Записываем заголовки
     for col_num, header in enumerate(headers, 1):
@@ -34,12 +89,12 @@ def generate_week_schedule_excel(schedule_data: List[Dict], week_start_date: dat
         name = f"{entry['last_name']} {entry['first_name']}"
         ws.cell(row=row_num, column=1, value=name)
         
-        for col_num, day in enumerate(days_en, 2):
-            value = entry.get(day, 'выходной')
-            cell = ws.cell(row=row_num, column=col_num, value=value)
+        for col_num, day in enumerate(DAYS_EN, 2):
+            shift = entry.get(day)
+            cell = ws.cell(row=row_num, column=col_num, value=format_shift(shift))
             cell.alignment = CELL_ALIGNMENT
             
-            if value.lower() == 'выходной':
+            if shift is None:
                 cell.fill = DAY_OFF_FILL
             else:
                 cell.fill = WORKING_FILL
@@ -49,19 +104,24 @@ def generate_week_schedule_excel(schedule_data: List[Dict], week_start_date: dat
         column = get_column_letter(col[0].column)
         ws.column_dimensions[column].width = 15 if column != 'A' else 20
     
-    # Сохраняем файл
-    filename = f"schedule_{week_start_date.strftime('%Y-%m-%d')}.xlsx"
-    wb.save(filename)
-    return filename
+    if coverage is not None:
+        _add_coverage_sheet(wb, coverage)
+    
+    return _workbook_bytes(wb)
 
-def generate_day_schedule_excel(schedule_entries: List[Dict], day_name: str) -> str:
-    """Генерирует Excel файл с расписанием на конкретный день"""
+def _working_hours(shift: Shift) -> List[bool]:
+    """Для каждого часа выгрузки дня: пересекается ли он со сменой"""
+    return [shift.overlaps(hour * 60, hour * 60 + 60) for hour in DAY_HOURS]
+
+@measure_export('day')
+def generate_day_schedule_excel(schedule_entries: List[Dict], day_name: str) -> bytes:
+    """Генерирует Excel файл с расписанием на конкретный день и возвращает его содержимое"""
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = f"Расписание на {day_name}"
     
     # Заголовки
-    hours = [f"{hour:02d}:00" for hour in range(8, 23)]
+    hours = [f"{hour:02d}:00" for hour in DAY_HOURS]
     headers = ['Фамилия Имя'] + hours
     
     # Записываем заголовки
@@ -76,41 +136,159 @@ def generate_day_schedule_excel(schedule_entries: List[Dict], day_name: str) ->
         name = f"{entry['last_name']} {entry['first_name']}"
         ws.cell(row=row_num, column=1, value=name)
         
-        time_range = entry.get(day_name, 'выходной')
+        shift = entry.get(day_name)
         
-        if time_range.lower() == 'выходной':
+        if shift is None:
             ws.merge_cells(start_row=row_num, start_column=2, end_row=row_num, end_column=len(headers))
             cell = ws.cell(row=row_num, column=2, value="Выходной")
             cell.alignment = CELL_ALIGNMENT
             cell.fill = DAY_OFF_FILL
             continue
-            
-        try:
-            start_time, end_time = time_range.split('-')
-            start_hour = int(start_time.split(':')[0]) if ':' in start_time else int(start_time)
-            end_hour = int(end_time.split(':')[0]) if ':' in end_time else int(end_time)
-            
-            for col_num, hour in enumerate(range(8, 23), 2):
-                cell = ws.cell(row=row_num, column=col_num)
-                cell.alignment = CELL_ALIGNMENT
-                
-                if start_hour <= hour < end_hour:
-                    cell.value = "✓"
-                    cell.fill = WORKING_FILL
-                else:
-                    cell.value = "✗"
-                    cell.fill = DAY_OFF_FILL
-        except ValueError:
-            ws.merge_cells(start_row=row_num, start_column=2, end_row=row_num, end_column=len(headers))
-            cell = ws.cell(row=row_num, column=2, value="Некорректный формат")
+        
+        for col_num, working in enumerate(_working_hours(shift), 2):
+            cell = ws.cell(row=row_num, column=col_num)
             cell.alignment = CELL_ALIGNMENT
+            
+            if working:
+                cell.value = "✓"
+                cell.fill = WORKING_FILL
+            else:
+                cell.value = "✗"
+                cell.fill = DAY_OFF_FILL
     
     # Настраиваем ширину столбцов
     for col in ws.columns:
         column = get_column_letter(col[0].column)
         ws.column_dimensions[column].width = 5 if column != 'A' else 20
     
-    # Сохраняем файл
-    filename = f"schedule_{day_name}.xlsx"
-    wb.save(filename)
-    return filename
+    return _workbook_bytes(wb)
+
+
+# ================== ПОТОКОВАЯ ВЫГРУЗКА ==================
+
+def _write_only_workbook(title: str, widths: Dict[str, float]):
+    """Создает книгу в режиме write-only с именованными стилями и шириной столбцов.
+
+    Возвращает книгу, лист и наборы стилей по имени: ячейкам копируется
+    готовый набор индексов стиля вместо поиска стиля по имени для каждой ячейки.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    styles = {}
+    for name, font, fill in NAMED_STYLES:
+        style = NamedStyle(name=name, alignment=CELL_ALIGNMENT)
+        if font is not None:
+            style.font = font
+        if fill is not None:
+            style.fill = fill
+        wb.add_named_style(style)
+        template = WriteOnlyCell(ws)
+        template.style = name
+        styles[name] = template._style
+    
+    for column, width in widths.items():
+        ws.column_dimensions[column].width = width
+    return wb, ws, styles
+
+def _cell(ws, value, style) -> WriteOnlyCell:
+    cell = WriteOnlyCell(ws, value=value)
+    cell._style = copy(style)
+    return cell
+
+@measure_export('week_stream')
+def stream_week_schedule_excel(rows: Iterable[Dict], week_start_date: datetime.date, coverage=None) -> bytes:
+    """Генерирует Excel файл с расписанием на неделю в потоковом режиме.
+
+    Книга в режиме write-only: строки сразу сериализуются и не хранятся
+    в ней как объекты ячеек, поэтому память не растет с размером. Если передан
+    coverage, добавляется лист покрытия смен.
+    """
+    headers = ['Фамилия Имя'] + DAYS_RU
+    widths = {get_column_letter(col): 15 for col in range(2, len(headers) + 1)}
+    widths['A'] = 20
+    wb, ws, styles = _write_only_workbook("Расписание", widths)
+    
+    ws.append([_cell(ws, header, styles['schedule_header']) for header in headers])
+    for entry in rows:
+        row = [f"{entry['last_name']} {entry['first_name']}"]
+        for day in DAYS_EN:
+            shift = entry.get(day)
+            style = styles['schedule_day_off' if shift is None else 'schedule_working']
+            row.append(_cell(ws, format_shift(shift), style))
+        ws.append(row)
+    
+    if coverage is not None:
+        coverage_ws = wb.create_sheet("Покрытие")
+        coverage_ws.column_dimensions['A'].width = 10
+        for col_num in range(2, len(DAYS_RU) + 2):
+            coverage_ws.column_dimensions[get_column_letter(col_num)].width = 15
+        coverage_ws.append([_cell(coverage_ws, header, styles['schedule_header']) for header in ['Время'] + DAYS_RU])
+        for row in _coverage_rows(coverage):
+            coverage_ws.append([_cell(coverage_ws, row[0], styles['schedule_center'])] + [
+                _cell(coverage_ws, count, styles['schedule_day_off' if count < Config.MIN_STAFF else 'schedule_working'])
+                for count in row[1:]
+            ])
+    
+    return _workbook_bytes(wb)
+
+@measure_export('day_stream')
+def stream_day_schedule_excel(rows: Iterable[Dict], day_name: str) -> bytes:
+    """Генерирует Excel файл с расписанием на день в потоковом режиме"""
+    headers = ['Фамилия Имя'] + [f"{hour:02d}:00" for hour in DAY_HOURS]
+    widths = {get_column_letter(col): 5 for col in range(2, len(headers) + 1)}
+    widths['A'] = 20
+    wb, ws, styles = _write_only_workbook(f"Расписание на {day_name}", widths)
+    last_column = get_column_letter(len(headers))
+    
+    ws.append([_cell(ws, header, styles['schedule_header']) for header in headers])
+    for row_num, entry in enumerate(rows, 2):
+        name = f"{entry['last_name']} {entry['first_name']}"
+        shift = entry.get(day_name)
+        
+        if shift is None:
+            ws.merged_cells.add(CellRange(f"B{row_num}:{last_column}{row_num}"))
+            ws.append([name, _cell(ws, "Выходной", styles['schedule_day_off'])])
+            continue
+        
+        ws.append([name] + [
+            _cell(ws, "✓", styles['schedule_working']) if working
+            else _cell(ws, "✗", styles['schedule_day_off'])
+            for working in _working_hours(shift)
+        ])
+    
+    return _workbook_bytes(wb)
+
+# ================== ТАБЕЛЬ ==================
+
+def _hours_headers(period: Optional[str]) -> List[str]:
+    return ['Фамилия Имя'] + (['Период'] if period else []) + ['Смен', 'Часов'] + DAYS_RU
+
+def _append_hours_rows(ws, styles, entries: Iterable[Dict], period: Optional[str]):
+    """Строки табеля: сотрудник (и период), смены, часы всего и по дням недели"""
+    center = styles['schedule_center']
+    ws.append([_cell(ws, header, styles['schedule_header']) for header in _hours_headers(period)])
+    for entry in entries:
+        row = [f"{entry['last_name']} {entry['first_name']}"]
+        if period:
+            row.append(_cell(ws, format_period(entry['period'], period), center))
+        row.append(_cell(ws, entry['shifts'], center))
+        row.append(_cell(ws, round(entry['minutes'] / 60, 2), center))
+        row.extend(_cell(ws, round(entry[column] / 60, 2), center) for column in HOURS_COLUMNS)
+        ws.append(row)
+
+@measure_export('timesheet')
+def generate_timesheet_excel(summary: Iterable[Dict], totals: Iterable[Dict], period: str) -> bytes:
+    """Генерирует табель: часы сотрудников по периодам и лист итогов за весь диапазон.
+
+    summary и totals - результат analytics.summarize_hours с периодом period и без него.
+    """
+    widths = {get_column_letter(col): 12 for col in range(2, len(_hours_headers(period)) + 1)}
+    widths['A'] = 25
+    wb, ws, styles = _write_only_workbook("Табель", widths)
+    _append_hours_rows(ws, styles, summary, period)
+    
+    totals_ws = wb.create_sheet("Итого")
+    for column, width in widths.items():
+        totals_ws.column_dimensions[column].width = width
+    _append_hours_rows(totals_ws, styles, totals, None)
+    return _workbook_bytes(wb)
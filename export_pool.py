@@ -0,0 +1,164 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from config import Config
+from metrics import EXPORT_REJECTED, EXPORT_RENDER_SECONDS
+from utils import WEEK_DAYS, Shift
+
+logger = logging.getLogger(__name__)
+
+# Строка расписания для передачи в пул: (фамилия, имя, начало и конец смены по дням).
+# Выходной - (-1, -1). Кортежи из строк и чисел сериализуются (pickle) в разы
+# компактнее и быстрее словарей с Shift, а снимки Roster (mappingproxy) не сериализуются вовсе.
+PackedRow = Tuple
+DAY_OFF_PACKED = (-1, -1)
+
+
+class ExportRejected(Exception):
+    """Выгрузка не выполнена: очередь пула переполнена, истек таймаут или пул упал"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def pack_roster(roster: Iterable[Dict]) -> List[PackedRow]:
+    """Компактное представление расписания недели для передачи в пул"""
+    return [
+        (entry['last_name'], entry['first_name'],
+         *[value for day in WEEK_DAYS for value in (entry.get(day) or DAY_OFF_PACKED)])
+        for entry in roster
+    ]
+
+
+def unpack_roster(packed: Iterable[PackedRow]) -> List[Dict]:
+    """Обратное pack_roster: строки в формате, который принимают генераторы Excel"""
+    rows = []
+    for last_name, first_name, *values in packed:
+        entry = {'last_name': last_name, 'first_name': first_name}
+        for index, day in enumerate(WEEK_DAYS):
+            start, end = values[2 * index], values[2 * index + 1]
+            entry[day] = None if start < 0 else Shift(start, end)
+        rows.append(entry)
+    return rows
+
+
+# Функции, выполняемые в пуле. Они на уровне модуля, чтобы их можно было
+# передать в процесс, и сами импортируют тяжелые модули.
+
+def render_week(packed: List[PackedRow], week_start) -> bytes:
+    """Выгрузка недели с листом покрытия; большие расписания пишутся в режиме write-only"""
+    from coverage import Coverage
+    from excel_generator import generate_week_schedule_excel, stream_week_schedule_excel
+    rows = unpack_roster(packed)
+    if len(rows) < Config.EXPORT_STREAMING_ROWS:
+        return generate_week_schedule_excel(rows, week_start, Coverage(rows))
+    return stream_week_schedule_excel(rows, week_start, Coverage(rows))
+
+
+def render_day(packed: List[PackedRow], day: str) -> bytes:
+    """Выгрузка дня; большие расписания пишутся в режиме write-only"""
+    from excel_generator import generate_day_schedule_excel, stream_day_schedule_excel
+    rows = unpack_roster(packed)
+    if len(rows) < Config.EXPORT_STREAMING_ROWS:
+        return generate_day_schedule_excel(rows, day)
+    return stream_day_schedule_excel(rows, day)
+
+
+def render_timesheet(rows: List[Dict], period: str) -> bytes:
+    from analytics import summarize_hours
+    from excel_generator import generate_timesheet_excel
+    return generate_timesheet_excel(summarize_hours(rows, period), summarize_hours(rows, None), period)
+
+
+def _preload():
+    """Инициализатор процесса пула: импорт openpyxl и pandas до первой выгрузки"""
+    import coverage, excel_generator  # noqa: F401
+
+
+class ExportPool:
+    """Пул для формирования файлов выгрузок вне event loop.
+
+    kind='thread' - потоки (без лишней памяти, но openpyxl делит GIL с ботом),
+    kind='process' - отдельные процессы (бот не замедляется совсем). Одновременно
+    принимается не больше workers + max_queue выгрузок, остальные сразу
+    отклоняются (ExportRejected('queue_full')); выгрузка дольше timeout
+    секунд отклоняется с ExportRejected('timeout').
+    """
+
+    def __init__(self, kind: str = Config.EXPORT_POOL, workers: int = Config.EXPORT_WORKERS,
+                 max_queue: int = Config.EXPORT_QUEUE_SIZE, timeout: float = Config.EXPORT_TIMEOUT):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Неизвестный EXPORT_POOL: {kind!r} (ожидается thread или process)")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pending = 0  # принятые и еще не завершенные выгрузки (в очереди и в работе)
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        # Создается при первой выгрузке, чтобы не замедлять старт бота
+        if self._executor is None:
+            if self.kind == 'process':
+                # spawn: fork процесса с потоками БД и event loop небезопасен
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_preload
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export")
+        return self._executor
+
+    async def render(self, export: str, func: Callable[..., bytes], *args) -> bytes:
+        """Выполняет func(*args) в пуле и возвращает содержимое файла"""
+        if self.pending >= self.workers + self.max_queue:
+            EXPORT_REJECTED.inc(export=export, reason='queue_full')
+            raise ExportRejected('queue_full')
+
+        self.pending += 1
+        started = time.perf_counter()
+        future = None
+        try:
+            future = self._get_executor().submit(func, *args)
+            # Слот освобождается, когда выгрузка действительно завершится: начатая
+            # выгрузка после таймаута продолжает занимать воркер
+            future.add_done_callback(functools.partial(self._release, asyncio.get_running_loop()))
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # Еще не начатая выгрузка снимается с очереди; начатую остановить нельзя
+            future.cancel()
+            EXPORT_REJECTED.inc(export=export, reason='timeout')
+            logger.error(f"Выгрузка {export} не уложилась в {self.timeout} с")
+            raise ExportRejected('timeout')
+        except BrokenExecutor as e:
+            # Процесс пула упал (например, по памяти): следующая выгрузка создаст пул заново
+            self.close()
+            EXPORT_REJECTED.inc(export=export, reason='broken')
+            logger.error(f"Пул выгрузок остановлен, выгрузка {export} не выполнена: {e}")
+            raise ExportRejected('broken')
+        finally:
+            if future is None:
+                self.pending -= 1
+            EXPORT_RENDER_SECONDS.observe(time.perf_counter() - started, export=export)
+
+    def _release(self, loop: asyncio.AbstractEventLoop, future):
+        # Вызывается в потоке пула (или в event loop, если future уже завершен)
+        try:
+            loop.call_soon_threadsafe(self._decrement_pending)
+        except RuntimeError:
+            pass  # event loop уже закрыт
+
+    def _decrement_pending(self):
+        self.pending -= 1
+
+    def close(self):
+        """Останавливает пул, не дожидаясь выгрузок в очереди"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+from aiogram import Bot
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+RETRY_MAX_DELAY = 5.0  # Наибольшая пауза между повторами записи после ошибок БД
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states.
+
+    Изменения копятся в памяти и записываются в БД пачками раз в
+    flush_interval секунд; неудачная запись повторяется, пока не пройдет.
+    Состояние переживает перезапуск и видно всем репликам бота.
+
+    Записи, измененные на этой реплике, еще cache_ttl секунд читаются из
+    памяти. Прочитанные из БД записи не кэшируются: их могла изменить другая
+    реплика. Если обновления одного пользователя приходят на разные реплики
+    чаще, чем раз в cache_ttl секунд, нужна привязка пользователя к реплике
+    или FSM_CACHE_TTL=0.
+    """
+
+    def __init__(
+        self,
+        db,
+        flush_interval: float = Config.FSM_FLUSH_INTERVAL,
+        cache_ttl: float = Config.FSM_CACHE_TTL
+    ):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[str, Tuple[Optional[str], Dict[str, Any], float]] = {}
+        self._dirty: Dict[str, Tuple[Optional[str], Dict[str, Any]]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.destiny}"
+
+    async def _load(self, key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        if key in self._dirty:
+            return self._dirty[key]
+        cached = self._cache.get(key)
+        if cached is not None and cached[2] > time.monotonic():
+            return cached[0], cached[1]
+
+        record = await self.db.get_fsm_record(key)
+        return (record[0], json.loads(record[1])) if record else (None, {})
+
+    def _store(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        self._dirty[key] = (state, data)
+        self._cache[key] = (state, data, time.monotonic() + self.cache_ttl)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        """Записывает изменения через flush_interval секунд и повторяет, пока они есть.
+
+        Изменения могли прийти во время записи или вернуться после ошибки БД:
+        тогда пауза перед повтором растет до RETRY_MAX_DELAY. Запись
+        защищена от отмены (close), чтобы не потерять взятую в нее пачку.
+        """
+        delay = self.flush_interval
+        while True:
+            await asyncio.sleep(delay)
+            saved = await asyncio.shield(self.flush())
+            if not self._dirty:
+                return
+            delay = self.flush_interval if saved else min(delay * 2, RETRY_MAX_DELAY)
+
+    async def flush(self) -> bool:
+        """Записывает накопленные изменения в БД одним пакетом; False при ошибке БД"""
+        async with self._flush_lock:
+            now = time.monotonic()
+            for key in [key for key, value in self._cache.items() if value[2] <= now]:
+                del self._cache[key]
+            if not self._dirty:
+                return True
+            pending, self._dirty = self._dirty, {}
+            records = [
+                (key, state, json.dumps(data, ensure_ascii=False))
+                for key, (state, data) in pending.items()
+            ]
+            if not await self.db.save_fsm_records(records):
+                # Не теряем изменения: вернем их, если за это время не появились новые
+                for key, value in pending.items():
+                    self._dirty.setdefault(key, value)
+                return False
+            return True
+
+    async def set_state(self, bot: Bot, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._key(key)
+        _, data = await self._load(storage_key)
+        self._store(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, bot: Bot, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        state, _ = await self._load(storage_key)
+        self._store(storage_key, state, data.copy())
+
+    async def get_data(self, bot: Bot, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return data.copy()
+
+    async def close(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            # Повторы прекращаются: ниже последняя попытка записи
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
+        if self._dirty:
+            logger.error(f"Не удалось сохранить состояние FSM для {len(self._dirty)} пользователей")
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[datetime], Awaitable[None]]
+
+
+def last_fire_time(trigger: CronTrigger, now: datetime, lookback: timedelta = timedelta(days=8)) -> Optional[datetime]:
+    """Последнее плановое время срабатывания trigger не позже now"""
+    last = None
+    fire_time = trigger.get_next_fire_time(None, now - lookback)
+    while fire_time is not None and fire_time <= now:
+        last = fire_time
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time + timedelta(microseconds=1))
+    return last
+
+
+def _run_key(run_at: datetime) -> datetime:
+    """Время запуска для БД: UTC без часового пояса"""
+    return run_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class JobRunner:
+    """Периодические задачи для нескольких реплик бота.
+
+    Каждый плановый запуск выполняет только одна реплика: та, что первой
+    заняла запись (job_id, run_at) в таблице job_runs. Пока задача идет,
+    владелец обновляет heartbeat; зависший запуск можно перехватить после
+    Config.JOB_LEASE секунд. При старте пропущенные запуски в пределах
+    Config.JOB_MISFIRE_GRACE догоняются, более старые помечаются как missed.
+    """
+
+    def __init__(self, scheduler: AsyncIOScheduler, db, owner: Optional[str] = None):
+        self.scheduler = scheduler
+        self.db = db
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._jobs: Dict[str, Tuple[JobFunc, CronTrigger]] = {}
+
+    def add_job(self, job_id: str, func: JobFunc, trigger: CronTrigger):
+        """Регистрирует задачу; func получает плановое время запуска"""
+        self._jobs[job_id] = (func, trigger)
+        self.scheduler.add_job(
+            self._fire, trigger, args=[job_id], id=job_id,
+            misfire_grace_time=Config.JOB_MISFIRE_GRACE, coalesce=True, max_instances=1
+        )
+
+    async def _fire(self, job_id: str):
+        _, trigger = self._jobs[job_id]
+        run_at = last_fire_time(trigger, datetime.now(trigger.timezone))
+        if run_at is not None:
+            await self.run(job_id, run_at)
+
+    async def _heartbeat(self, job_id: str, run_key: datetime):
+        while True:
+            await asyncio.sleep(Config.JOB_LEASE / 3)
+            await self.db.heartbeat_job_run(job_id, run_key, self.owner)
+
+    async def run(self, job_id: str, run_at: datetime) -> bool:
+        """Выполняет запуск, если удалось стать его владельцем"""
+        func, _ = self._jobs[job_id]
+        return await self.run_once(job_id, run_at, func)
+
+    async def run_once(self, job_id: str, run_at: datetime, func: JobFunc) -> bool:
+        """Выполняет func(run_at) на одной реплике, без регистрации задачи в планировщике.
+
+        Для запусков, время которых задает не cron, а сам вызывающий код
+        (например, напоминания о сменах).
+        """
+        run_key = _run_key(run_at)
+        if not await self.db.claim_job_run(job_id, run_key, self.owner, Config.JOB_LEASE):
+            logger.info(f"Задача {job_id} ({run_at}) выполняется другой репликой или уже выполнена")
+            return False
+
+        logger.info(f"Задача {job_id} ({run_at}) запущена на {self.owner}")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, run_key))
+        status = 'failed'
+        try:
+            await func(run_at)
+            status = 'done'
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении задачи {job_id} ({run_at}): {e}")
+        finally:
+            heartbeat.cancel()
+            await self.db.finish_job_run(job_id, run_key, self.owner, status)
+        return status == 'done'
+
+    async def catch_up(self):
+        """Догоняет запуски, пропущенные пока ни одна реплика не работала"""
+        for job_id, (_, trigger) in self._jobs.items():
+            now = datetime.now(trigger.timezone)
+            run_at = last_fire_time(trigger, now)
+            if run_at is None:
+                continue
+            if now - run_at <= timedelta(seconds=Config.JOB_MISFIRE_GRACE):
+                await self.run(job_id, run_at)
+            elif await self.db.mark_job_missed(job_id, _run_key(run_at)):
+                logger.warning(f"Запуск {job_id} ({run_at}) пропущен и слишком стар для повтора")
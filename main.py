@@ -1,27 +1,81 @@
+import time
+STARTED_AT = time.monotonic()  # До остальных импортов, чтобы учесть их в фазах старта
+
 import asyncio
+import html
+import importlib
 import logging
+import os
+import signal
 from aiogram import Bot, Dispatcher, F, types
-from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove, FSInputFile
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
 from datetime import datetime, timedelta
+from typing import Callable, Awaitable, Optional, TYPE_CHECKING
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from analytics import parse_timesheet_args, format_period
 from config import Config
-from database import Database
+from database import AsyncDatabase, Roster
 from keyboards import get_main_keyboard, get_week_choice_keyboard, get_day_choice_keyboard
-from utils import parse_schedule_text, validate_schedule, get_week_start_date, get_next_week_start_date, get_day_of_week, format_schedule_for_tomorrow
-from excel_generator import generate_week_schedule_excel, generate_day_schedule_excel
-import os
+from utils import (
+    parse_schedule, get_week_start_date, get_next_week_start_date,
+    get_day_of_week, format_schedule_for_tomorrow, parse_day, parse_time, format_minute, WEEK_DAYS, DAY_NAMES_RU
+)
+from broadcast import Broadcaster
+from fsm_storage import DatabaseStorage
+from webhook import run_webhook
+from jobs import JobRunner
+from metrics import REGISTRY, Gauge, MetricsMiddleware, start_metrics_server
+from singleflight import SingleFlight
+from export_pool import ExportPool, ExportRejected, pack_roster, render_week, render_day, render_timesheet
+from throttling import ThrottlingMiddleware
+from calendar_feed import feed_url, start_calendar_server
+from shift_alerts import ShiftAlertDispatcher
+from schedule_import import import_schedule_file, week_from_text
+
+# Модули выгрузок и покрытия тянут openpyxl, numpy и pandas: они импортируются
+# при первом использовании и предзагружаются в фоне после старта
+if TYPE_CHECKING:
+    from coverage import Coverage
+LAZY_MODULES = ('excel_generator', 'coverage', 'pandas')
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 bot = Bot(token=Config.BOT_TOKEN)
-dp = Dispatcher()
-db = Database()
+db = AsyncDatabase()
+dp = Dispatcher(storage=DatabaseStorage(db) if Config.FSM_STORAGE == 'database' else MemoryStorage())
 scheduler = AsyncIOScheduler()
+broadcaster = Broadcaster(bot, db)
+jobs = JobRunner(scheduler, db)
+shift_alerts = ShiftAlertDispatcher(broadcaster, db, jobs)
+metrics_runner = None
+calendar_runner = None
+initialization: Optional[asyncio.Task] = None
+catch_up_task: Optional[asyncio.Task] = None
+first_update_logged = False
+
+throttling = ThrottlingMiddleware()
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+dp.message.middleware(MetricsMiddleware())
+dp.callback_query.middleware(MetricsMiddleware())
+# Одинаковые одновременные выгрузки (вид, неделя, день, версия расписания) строятся один раз
+exports = SingleFlight('export')
+export_pool = ExportPool()
+REGISTRY.register(Gauge('bot_export_queue_depth', 'Выгрузки в очереди и в работе пула', lambda: export_pool.pending))
+REGISTRY.register(Gauge('bot_shift_alerts_pending', 'Напоминания о сменах в очереди', lambda: shift_alerts.pending))
+REGISTRY.register(Gauge('bot_user_cache_hits', 'Попадания в кэш пользователей', lambda: db.sync.users.hits))
+REGISTRY.register(Gauge('bot_user_cache_misses', 'Промахи кэша пользователей', lambda: db.sync.users.misses))
+
+DAY_NAMES = {en: ru.capitalize() for ru, en in DAY_NAMES_RU.items()}
+EXPORT_BUSY_MESSAGE = "⏳ Сейчас формируется много файлов. Попробуйте через минуту."
 
 class Registration(StatesGroup):
     waiting_for_first_name = State()
@@ -35,10 +89,11 @@ class ScheduleInput(StatesGroup):
 @dp.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext):
     user = message.from_user
+    user_name = await db.get_user_name(user.id)
     
-    if db.is_user_registered(user.id):
+    if user_name:
         await message.answer(
-            f"👋 Добро пожаловать, {db.get_user_name(user.id)}!\n"
+            f"👋 Добро пожаловать, {user_name}!\n"
             "Используйте кнопки меню для работы с расписанием.",
             reply_markup=get_main_keyboard()
         )
@@ -55,7 +110,12 @@ async def cmd_help(message: Message):
     help_text = (
         "ℹ️ <b>Доступные команды:</b>\n\n"
         "/start - Начать работу с ботом\n"
-        "/help - Показать справку\n\n"
+        "/help - Показать справку\n"
+        "/who <i>день время</i> - кто на смене (например: /who чт 14:00)\n"
+        "/gaps <i>[минимум]</i> - часы с нехваткой людей на следующей неделе\n"
+        "/peak - пиковая загрузка по дням на следующей неделе\n"
+        "/calendar - ссылка на календарь смен для телефона или Google Календаря\n"
+        "/remind <i>[минуты|off]</i> - напоминать о начале смены\n\n"
         "<b>Основные функции:</b>\n"
         "📝 <b>Заполнить расписание</b> - ввести свое расписание на неделю\n"
         "👀 <b>Мое расписание</b> - просмотреть свое расписание\n"
@@ -65,11 +125,246 @@ async def cmd_help(message: Message):
     )
     await message.answer(help_text, reply_markup=get_main_keyboard(), parse_mode="HTML")
 
+@dp.message(Command("who"))
+async def cmd_who(message: Message, command: CommandObject):
+    if not await db.is_user_registered(message.from_user.id):
+        await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
+        return
+    
+    parts = (command.args or "").split()
+    try:
+        day = parse_day(parts[0]) if len(parts) == 2 else None
+        minute = parse_time(parts[1]) if day else None
+    except ValueError:
+        day = None
+    if day is None:
+        await message.answer("Использование: /who <день> <время>, например: /who чт 14:00")
+        return
+    
+    # Ближайший такой день: на этой неделе или на следующей
+    today = datetime.now().date()
+    week_start = get_week_start_date(today)
+    if WEEK_DAYS.index(day) < today.weekday():
+        week_start += timedelta(days=7)
+    
+    coverage = await get_coverage(week_start)
+    names = coverage.who(day, minute)
+    header = f"👥 <b>На смене {week_start + timedelta(days=WEEK_DAYS.index(day)):%d.%m} в {format_minute(minute)}:</b>\n\n"
+    if names:
+        await message.answer(header + "\n".join(f"👤 {name}" for name in names), parse_mode="HTML")
+    else:
+        await message.answer(header + "<i>никого</i>", parse_mode="HTML")
+
+@dp.message(Command("gaps"))
+async def cmd_gaps(message: Message, command: CommandObject):
+    if not await db.is_user_registered(message.from_user.id):
+        await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
+        return
+    
+    args = (command.args or "").strip()
+    if args and not args.isdigit():
+        await message.answer("Использование: /gaps [минимум сотрудников], например: /gaps 3")
+        return
+    threshold = int(args) if args else Config.MIN_STAFF
+    
+    coverage = await get_coverage(get_next_week_start_date())
+    gaps = coverage.gaps(threshold, Config.WORK_START_HOUR * 60, Config.WORK_END_HOUR * 60)
+    if not gaps:
+        await message.answer(f"✅ На следующей неделе везде не меньше {threshold} чел.")
+        return
+    
+    lines = [
+        f"{DAY_NAMES[day]} {format_minute(start)}-{format_minute(end)}: {count} чел."
+        for day, start, end, count in gaps
+    ]
+    await message.answer(
+        f"⚠️ <b>Меньше {threshold} чел. на смене (следующая неделя):</b>\n\n" + "\n".join(lines),
+        parse_mode="HTML"
+    )
+
+@dp.message(Command("peak"))
+async def cmd_peak(message: Message):
+    if not await db.is_user_registered(message.from_user.id):
+        await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
+        return
+    
+    coverage = await get_coverage(get_next_week_start_date())
+    peaks = coverage.peaks()
+    if not peaks:
+        await message.answer("На следующую неделю расписание еще не заполнено.")
+        return
+    
+    lines = [
+        f"{DAY_NAMES[day]}: {count} чел. с {format_minute(start)} до {format_minute(end)}"
+        for day, count, start, end in peaks
+    ]
+    await message.answer(
+        "📈 <b>Пиковая загрузка (следующая неделя):</b>\n\n" + "\n".join(lines),
+        parse_mode="HTML"
+    )
+
+def is_admin(user_id: int) -> bool:
+    return str(user_id) in [admin.strip() for admin in Config.ADMIN_ID.split(',') if admin.strip()]
+
+@dp.message(Command("import"), F.document)
+async def cmd_import_schedule(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        await message.answer("Загрузка расписаний доступна только администратору.")
+        return
+    
+    document = message.document
+    filename = document.file_name or ""
+    if not filename.lower().endswith(('.csv', '.xlsx')):
+        await message.answer("Поддерживаются файлы .csv и .xlsx в формате общего расписания.")
+        return
+    
+    week_start = week_from_text(command.args or "") or week_from_text(filename) or get_next_week_start_date()
+    week_start = get_week_start_date(week_start)
+    
+    started = time.monotonic()
+    content = (await bot.download(document)).read()
+    users = await db.get_all_users()
+    try:
+        # Разбор xlsx и проверка тысяч строк не должны блокировать event loop
+        entries, errors = await asyncio.to_thread(import_schedule_file, content, filename, users)
+    except Exception as e:
+        logger.error(f"Ошибка при чтении файла импорта {filename}: {e}")
+        await message.answer("❌ Не удалось прочитать файл. Проверьте формат.")
+        return
+    
+    if errors:
+        report = "\n".join(errors)
+        await message.answer(
+            f"❌ Найдено ошибок: {len(errors)}. Расписание не загружено.\n\n"
+            + "\n".join(errors[:Config.IMPORT_ERRORS_IN_MESSAGE])
+        )
+        if len(errors) > Config.IMPORT_ERRORS_IN_MESSAGE:
+            await message.answer_document(
+                BufferedInputFile(report.encode('utf-8'), filename="import_errors.txt"),
+                caption="Полный список ошибок"
+            )
+        return
+    if not entries:
+        await message.answer("В файле нет строк с расписанием.")
+        return
+    
+    if await db.save_schedules_bulk(week_start, entries):
+        for user_id, shifts in entries:
+            shift_alerts.schedule_changed(user_id, week_start, shifts)
+        elapsed = time.monotonic() - started
+        logger.info(f"Bulk import by {message.from_user.id}: {len(entries)} rows for {week_start} in {elapsed:.2f}s")
+        await message.answer(f"✅ Загружено расписаний: {len(entries)} на неделю с {week_start:%d.%m.%Y} ({elapsed:.1f} с).")
+    else:
+        await message.answer("❌ Ошибка при сохранении. Ничего не загружено, попробуйте позже.")
+
+@dp.message(Command("import"))
+async def cmd_import_help(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("Загрузка расписаний доступна только администратору.")
+        return
+    
+    await message.answer(
+        "Отправьте файл .xlsx или .csv в формате общего расписания "
+        "(«Фамилия Имя» и столбцы дней недели) с подписью /import.\n"
+        "Неделя берется из подписи (/import 2024-05-06), из имени файла выгрузки "
+        "или по умолчанию следующая."
+    )
+
+@dp.message(Command("timesheet"))
+async def cmd_timesheet(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        await message.answer("Табель доступен только администратору.")
+        return
+    
+    try:
+        first_month, last_month, period = parse_timesheet_args(command.args or "")
+    except ValueError:
+        await message.answer(
+            "Использование: /timesheet [ГГГГ | ГГГГ-ММ [ГГГГ-ММ]] [месяц|квартал|год]\n"
+            "Например: /timesheet 2024 квартал или /timesheet 2024-01 2024-06"
+        )
+        return
+    
+    rows = await db.get_hours_by_month(first_month, last_month)
+    if rows is None:
+        await message.answer("❌ Не удалось получить данные. Попробуйте позже.")
+        return
+    if not rows:
+        await message.answer("За этот период расписаний нет.")
+        return
+    
+    try:
+        content = await export_pool.render('timesheet', render_timesheet, rows, period)
+    except ExportRejected:
+        await message.answer(EXPORT_BUSY_MESSAGE)
+        return
+    await message.answer_document(
+        BufferedInputFile(content, filename=f"timesheet_{first_month:%Y-%m}_{last_month:%Y-%m}.xlsx"),
+        caption=f"Табель с {format_period(first_month, 'month')} по {format_period(last_month, 'month')}"
+    )
+
+@dp.message(Command("calendar"))
+async def cmd_calendar(message: Message, command: CommandObject):
+    if not Config.CALENDAR_PORT or not Config.CALENDAR_URL:
+        await message.answer("Календарь смен не настроен.")
+        return
+    if not await db.is_user_registered(message.from_user.id):
+        await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
+        return
+    
+    renew = (command.args or "").strip().lower() in ("new", "новая", "новый")
+    token = await db.get_calendar_token(message.from_user.id, renew)
+    if token is None:
+        await message.answer("❌ Не удалось получить ссылку. Попробуйте позже.")
+        return
+    await message.answer(
+        f"📆 {'Новая ссылка' if renew else 'Ссылка'} на ваш календарь смен:\n<code>{feed_url(token)}</code>\n\n"
+        "Добавьте ее в календарь как подписку (Google Календарь: «Другие календари» → «Добавить по URL», "
+        "iPhone: Настройки → Календарь → Учетные записи → Подписной календарь). "
+        "Смены будут обновляться в календаре сами.\n\n"
+        "Если ссылка попала к посторонним, получите новую командой /calendar new - старая перестанет работать.",
+        parse_mode="HTML"
+    )
+
+@dp.message(Command("remind"))
+async def cmd_remind(message: Message, command: CommandObject):
+    if not await db.is_user_registered(message.from_user.id):
+        await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
+        return
+    
+    args = (command.args or "").strip().lower()
+    if not args:
+        lead = await db.get_shift_alert(message.from_user.id)
+        status = f"включены, за {lead} мин. до начала смены" if lead is not None else "выключены"
+        await message.answer(
+            f"⏰ Напоминания о сменах {status}.\n\n"
+            f"/remind <i>минуты</i> - напоминать за столько минут (например, /remind {Config.SHIFT_ALERT_LEAD})\n"
+            "/remind off - выключить",
+            parse_mode="HTML"
+        )
+        return
+    
+    if args in ("off", "выкл", "нет"):
+        lead = None
+    elif args.isdigit() and 0 < int(args) <= Config.SHIFT_ALERT_MAX_LEAD:
+        lead = int(args)
+    else:
+        await message.answer(f"Укажите число минут от 1 до {Config.SHIFT_ALERT_MAX_LEAD} или off.")
+        return
+    
+    if not await shift_alerts.set_lead(message.from_user.id, lead):
+        await message.answer("❌ Не удалось сохранить настройку. Попробуйте позже.")
+        return
+    if lead is None:
+        await message.answer("🔕 Напоминания о сменах выключены.")
+    else:
+        await message.answer(f"⏰ Буду напоминать о смене за {lead} мин. до начала.")
+
 # ================== ОБРАБОТЧИКИ КНОПОК ==================
 
 @dp.message(F.text.in_(["📝 Заполнить расписание", "Заполнить расписание", "заполнить"]))
 async def cmd_fill_schedule(message: Message, state: FSMContext):
-    if not db.is_user_registered(message.from_user.id):
+    if not await db.is_user_registered(message.from_user.id):
         await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
         return
     
@@ -83,7 +378,8 @@ async def cmd_fill_schedule(message: Message, state: FSMContext):
         "пятница: 9-18\n"
         "суббота: выходной\n"
         "воскресенье: выходной\n\n"
-        "Можно вводить как одной строкой, так и по дням:",
+        "Можно вводить как одной строкой, так и по дням, с сокращениями и диапазонами:\n"
+        "<i>пн-пт: 9-18, сб, вс: выходной</i>",
         reply_markup=ReplyKeyboardRemove(),
         parse_mode="HTML"
     )
@@ -91,7 +387,7 @@ async def cmd_fill_schedule(message: Message, state: FSMContext):
 
 @dp.message(F.text.in_(["👀 Мое расписание", "Мое расписание", "мое расписание"]))
 async def cmd_my_schedule(message: Message):
-    if not db.is_user_registered(message.from_user.id):
+    if not await db.is_user_registered(message.from_user.id):
         await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
         return
     
@@ -102,22 +398,16 @@ async def cmd_my_schedule(message: Message):
 
 @dp.message(F.text.in_(["📅 Расписание на завтра", "Расписание на завтра", "завтра"]))
 async def cmd_tomorrow_schedule(message: Message):
-    if not db.is_user_registered(message.from_user.id):
+    if not await db.is_user_registered(message.from_user.id):
         await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
         return
     
-    tomorrow = datetime.now() + timedelta(days=1)
-    day_name = get_day_of_week(tomorrow.date())
-    week_start = get_week_start_date(tomorrow.date())
-    
-    schedule_entries = db.get_week_schedule(week_start)
-    formatted_schedule = format_schedule_for_tomorrow(schedule_entries, day_name)
-    
+    formatted_schedule = await get_tomorrow_schedule_text()
     await message.answer(formatted_schedule)
 
 @dp.message(F.text.in_(["👥 Общее расписание", "Общее расписание", "общее"]))
 async def cmd_full_schedule(message: Message):
-    if not db.is_user_registered(message.from_user.id):
+    if not await db.is_user_registered(message.from_user.id):
         await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
         return
     
@@ -148,7 +438,7 @@ async def process_last_name(message: Message, state: FSMContext):
     first_name = user_data['first_name']
     last_name = message.text.strip()
     
-    if db.register_user(message.from_user.id, first_name, last_name):
+    if await db.register_user(message.from_user.id, first_name, last_name):
         logger.info(f"New user registered: {last_name} {first_name} (ID: {message.from_user.id})")
         await message.answer(
             f"✅ Регистрация завершена, {last_name} {first_name}!\n"
@@ -166,27 +456,23 @@ async def process_last_name(message: Message, state: FSMContext):
 
 @dp.message(ScheduleInput.waiting_for_schedule)
 async def process_schedule_input(message: Message, state: FSMContext):
+    schedule_data, errors = parse_schedule(message.text or '')
+    if errors:
+        # Состояние не сбрасываем: можно сразу прислать исправленное расписание
+        await message.answer(
+            "❌ <b>Не удалось разобрать расписание:</b>\n"
+            + "\n".join(f"• {html.escape(str(error))}" for error in errors[:10])
+            + "\n\nФормат: <i>день: время</i>, например <i>пн-пт: 9-18, сб, вс: выходной</i>\n"
+            "Попробуйте еще раз:",
+            parse_mode="HTML"
+        )
+        return
+    
     try:
-        schedule_data = parse_schedule_text(message.text)
-        
-        if len(schedule_data) < 7:
-            await message.answer("❌ Пожалуйста, укажите расписание для всех дней недели.")
-            return
-            
-        if not validate_schedule(schedule_data):
-            await message.answer(
-                "❌ <b>Некорректный формат.</b> Используйте:\n"
-                "<i>день: время</i> (например: понедельник: 9-18)\n"
-                "или 'выходной'\n\n"
-                "Попробуйте еще раз:",
-                reply_markup=ReplyKeyboardRemove(),
-                parse_mode="HTML"
-            )
-            return
-        
         next_week_start = get_next_week_start_date()
-        if db.save_schedule(message.from_user.id, next_week_start, schedule_data):
+        if await db.save_schedule(message.from_user.id, next_week_start, schedule_data):
             logger.info(f"Schedule saved for user: {message.from_user.id}")
+            shift_alerts.schedule_changed(message.from_user.id, next_week_start, schedule_data)
             await message.answer(
                 "✅ <b>Расписание на следующую неделю успешно сохранено!</b>",
                 reply_markup=get_main_keyboard(),
@@ -211,7 +497,7 @@ async def process_schedule_input(message: Message, state: FSMContext):
 
 @dp.callback_query(F.data.in_(['current_week', 'next_week']))
 async def process_week_choice(callback: CallbackQuery):
-    if not db.is_user_registered(callback.from_user.id):
+    if not await db.is_user_registered(callback.from_user.id):
         await callback.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /start")
         return
     
@@ -222,20 +508,21 @@ async def process_week_choice(callback: CallbackQuery):
         week_start = get_next_week_start_date()
         week_name = "следующую неделю"
     
-    schedule_data = db.get_week_schedule(week_start)
+    schedule_data = await db.get_week_schedule(week_start)
     if not schedule_data:
         await callback.message.answer(f"На {week_name} расписание еще не заполнено.")
         await callback.answer()
         return
     
     try:
-        filename = generate_week_schedule_excel(schedule_data, week_start)
-        
-        await callback.message.answer_document(
-            FSInputFile(filename, filename=f"schedule_{week_start}.xlsx"),
+        await send_export(
+            callback.message, schedule_data, ('week', None),
+            lambda: render_week_export(schedule_data, week_start),
+            filename=f"schedule_{week_start}.xlsx",
             caption=f"Расписание на {week_name}"
         )
-        os.remove(filename)
+    except ExportRejected:
+        await callback.message.answer(EXPORT_BUSY_MESSAGE)
     except Exception as e:
         logger.error(f"Ошибка при отправке файла: {e}")
         await callback.message.answer(
@@ -250,16 +537,17 @@ async def process_day_choice(callback: CallbackQuery):
     today = datetime.now().date()
     week_start = get_week_start_date(today)
     
-    schedule_entries = db.get_week_schedule(week_start)
+    schedule_entries = await db.get_week_schedule(week_start)
     
     try:
-        filename = generate_day_schedule_excel(schedule_entries, day)
-        
-        await callback.message.answer_document(
-            FSInputFile(filename, filename=f"schedule_{day}.xlsx"),
+        await send_export(
+            callback.message, schedule_entries, ('day', day),
+            lambda: render_day_export(schedule_entries, day),
+            filename=f"schedule_{day}.xlsx",
             caption=f"Расписание на {day}"
         )
-        os.remove(filename)
+    except ExportRejected:
+        await callback.message.answer(EXPORT_BUSY_MESSAGE)
     except Exception as e:
         logger.error(f"Ошибка при отправке файла: {e}")
         await callback.message.answer(
@@ -270,54 +558,183 @@ async def process_day_choice(callback: CallbackQuery):
 
 # ================== СЛУЖЕБНЫЕ ФУНКЦИИ ==================
 
-async def send_schedule_reminder():
-    """Отправка напоминания о заполнении расписания"""
-    users = db.get_all_users()
-    for user in users:
-        try:
-            await bot.send_message(
-                user['user_id'],
-                "⏰ <b>Напоминание:</b> пожалуйста, заполните расписание на следующую неделю!\n"
-                "Используйте кнопку '📝 Заполнить расписание' в меню.",
-                reply_markup=get_main_keyboard(),
-                parse_mode="HTML"
-            )
-            logger.info(f"Reminder sent to user: {user['user_id']}")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке напоминания пользователю {user['user_id']}: {e}")
-
-async def send_daily_schedule():
-    """Отправка расписания на завтра"""
-    tomorrow = datetime.now() + timedelta(days=1)
+async def get_tomorrow_schedule_text(today: Optional[datetime] = None) -> str:
+    """Текст расписания на завтра, кэшируется до изменения расписания недели"""
+    tomorrow = (today or datetime.now()) + timedelta(days=1)
     day_name = get_day_of_week(tomorrow.date())
     week_start = get_week_start_date(tomorrow.date())
     
-    schedule_entries = db.get_week_schedule(week_start)
-    formatted_schedule = format_schedule_for_tomorrow(schedule_entries, day_name)
-    
-    users = db.get_all_users()
-    for user in users:
+    schedule_entries = await db.get_week_schedule(week_start)
+    return db.sync.rosters.memoize(
+        schedule_entries,
+        ('tomorrow', day_name),
+        lambda: format_schedule_for_tomorrow(schedule_entries, day_name)
+    )
+
+def roster_coverage(roster: Roster) -> 'Coverage':
+    from coverage import Coverage
+    return db.sync.rosters.memoize(roster, 'coverage', lambda: Coverage(roster))
+
+async def get_coverage(week_start) -> 'Coverage':
+    """Покрытие смен недели, пересчитывается только при изменении расписания"""
+    return roster_coverage(await db.get_week_schedule(week_start))
+
+async def render_week_export(roster: Roster, week_start) -> bytes:
+    """Выгрузка недели в пуле выгрузок (ExportRejected при перегрузке)"""
+    return await export_pool.render('week', render_week, pack_roster(roster), week_start)
+
+async def render_day_export(roster: Roster, day: str) -> bytes:
+    """Выгрузка дня в пуле выгрузок (ExportRejected при перегрузке)"""
+    return await export_pool.render('day', render_day, pack_roster(roster), day)
+
+async def send_export(message: Message, roster: Roster, export_key: tuple, render: Callable[[], Awaitable[bytes]],
+                      filename: str, caption: str):
+    """Отправляет выгрузку по снимку расписания.
+
+    Готовый файл и его file_id в Telegram кэшируются на версию расписания недели:
+    повторный запрос отправляет file_id без генерации и загрузки файла.
+    Одновременные запросы одной выгрузки ждут один общий render.
+    """
+    rosters = db.sync.rosters
+    file_id_key = ('file_id',) + export_key
+    file_id = rosters.get_view(roster, file_id_key)
+    if file_id:
         try:
-            await bot.send_message(
-                user['user_id'],
-                formatted_schedule
-            )
-            logger.info(f"Daily schedule sent to user: {user['user_id']}")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке расписания пользователю {user['user_id']}: {e}")
+            await message.answer_document(file_id, caption=caption)
+            return
+        except TelegramBadRequest as e:
+            logger.warning(f"Не удалось повторно отправить файл {filename} по file_id: {e}")
+    
+    content_key = ('xlsx',) + export_key
+    content = rosters.get_view(roster, content_key)
+    if content is None:
+        flight_key = export_key + (str(roster.week_start_date), roster.version)
+        content = await exports.run(flight_key, render)
+        rosters.set_view(roster, content_key, content)
+    sent = await message.answer_document(
+        BufferedInputFile(content, filename=filename),
+        caption=caption
+    )
+    if sent.document:
+        rosters.set_view(roster, file_id_key, sent.document.file_id)
 
-async def on_startup():
-    scheduler.add_job(send_schedule_reminder, 'cron', day_of_week='wed', hour=10)
-    scheduler.add_job(send_daily_schedule, 'cron', hour=18)
+async def send_schedule_reminder(run_at: datetime):
+    """Отправка напоминания о заполнении расписания"""
+    await broadcaster.run(
+        f"reminder:{run_at.date()}",
+        None,  # всем пользователям
+        "⏰ <b>Напоминание:</b> пожалуйста, заполните расписание на следующую неделю!\n"
+        "Используйте кнопку '📝 Заполнить расписание' в меню.",
+        reply_markup=get_main_keyboard(),
+        parse_mode="HTML"
+    )
+
+async def send_daily_schedule(run_at: datetime):
+    """Отправка расписания на завтра"""
+    formatted_schedule = await get_tomorrow_schedule_text(run_at)
+    await broadcaster.run(
+        f"daily:{run_at.date() + timedelta(days=1)}",
+        None,  # всем пользователям
+        formatted_schedule
+    )
+
+async def purge_history(run_at: datetime):
+    """Очистка отметок о доставке рассылок и записей о запусках задач (в том числе напоминаний о сменах)"""
+    await db.purge_deliveries(Config.BROADCAST_KEEP_DAYS)
+    await db.purge_job_runs(Config.JOB_RUNS_KEEP_DAYS)
+
+def log_phase(phase: str, since: float) -> float:
+    """Пишет в лог длительность фазы старта и возвращает время ее окончания"""
+    now = time.monotonic()
+    logger.info(f"Старт: {phase} за {now - since:.3f} с ({now - STARTED_AT:.3f} с с запуска)")
+    return now
+
+@dp.update.outer_middleware()
+async def log_first_update(handler, event, data):
+    global first_update_logged
+    if not first_update_logged:
+        first_update_logged = True
+        logger.info(f"Первое обновление получено через {time.monotonic() - STARTED_AT:.3f} с после запуска")
+    return await handler(event, data)
+
+async def initialize():
+    """Фоновая инициализация: БД, кэши и планировщик.
+
+    Обновления принимаются уже во время нее: обработчики, которым нужна БД,
+    ждут db.ready.
+    """
+    global catch_up_task
+    phase_started = time.monotonic()
+    await db.start()
+    phase_started = log_phase("подключение к БД и миграции", phase_started)
+    await db.warm_user_cache()
+    await purge_history(datetime.now())
+    phase_started = log_phase("прогрев кэша", phase_started)
+    jobs.add_job(
+        'schedule_reminder', send_schedule_reminder,
+        CronTrigger(day_of_week=Config.REMINDER_DAY[:3], hour=Config.REMINDER_HOUR)
+    )
+    jobs.add_job('daily_schedule', send_daily_schedule, CronTrigger(hour=Config.DAILY_SCHEDULE_HOUR))
+    jobs.add_job('purge_history', purge_history, CronTrigger(hour=Config.PURGE_HOUR))
     scheduler.start()
-    logger.info("Bot and scheduler started")
+    catch_up_task = asyncio.create_task(jobs.catch_up())
+    catch_up_task.add_done_callback(on_catch_up_done)
+    shift_alerts.start()
+    phase_started = log_phase("планировщик", phase_started)
+    
+    loop = asyncio.get_running_loop()
+    for module in LAZY_MODULES:
+        await loop.run_in_executor(None, importlib.import_module, module)
+    log_phase("предзагрузка модулей выгрузок", phase_started)
+
+def on_catch_up_done(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Ошибка при догоне пропущенных запусков задач: {task.exception()}")
+
+def on_initialized(task: asyncio.Task):
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.error(f"Не удалось запустить бота: {task.exception()}")
+        # Завершаемся как по SIGTERM: контейнер перезапустится
+        os.kill(os.getpid(), signal.SIGTERM)
+
+async def on_startup():
+    global metrics_runner, calendar_runner, initialization
+    log_phase("импорт модулей", STARTED_AT)
+    metrics_runner = await start_metrics_server()
+    calendar_runner = await start_calendar_server(db)
+    initialization = asyncio.create_task(initialize())
+    initialization.add_done_callback(on_initialized)
+    logger.info("Bot started, initialization continues in background")
 
 async def on_shutdown():
-    scheduler.shutdown()
-    db.close()
+    if initialization is not None and not initialization.done():
+        initialization.cancel()
+    if catch_up_task is not None and not catch_up_task.done():
+        catch_up_task.cancel()
+        await asyncio.gather(catch_up_task, return_exceptions=True)
+    if scheduler.running:
+        scheduler.shutdown()
+    await shift_alerts.close()
+    if calendar_runner is not None:
+        # До закрытия БД: обработчики лент обращаются к ней
+        await calendar_runner.cleanup()
+    logger.info(f"User cache stats: {db.sync.users.stats()}")
+    if db.ready.is_set():
+        # Без БД сохранить состояние FSM все равно некуда, а запросы ждали бы ее вечно
+        await dp.storage.close()
+    await db.close()
+    export_pool.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
     logger.info("Bot and scheduler stopped")
 
 async def main():
+    if Config.BOT_MODE == 'webhook':
+        await run_webhook(dp, bot, on_startup, on_shutdown)
+        return
+    
     await on_startup()
     try:
         await dp.start_polling(bot)
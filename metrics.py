@@ -0,0 +1,298 @@
+import abc
+import functools
+import inspect
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(abc.ABC):
+    """Базовый класс метрики с метками.
+
+    Запись значения - это поиск по словарю и сложение под блокировкой
+    (метрики пишутся и из потоков БД); текст для Prometheus формируется
+    только при запросе /metrics.
+    """
+
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        """Строки значений в текстовом формате Prometheus"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._label_values(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Metric):
+    """Значение, которое вычисляется функцией в момент запроса /metrics"""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.func = func
+
+    def samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {_format_value(self.func())}"]
+        except Exception as e:
+            logger.error(f"Не удалось вычислить метрику {self.name}: {e}")
+            return []
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждой комбинации меток: счетчики по корзинам (без накопления), сумма и число наблюдений
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._label_values(labels))
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    'bot_handler_seconds', 'Время обработки обновления обработчиком', ['handler']
+))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'bot_handler_errors', 'Исключения в обработчиках', ['handler']
+))
+DB_SECONDS = REGISTRY.register(Histogram(
+    'bot_db_seconds', 'Время выполнения методов Database', ['method']
+))
+DB_ERRORS = REGISTRY.register(Counter(
+    'bot_db_errors', 'Исключения в методах Database', ['method']
+))
+EXPORT_SECONDS = REGISTRY.register(Histogram(
+    'bot_export_seconds', 'Время формирования файла Excel', ['export']
+))
+EXPORT_BYTES = REGISTRY.register(Histogram(
+    'bot_export_bytes', 'Размер файла Excel', ['export'], buckets=SIZE_BUCKETS
+))
+EXPORT_RENDER_SECONDS = REGISTRY.register(Histogram(
+    'bot_export_render_seconds', 'Время выгрузки в пуле с учетом ожидания в очереди', ['export']
+))
+EXPORT_REJECTED = REGISTRY.register(Counter(
+    'bot_export_rejected', 'Выгрузки, отклоненные пулом (переполнение очереди, таймаут)', ['export', 'reason']
+))
+BROADCAST_MESSAGES = REGISTRY.register(Counter(
+    'bot_broadcast_messages', 'Сообщения рассылок по результату', ['result']
+))
+BROADCAST_RETRIES = REGISTRY.register(Counter(
+    'bot_broadcast_retries', 'Повторные попытки отправки (RetryAfter и сетевые ошибки)', ['reason']
+))
+BROADCAST_RATE = REGISTRY.register(Histogram(
+    'bot_broadcast_rate', 'Скорость завершенных рассылок, сообщений в секунду', [],
+    buckets=(1, 5, 10, 15, 20, 25, 30, 50)
+))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    'bot_coalesced_requests', 'Запросы, дождавшиеся уже идущего такого же вычисления', ['kind']
+))
+THROTTLED_UPDATES = REGISTRY.register(Counter(
+    'bot_throttled_updates', 'Обновления, отброшенные ограничением частоты на пользователя', ['event']
+))
+CALENDAR_REQUESTS = REGISTRY.register(Counter(
+    'bot_calendar_requests', 'Запросы лент календаря по коду ответа (304 - без чтения расписания)', ['status']
+))
+
+
+def timed(histogram: Histogram, errors: Optional[Counter] = None, **labels):
+    """Декоратор: записывает время выполнения функции (и генератора целиком) в histogram"""
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                except Exception:
+                    if errors is not None:
+                        errors.inc(**labels)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - started, **labels)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(**labels)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+def instrument_methods(cls):
+    """Декоратор класса Database: замеряет все публичные методы"""
+    for name, func in list(vars(cls).items()):
+        if not name.startswith('_') and inspect.isfunction(func):
+            setattr(cls, name, timed(DB_SECONDS, DB_ERRORS, method=name)(func))
+    return cls
+
+
+def measure_export(export: str):
+    """Декоратор генератора Excel: время формирования и размер результата"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            content = func(*args, **kwargs)
+            EXPORT_SECONDS.observe(time.perf_counter() - started, export=export)
+            EXPORT_BYTES.observe(len(content), export=export)
+            return content
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """Внутренний middleware aiogram: время и ошибки каждого обработчика.
+
+    Модуль не зависит от aiogram и aiohttp, чтобы database и excel_generator
+    можно было использовать в скриптах без бота.
+    """
+
+    async def __call__(self, handler, event, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+
+
+async def start_metrics_server(host: str = Config.METRICS_HOST, port: int = Config.METRICS_PORT):
+    """Запускает HTTP-сервер с метриками на host:port/metrics (port=0 - не запускать).
+
+    Возвращает aiohttp AppRunner, который нужно закрыть через cleanup().
+    """
+    if not port:
+        return None
+    from aiohttp import web
+
+    async def metrics_handler(request: web.Request) -> web.Response:
+        return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,194 @@
+"""Версионные миграции схемы БД (для СУБД из Config.DB_BACKEND).
+
+Применить миграции (то же самое бот делает при старте):
+    python migrations.py
+Показать, что будет выполнено, ничего не меняя:
+    python migrations.py --dry-run
+Проверить планы выполнения частых запросов (EXPLAIN):
+    python migrations.py --explain
+"""
+import argparse
+import logging
+import sys
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Sequence, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MigrationStep = Union[str, Callable]
+LOCK_NAME = 'schedule_bot_migrations'
+LOCK_TIMEOUT = 60
+# Полный просмотр таблицы допустим только для маленьких таблиц
+EXPLAIN_MAX_SCAN_ROWS = 100
+
+MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(128) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class Migration(NamedTuple):
+    """Миграция: номер версии, название и шаги (SQL или функция от курсора)"""
+    version: int
+    name: str
+    steps: Tuple[MigrationStep, ...]
+
+
+@contextmanager
+def server_lock(cursor, name: str = LOCK_NAME, timeout: int = LOCK_TIMEOUT):
+    """Именованная блокировка MySQL (GET_LOCK) на время миграций"""
+    cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (name, timeout))
+    if not cursor.fetchone()['locked']:
+        raise RuntimeError(f"Не удалось получить блокировку миграций за {timeout} с")
+    try:
+        yield
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s) AS released", (name,))
+        cursor.fetchall()
+
+
+def server_table_exists(cursor, table: str) -> bool:
+    """Есть ли таблица в текущей БД MySQL"""
+    cursor.execute("""
+        SELECT COUNT(*) AS found FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return bool(cursor.fetchone()['found'])
+
+
+def add_index(table: str, name: str, columns: Sequence[str]) -> Callable:
+    """Шаг миграции MySQL: создает индекс, если его еще нет (повторный запуск после сбоя безопасен)"""
+    def step(cursor):
+        cursor.execute("""
+            SELECT COUNT(*) AS found FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        """, (table, name))
+        if not cursor.fetchone()['found']:
+            cursor.execute(f"ALTER TABLE {table} ADD INDEX {name} ({', '.join(columns)})")
+    step.__name__ = f"add_index_{name}"
+    step.__doc__ = f"ALTER TABLE {table} ADD INDEX {name} ({', '.join(columns)})"
+    return step
+
+
+def _describe(step: MigrationStep) -> str:
+    if isinstance(step, str):
+        return ' '.join(step.split())
+    return f"{step.__name__}: {(step.__doc__ or '').strip()}"
+
+
+def _applied_versions(pool, cursor, dry_run: bool) -> Set[int]:
+    if dry_run:
+        if not pool.table_exists(cursor, 'schema_migrations'):
+            return set()
+    else:
+        cursor.execute(MIGRATIONS_TABLE)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def migrate(pool, migrations: Sequence[Migration], dry_run: bool = False) -> List[Migration]:
+    """Применяет еще не примененные миграции по возрастанию версии.
+
+    Реплики, стартующие одновременно, выполняют миграции по очереди
+    (pool.migration_lock). При dry_run только пишет в лог шаги, которые были бы
+    выполнены. Возвращает список ожидающих (или примененных) миграций.
+    """
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Повторяющиеся версии миграций: {versions}")
+
+    with pool.connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            with pool.migration_lock(cursor):
+                applied = _applied_versions(pool, cursor, dry_run)
+                unknown = applied - set(versions)
+                if unknown:
+                    logger.warning(f"В БД есть миграции, неизвестные этой версии бота: {sorted(unknown)}")
+
+                pending = sorted(
+                    (migration for migration in migrations if migration.version not in applied),
+                    key=lambda migration: migration.version
+                )
+                for migration in pending:
+                    if dry_run:
+                        logger.info(f"[dry-run] Миграция {migration.version} ({migration.name}):")
+                        for step in migration.steps:
+                            logger.info(f"[dry-run]   {_describe(step)}")
+                        continue
+
+                    logger.info(f"Применяется миграция {migration.version} ({migration.name})")
+                    for step in migration.steps:
+                        if isinstance(step, str):
+                            cursor.execute(step)
+                        else:
+                            step(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (migration.version, migration.name)
+                    )
+                    connection.commit()
+                if not pending:
+                    logger.info("Схема БД актуальна")
+                return pending
+        finally:
+            cursor.close()
+
+
+def explain_problems(pool, queries: Dict[str, Tuple[str, tuple]]) -> List[str]:
+    """Выполняет EXPLAIN (MySQL) для частых запросов и возвращает найденные проблемы плана.
+
+    Проблемой считается полный просмотр таблицы (type=ALL) с оценкой больше
+    EXPLAIN_MAX_SCAN_ROWS строк.
+    """
+    problems = []
+    with pool.connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            for name, (sql, params) in queries.items():
+                cursor.execute("EXPLAIN " + sql, params)
+                for row in cursor.fetchall():
+                    table = row.get('table')
+                    logger.info(
+                        f"{name}: {table} type={row.get('type')} key={row.get('key')} "
+                        f"rows={row.get('rows')} extra={row.get('Extra')}"
+                    )
+                    if row.get('type') == 'ALL' and (row.get('rows') or 0) > EXPLAIN_MAX_SCAN_ROWS:
+                        problems.append(f"{name}: полный просмотр таблицы {table} ({row.get('rows')} строк)")
+        finally:
+            cursor.close()
+    return problems
+
+
+def main(argv=None) -> int:
+    from database import create_database
+
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument('--dry-run', action='store_true', help="показать ожидающие миграции без изменений")
+    parser.add_argument('--explain', action='store_true', help="проверить планы частых запросов")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db = create_database(migrate=False)
+    try:
+        pending = db.migrate(dry_run=args.dry_run)
+        logger.info(f"{'Ожидают' if args.dry_run else 'Применено'} миграций: {len(pending)}")
+        if args.explain:
+            problems = db.check_query_plans()
+            for problem in problems:
+                logger.error(problem)
+            if problems:
+                return 1
+    except (db.Error, RuntimeError) as err:
+        logger.error(f"Ошибка миграции: {err}")
+        return 1
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
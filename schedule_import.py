@@ -0,0 +1,115 @@
+import csv
+import io
+import re
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from utils import WEEK_DAYS, DAY_NAMES_RU, DAY_OFF, Shift, parse_shift
+
+NAME_HEADER = 'фамилия имя'
+DAY_TITLES = {en: ru.capitalize() for ru, en in DAY_NAMES_RU.items()}
+DATE_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2})')
+
+ImportEntry = Tuple[int, Dict[str, Optional[Shift]]]
+
+
+def _normalize_name(name: str) -> str:
+    return ' '.join(name.lower().split())
+
+
+def week_from_text(text: str) -> Optional[date]:
+    """Ищет в тексте дату YYYY-MM-DD (например, в имени файла выгрузки schedule_2024-05-06.xlsx)"""
+    match = DATE_PATTERN.search(text or '')
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def read_schedule_file(content: bytes, filename: str) -> Iterator[Sequence]:
+    """Построчно читает CSV или XLSX файл (первый лист)"""
+    if filename.lower().endswith('.xlsx'):
+        import openpyxl  # Импорт дорогой, а нужен только для XLSX
+        wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            ws = wb['Расписание'] if 'Расписание' in wb.sheetnames else wb.worksheets[0]
+            yield from ws.iter_rows(values_only=True)
+        finally:
+            wb.close()
+        return
+
+    text = content.decode('utf-8-sig')
+    # Разделитель определяем по заголовку: Excel в русской локали сохраняет CSV через ';'
+    header = text.split('\n', 1)[0]
+    delimiter = max(',;\t', key=header.count)
+    yield from csv.reader(io.StringIO(text), delimiter=delimiter)
+
+
+def parse_schedule_rows(rows: Iterator[Sequence], users: List[Dict]) -> Tuple[List[ImportEntry], List[str]]:
+    """Проверяет строки файла в формате выгрузки недели.
+
+    Первая строка - заголовок ("Фамилия Имя" и дни недели), далее по строке
+    на сотрудника. Сотрудник ищется среди зарегистрированных по ФИО, время
+    проверяется parse_shift; пустая ячейка означает выходной.
+    Возвращает разобранные записи и список ошибок с номерами строк.
+    """
+    users_by_name: Dict[str, List[int]] = {}
+    for user in users:
+        name = _normalize_name(f"{user['last_name']} {user['first_name']}")
+        users_by_name.setdefault(name, []).append(user['user_id'])
+
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return [], ["Файл пустой"]
+
+    columns = {}
+    for index, title in enumerate(header):
+        title = _normalize_name(str(title or ''))
+        if title == NAME_HEADER:
+            columns['name'] = index
+        elif title in DAY_NAMES_RU:
+            columns[DAY_NAMES_RU[title]] = index
+    missing = [column for column in ['name'] + WEEK_DAYS if column not in columns]
+    if missing:
+        return [], ["Строка 1: в заголовке нет столбцов 'Фамилия Имя' и всех дней недели"]
+
+    entries: List[ImportEntry] = []
+    errors: List[str] = []
+    seen: Dict[int, int] = {}
+    for line, row in enumerate(rows, 2):
+        cells = list(row) + [None] * (len(header) - len(row))
+        raw_name = str(cells[columns['name']] or '').strip()
+        if not raw_name and not any(cells):
+            continue
+
+        user_ids = users_by_name.get(_normalize_name(raw_name), [])
+        if not user_ids:
+            errors.append(f"Строка {line}: сотрудник '{raw_name}' не зарегистрирован")
+            continue
+        if len(user_ids) > 1:
+            errors.append(f"Строка {line}: несколько сотрудников с ФИО '{raw_name}'")
+            continue
+        user_id = user_ids[0]
+        if user_id in seen:
+            errors.append(f"Строка {line}: '{raw_name}' уже указан в строке {seen[user_id]}")
+            continue
+        seen[user_id] = line
+
+        shifts = {}
+        for day in WEEK_DAYS:
+            value = cells[columns[day]]
+            try:
+                shifts[day] = parse_shift(str(value) if value not in (None, '') else DAY_OFF)
+            except ValueError as err:
+                errors.append(f"Строка {line}, {DAY_TITLES[day]}: {err}")
+        if len(shifts) == len(WEEK_DAYS):
+            entries.append((user_id, shifts))
+
+    return entries, errors
+
+
+def import_schedule_file(content: bytes, filename: str, users: List[Dict]) -> Tuple[List[ImportEntry], List[str]]:
+    """Читает и проверяет файл целиком (блокирующий вызов: выполняется в потоке)"""
+    return parse_schedule_rows(read_schedule_file(content, filename), users)
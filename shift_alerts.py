@@ -0,0 +1,218 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as day_time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from analytics import as_date
+from config import Config
+from utils import WEEK_DAYS, Shift, format_minute, get_week_start_date
+
+logger = logging.getLogger(__name__)
+
+JOB_ID = 'shift_alerts'
+RETRY_DELAY = 60  # Секунды до повторной загрузки окна после ошибки БД
+
+
+class Alert(NamedTuple):
+    """Запланированное напоминание (в куче упорядочено по времени отправки)"""
+    fire_at: datetime
+    user_id: int
+    generation: int
+    start_at: datetime
+    shift: Shift
+
+
+def shift_starts(week_start_date, shifts: Dict) -> Iterator[Tuple[datetime, Shift]]:
+    """Начала смен недели: (дата и время начала, смена)"""
+    week_start = as_date(week_start_date)
+    for index, day in enumerate(WEEK_DAYS):
+        shift = shifts.get(day)
+        if shift is not None:
+            yield datetime.combine(week_start + timedelta(days=index), day_time()) + timedelta(minutes=shift.start), shift
+
+
+def alert_text(start_at: datetime, shift: Shift) -> str:
+    return (
+        f"⏰ Напоминание: ваша смена {start_at:%d.%m} "
+        f"с {format_minute(shift.start)} до {format_minute(shift.end)}"
+    )
+
+
+class ShiftAlertDispatcher:
+    """Напоминания о начале смены для всех подписанных сотрудников на одном таймере.
+
+    Вместо задачи планировщика на каждого сотрудника и день - одна куча
+    напоминаний по времени отправки. Смены на Config.SHIFT_ALERT_WINDOW секунд
+    вперед загружаются одним запросом (заново раз в Config.SHIFT_ALERT_RELOAD),
+    сохранение расписания или подписки пересчитывает только записи сотрудника:
+    старые записи остаются в куче и пропускаются по номеру поколения.
+
+    Напоминания с одним временем отправки уходят одной пачкой на одной реплике
+    (JobRunner.run_once). Перед отправкой она перечитывает окно из БД, чтобы
+    учесть изменения, сделанные через другие реплики.
+    """
+
+    def __init__(self, broadcaster, db, jobs):
+        self.broadcaster = broadcaster
+        self.db = db
+        self.jobs = jobs
+        self._heap: List[Alert] = []
+        self._leads: Dict[int, int] = {}  # user_id -> минут до смены
+        self._weeks: Dict[int, Dict[date, Dict]] = {}  # user_id -> неделя -> смены по дням
+        self._generations: Dict[int, int] = {}
+        self._window_end: Optional[datetime] = None
+        self._done_until: Optional[datetime] = None  # время отправки последней обработанной пачки
+        self._reload_at = 0.0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Записей в куче (включая устаревшие, еще не вытесненные)"""
+        return len(self._heap)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _alerts(self, user_id: int, now: datetime) -> List[Alert]:
+        """Напоминания сотрудника в окне; записи предыдущего поколения становятся устаревшими"""
+        generation = self._generations.get(user_id, 0) + 1
+        self._generations[user_id] = generation
+        lead = self._leads.get(user_id)
+        if lead is None:
+            return []
+        alerts = []
+        for week_start, shifts in self._weeks.get(user_id, {}).items():
+            for start_at, shift in shift_starts(week_start, shifts):
+                fire_at = start_at - timedelta(minutes=lead)
+                if not now < start_at <= self._window_end:
+                    continue
+                if self._done_until is not None and fire_at <= self._done_until:
+                    continue
+                alerts.append(Alert(fire_at, user_id, generation, start_at, shift))
+        return alerts
+
+    def _reschedule(self, user_id: int):
+        earliest = self._heap[0].fire_at if self._heap else None
+        for alert in self._alerts(user_id, datetime.now()):
+            heapq.heappush(self._heap, alert)
+        if self._heap and (earliest is None or self._heap[0].fire_at < earliest):
+            self._wake.set()
+
+    async def reload(self) -> bool:
+        """Загружает подписки и смены на окно вперед одним запросом и перестраивает кучу"""
+        now = datetime.now()
+        window_end = now + timedelta(seconds=Config.SHIFT_ALERT_WINDOW)
+        rows = await self.db.get_shift_alerts(get_week_start_date(now.date()), get_week_start_date(window_end.date()))
+        if rows is None:
+            self._reload_at = time.monotonic() + RETRY_DELAY
+            return False
+
+        self._leads, self._weeks = {}, {}
+        for row in rows:
+            self._leads[row['user_id']] = row['lead_minutes']
+            if row['week_start_date'] is not None:
+                self._weeks.setdefault(row['user_id'], {})[as_date(row['week_start_date'])] = row
+        self._window_end = window_end
+        self._heap = [alert for user_id in self._leads for alert in self._alerts(user_id, now)]
+        heapq.heapify(self._heap)
+        self._reload_at = time.monotonic() + Config.SHIFT_ALERT_RELOAD
+        self._wake.set()
+        logger.info(f"Напоминания о сменах: {len(self._leads)} подписок, {len(self._heap)} напоминаний до {window_end:%d.%m %H:%M}")
+        return True
+
+    def schedule_changed(self, user_id: int, week_start_date, shifts: Dict[str, Optional[Shift]]):
+        """Пересчитывает напоминания сотрудника после сохранения его расписания на неделю"""
+        if user_id not in self._leads or self._window_end is None:
+            return
+        self._weeks.setdefault(user_id, {})[as_date(week_start_date)] = {day: shifts.get(day) for day in WEEK_DAYS}
+        self._reschedule(user_id)
+
+    async def set_lead(self, user_id: int, lead_minutes: Optional[int]) -> bool:
+        """Включает напоминания за lead_minutes минут до смены (None - выключает)"""
+        if not await self.db.set_shift_alert(user_id, lead_minutes):
+            return False
+        if lead_minutes is None:
+            self._leads.pop(user_id, None)
+            self._weeks.pop(user_id, None)
+        elif self._window_end is not None:
+            self._leads[user_id] = lead_minutes
+            rows = await self.db.get_user_schedules(user_id, get_week_start_date())
+            if rows is not None:
+                self._weeks[user_id] = {
+                    as_date(row['week_start_date']): row
+                    for row in rows if as_date(row['week_start_date']) <= self._window_end.date()
+                }
+        self._reschedule(user_id)
+        return True
+
+    def _is_stale(self, alert: Alert) -> bool:
+        return (
+            alert.generation != self._generations.get(alert.user_id)
+            or (self._done_until is not None and alert.fire_at <= self._done_until)
+        )
+
+    def _pop_batch(self, fire_at: datetime) -> List[Alert]:
+        batch = []
+        while self._heap and self._heap[0].fire_at <= fire_at:
+            alert = heapq.heappop(self._heap)
+            if not self._is_stale(alert):
+                batch.append(alert)
+        return batch
+
+    async def _send(self, batch: List[Alert]):
+        groups: Dict[Tuple[datetime, Shift], List[int]] = {}
+        for alert in batch:
+            groups.setdefault((alert.start_at, alert.shift), []).append(alert.user_id)
+        for (start_at, shift), user_ids in sorted(groups.items()):
+            # Доставленные напоминания отмечаются в БД: после перезапуска они не повторяются
+            await self.broadcaster.run(f"shift:{start_at:%Y%m%d%H%M}:{shift.end}", user_ids, alert_text(start_at, shift))
+
+    async def _fire(self, fire_at: datetime):
+        """Отправляет пачку напоминаний со временем fire_at, если ее не взяла другая реплика"""
+        async def send(run_at: datetime):
+            await self.reload()
+            await self._send(self._pop_batch(fire_at))
+
+        if not await self.jobs.run_once(JOB_ID, fire_at, send):
+            self._pop_batch(fire_at)
+        self._done_until = fire_at
+
+    async def _wait(self) -> bool:
+        """Ждет ближайшего напоминания, перезагрузки окна или нового более раннего напоминания.
+
+        Возвращает True, если пора отправлять первую пачку кучи.
+        """
+        while self._heap and self._is_stale(self._heap[0]):
+            heapq.heappop(self._heap)
+        now = datetime.now()
+        if self._heap and self._heap[0].fire_at <= now:
+            return True
+        delay = self._reload_at - time.monotonic()
+        if self._heap:
+            delay = min(delay, (self._heap[0].fire_at - now).total_seconds())
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), max(delay, 0))
+        except asyncio.TimeoutError:
+            pass
+        return False
+
+    async def _run(self):
+        while True:
+            try:
+                if time.monotonic() >= self._reload_at:
+                    await self.reload()
+                if await self._wait():
+                    await self._fire(self._heap[0].fire_at)
+            except Exception as e:
+                logger.error(f"Ошибка в рассылке напоминаний о сменах: {e}")
+                await asyncio.sleep(RETRY_DELAY)
@@ -0,0 +1,38 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+from metrics import COALESCED_REQUESTS
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые вычисления.
+
+    Пока вычисление по ключу идет, остальные вызовы с тем же ключом не
+    запускают свое, а ждут его результат (или исключение). Результат не
+    кэшируется: следующий вызов после завершения начинает новое вычисление.
+    Отмена одного из ожидающих не отменяет вычисление для остальных.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        future = self._flights.get(key)
+        if future is None:
+            future = self._flights[key] = asyncio.ensure_future(factory())
+            future.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            COALESCED_REQUESTS.inc(kind=self.kind)
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._flights.get(key) is future:
+            del self._flights[key]
+        # Исключение забирает shield у ожидающих; если их не осталось, не пишем "never retrieved"
+        if not future.cancelled():
+            future.exception()
+
+    def __len__(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,380 @@
+import functools
+import logging
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, List
+from config import Config
+from analytics import HOURS_COLUMNS
+from database import Database, HOT_QUERIES, INSERT_HOURS_SQL, SHIFT_COLUMNS, backfill_schedule_hours
+from metrics import instrument_methods
+from migrations import EXPLAIN_MAX_SCAN_ROWS, Migration
+from utils import WEEK_DAYS
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка миграций между процессами недоступна
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Даты и время хранятся строками ISO; DATE читается обратно как date (как в MySQL)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+
+# Настройки каждого соединения. WAL: читатели не блокируют писателя и друг друга;
+# synchronous=NORMAL в режиме WAL не теряет целостность, только последние
+# транзакции при отключении питания.
+PRAGMAS = (
+    'journal_mode = WAL',
+    'synchronous = NORMAL',
+    'foreign_keys = ON',
+    'temp_store = MEMORY',
+    f'cache_size = -{Config.SQLITE_CACHE_MB * 1024}',
+    'mmap_size = 268435456',
+)
+# Разобранные операторы, которые sqlite3 хранит на каждом соединении
+STATEMENT_CACHE_SIZE = 256
+# Таблица и необязательный псевдоним в FROM/JOIN (для сопоставления с EXPLAIN QUERY PLAN)
+TABLE_REFERENCE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?!(?:WHERE|ON|ORDER|GROUP|LIMIT|JOIN)\b)(\w+))?', re.I)
+
+
+def _dict_row(cursor, row) -> Dict:
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _qmark(sql: str) -> str:
+    return sql.replace('%s', '?')
+
+
+class SQLiteCursor(sqlite3.Cursor):
+    """Курсор, принимающий параметры в стиле MySQL (%s): общие запросы Database работают без изменений"""
+
+    def execute(self, sql, parameters=()):
+        return super().execute(_qmark(sql), parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return super().executemany(_qmark(sql), seq_of_parameters)
+
+
+class SQLiteConnection(sqlite3.Connection):
+    """Соединение sqlite3 с интерфейсом соединения mysql.connector, которым пользуется Database"""
+
+    def cursor(self, dictionary: bool = True, prepared: bool = False):
+        # Строки всегда словари (row_factory); операторы кэширует сам sqlite3
+        return super().cursor(SQLiteCursor)
+
+
+class SQLitePool:
+    """Соединения с файлом SQLite: по одному на поток.
+
+    Потоки пула AsyncDatabase живут все время работы бота, поэтому каждое
+    соединение открывается один раз и больше не проверяется и не передается
+    между потоками. Блокировок на стороне пула нет: в режиме WAL чтения идут
+    параллельно, а запись ждет освобождения файла до SQLITE_BUSY_TIMEOUT секунд.
+    """
+
+    def __init__(self, path: str = Config.SQLITE_PATH, size: int = Config.DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[SQLiteConnection] = []
+
+    def _connect(self) -> SQLiteConnection:
+        connection = sqlite3.connect(
+            self.path,
+            timeout=Config.SQLITE_BUSY_TIMEOUT,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            factory=SQLiteConnection,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            # Соединение используется одним потоком; закрывает их все close() из любого потока
+            check_same_thread=False
+        )
+        connection.row_factory = _dict_row
+        for pragma in PRAGMAS:
+            connection.execute(f"PRAGMA {pragma}")
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """Выдает соединение текущего потока; при ошибке откатывает транзакцию"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        try:
+            yield connection
+        except BaseException:
+            connection.rollback()
+            raise
+
+    def statement(self, connection, sql: str):
+        """Курсор для частого запроса: sqlite3 сам переиспользует разобранный оператор"""
+        return connection.cursor()
+
+    @contextmanager
+    def migration_lock(self, cursor):
+        """Блокировка файла на время миграций (несколько процессов на одной БД)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.migrate.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def table_exists(self, cursor, table: str) -> bool:
+        cursor.execute("SELECT COUNT(*) AS found FROM sqlite_master WHERE type = 'table' AND name = %s", (table,))
+        return bool(cursor.fetchone()['found'])
+
+    def close(self):
+        """Закрывает соединения всех потоков"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for connection in connections:
+            try:
+                # Обновляет статистику планировщика по накопленным запросам
+                connection.execute("PRAGMA optimize")
+                connection.close()
+            except sqlite3.Error:
+                pass
+
+
+USERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        first_name TEXT NOT NULL,
+        last_name TEXT NOT NULL,
+        registered_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+SCHEDULES_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS schedules (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER REFERENCES users(user_id),
+        week_start_date DATE,
+        days_off INTEGER NOT NULL DEFAULT 0,
+        {', '.join(column + ' INTEGER NULL' for column in SHIFT_COLUMNS)},
+        CONSTRAINT unique_user_week UNIQUE (user_id, week_start_date)
+    )
+"""
+
+FSM_STATES_TABLE = """
+    CREATE TABLE IF NOT EXISTS fsm_states (
+        storage_key TEXT PRIMARY KEY,
+        state TEXT NULL,
+        data TEXT NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+JOB_RUNS_TABLE = """
+    CREATE TABLE IF NOT EXISTS job_runs (
+        job_id TEXT NOT NULL,
+        run_at DATETIME NOT NULL,
+        owner TEXT NOT NULL,
+        status TEXT NOT NULL,
+        heartbeat_at DATETIME NOT NULL,
+        finished_at DATETIME NULL,
+        PRIMARY KEY (job_id, run_at)
+    )
+"""
+
+BROADCAST_DELIVERIES_TABLE = """
+    CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+        broadcast_id TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        delivered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (broadcast_id, user_id)
+    )
+"""
+
+# WITHOUT ROWID: строки хранятся в порядке первичного ключа (месяц, сотрудник, неделя)
+SCHEDULE_HOURS_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS schedule_hours (
+        month_start DATE NOT NULL,
+        user_id INTEGER NOT NULL REFERENCES users(user_id),
+        week_start_date DATE NOT NULL,
+        shifts INTEGER NOT NULL,
+        {', '.join(column + ' INTEGER NOT NULL' for column in HOURS_COLUMNS)},
+        PRIMARY KEY (month_start, user_id, week_start_date)
+    ) WITHOUT ROWID
+"""
+
+CALENDAR_FEEDS_TABLE = """
+    CREATE TABLE IF NOT EXISTS calendar_feeds (
+        token TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL UNIQUE REFERENCES users(user_id),
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at DATETIME NOT NULL
+    )
+"""
+
+SHIFT_ALERTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS shift_alerts (
+        user_id INTEGER PRIMARY KEY REFERENCES users(user_id),
+        lead_minutes INTEGER NOT NULL
+    )
+"""
+
+WEEK_VERSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS week_versions (
+        week_start_date DATE PRIMARY KEY,
+        version INTEGER NOT NULL
+    ) WITHOUT ROWID
+"""
+
+def _shift_text_sql(day: str, bit: int) -> str:
+    """SQL-выражение со сменой в текстовом виде «H:MM-H:MM» или «выходной»"""
+    def minutes(column: str) -> str:
+        return f"({column} / 60) || ':' || printf('%02d', {column} % 60)"
+    return (
+        f"CASE WHEN days_off & {1 << bit} OR {day}_start IS NULL THEN 'выходной' "
+        f"ELSE {minutes(day + '_start')} || '-' || {minutes(day + '_end')} END AS {day}"
+    )
+
+SCHEDULES_TEXT_VIEW = f"""
+    CREATE VIEW IF NOT EXISTS schedules_text AS
+    SELECT id, user_id, week_start_date,
+           {', '.join(_shift_text_sql(day, bit) for bit, day in enumerate(WEEK_DAYS))}
+    FROM schedules
+"""
+
+def upsert_schedules_sql(rows: int) -> str:
+    """INSERT ... ON CONFLICT DO UPDATE для rows расписаний одним запросом"""
+    placeholders = '(' + ', '.join(['%s'] * (len(SHIFT_COLUMNS) + 3)) + ')'
+    return f"""
+        INSERT INTO schedules (user_id, week_start_date, days_off, {', '.join(SHIFT_COLUMNS)})
+        VALUES {', '.join([placeholders] * rows)}
+        ON CONFLICT (user_id, week_start_date) DO UPDATE SET
+        days_off = excluded.days_off,
+        {', '.join(f'{column} = excluded.{column}' for column in SHIFT_COLUMNS)}
+    """
+
+# Те же версии, что и у MySQL, чтобы номера миграций означали одно и то же
+MIGRATIONS = [
+    Migration(1, 'initial_schema', (
+        USERS_TABLE, SCHEDULES_TABLE, SCHEDULES_TEXT_VIEW,
+        FSM_STATES_TABLE, JOB_RUNS_TABLE, BROADCAST_DELIVERIES_TABLE,
+        "CREATE INDEX IF NOT EXISTS idx_delivered_at ON broadcast_deliveries (delivered_at)",
+    )),
+    Migration(2, 'hot_query_indexes', (
+        "CREATE INDEX IF NOT EXISTS idx_week_user ON schedules (week_start_date, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_name ON users (last_name, first_name)",
+    )),
+    Migration(3, 'schedule_hours', (SCHEDULE_HOURS_TABLE, backfill_schedule_hours)),
+    Migration(4, 'calendar_feeds', (
+        CALENDAR_FEEDS_TABLE,
+        "CREATE INDEX IF NOT EXISTS idx_updated_at ON calendar_feeds (updated_at)",
+    )),
+    Migration(5, 'shift_alerts', (SHIFT_ALERTS_TABLE,)),
+    Migration(6, 'week_versions', (WEEK_VERSIONS_TABLE,)),
+]
+
+
+@instrument_methods
+class SQLiteDatabase(Database):
+    """Встроенное хранилище в файле SQLite (Config.SQLITE_PATH) для установок на одном узле"""
+
+    Error = sqlite3.Error
+    MIGRATIONS = MIGRATIONS
+
+    REGISTER_USER_SQL = """
+        INSERT INTO users (user_id, first_name, last_name)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (user_id) DO UPDATE SET
+        first_name = excluded.first_name,
+        last_name = excluded.last_name
+    """
+    UPSERT_SCHEDULE_SQL = upsert_schedules_sql(1)
+    UPSERT_HOURS_SQL = INSERT_HOURS_SQL + f"""
+        ON CONFLICT (month_start, user_id, week_start_date) DO UPDATE SET
+        shifts = excluded.shifts,
+        {', '.join(f'{column} = excluded.{column}' for column in HOURS_COLUMNS)}
+    """
+    upsert_schedules_sql = staticmethod(upsert_schedules_sql)
+    SAVE_FSM_RECORD_SQL = """
+        INSERT INTO fsm_states (storage_key, state, data) VALUES (%s, %s, %s)
+        ON CONFLICT (storage_key) DO UPDATE SET
+        state = excluded.state, data = excluded.data, updated_at = CURRENT_TIMESTAMP
+    """
+    MARK_DELIVERED_SQL = "INSERT OR IGNORE INTO broadcast_deliveries (broadcast_id, user_id) VALUES (%s, %s)"
+    PURGE_DELIVERIES_SQL = "DELETE FROM broadcast_deliveries WHERE delivered_at < datetime('now', '-' || %s || ' days')"
+    PURGE_JOB_RUNS_SQL = "DELETE FROM job_runs WHERE run_at < datetime('now', '-' || %s || ' days')"
+    CLAIM_JOB_INSERT_SQL = """
+        INSERT OR IGNORE INTO job_runs (job_id, run_at, owner, status, heartbeat_at)
+        VALUES (%s, %s, %s, 'running', datetime('now'))
+    """
+    CLAIM_JOB_TAKEOVER_SQL = """
+        UPDATE job_runs
+        SET owner = %s, status = 'running', heartbeat_at = datetime('now'), finished_at = NULL
+        WHERE job_id = %s AND run_at = %s
+        AND (status = 'failed'
+             OR (status = 'running' AND heartbeat_at < datetime('now', '-' || %s || ' seconds')))
+    """
+    HEARTBEAT_JOB_SQL = """
+        UPDATE job_runs SET heartbeat_at = datetime('now')
+        WHERE job_id = %s AND run_at = %s AND owner = %s
+    """
+    FINISH_JOB_SQL = """
+        UPDATE job_runs SET status = %s, finished_at = datetime('now')
+        WHERE job_id = %s AND run_at = %s AND owner = %s
+    """
+    MARK_JOB_MISSED_SQL = """
+        INSERT OR IGNORE INTO job_runs (job_id, run_at, owner, status, heartbeat_at)
+        VALUES (%s, %s, '', 'missed', datetime('now'))
+    """
+    SAVE_CALENDAR_TOKEN_SQL = """
+        INSERT INTO calendar_feeds (token, user_id, version, updated_at) VALUES (%s, %s, 0, %s)
+        ON CONFLICT (user_id) DO UPDATE SET
+        token = excluded.token, version = version + 1, updated_at = excluded.updated_at
+    """
+    SAVE_SHIFT_ALERT_SQL = """
+        INSERT INTO shift_alerts (user_id, lead_minutes) VALUES (%s, %s)
+        ON CONFLICT (user_id) DO UPDATE SET lead_minutes = excluded.lead_minutes
+    """
+    BUMP_WEEK_VERSION_SQL = """
+        INSERT INTO week_versions (week_start_date, version) VALUES (%s, 1)
+        ON CONFLICT (week_start_date) DO UPDATE SET version = version + 1
+    """
+
+    def _create_pool(self):
+        return SQLitePool(Config.SQLITE_PATH)
+
+    def check_query_plans(self) -> List[str]:
+        """Проверяет планы частых запросов через EXPLAIN QUERY PLAN.
+
+        Проблемой считается полный просмотр (SCAN) таблицы больше
+        EXPLAIN_MAX_SCAN_ROWS строк: маленькие таблицы планировщик честно
+        читает целиком.
+        """
+        problems = []
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                for name, (sql, params) in HOT_QUERIES.items():
+                    tables = {alias or table: table for table, alias in TABLE_REFERENCE.findall(sql)}
+                    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                    for row in cursor.fetchall():
+                        detail = row['detail']
+                        logger.info(f"{name}: {detail}")
+                        if not detail.startswith('SCAN '):
+                            continue
+                        table = tables.get(detail.split()[1], detail.split()[1])
+                        cursor.execute(f"SELECT COUNT(*) AS found FROM {table}")
+                        rows = cursor.fetchone()['found']
+                        if rows > EXPLAIN_MAX_SCAN_ROWS:
+                            problems.append(f"{name}: полный просмотр таблицы {table} ({rows} строк)")
+            finally:
+                cursor.close()
+        return problems
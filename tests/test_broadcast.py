@@ -0,0 +1,85 @@
+import asyncio
+import time
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from broadcast import Broadcaster
+from config import Config
+from database import AsyncDatabase
+
+
+class FakeBot:
+    """Записывает отправки; errors - исключения для первых попыток по user_id"""
+
+    def __init__(self, errors=None, block=()):
+        self.errors = {user_id: list(items) for user_id, items in (errors or {}).items()}
+        self.block = set(block)
+        self.attempts = []
+        self.sent = []
+        self.blocked = asyncio.Event()
+
+    async def send_message(self, user_id, text, **kwargs):
+        self.attempts.append((user_id, time.monotonic()))
+        if user_id in self.block:
+            self.blocked.set()
+            await asyncio.Event().wait()
+        if self.errors.get(user_id):
+            raise self.errors[user_id].pop(0)
+        self.sent.append(user_id)
+
+
+def register(db, *user_ids):
+    for user_id in user_ids:
+        assert db.register_user(user_id, 'Имя', f'Фамилия{user_id}')
+
+
+def test_retry_after_pauses_and_resends(db):
+    async def scenario():
+        async_db = AsyncDatabase(db)
+        bot = FakeBot(errors={2: [TelegramRetryAfter(None, 'Flood control', 0.2)]})
+        result = await Broadcaster(bot, async_db, concurrency=2, rate=1000).run('news', [1, 2, 3], 'текст')
+        return bot, result
+
+    bot, result = asyncio.run(scenario())
+    assert (result.sent, result.failed, result.skipped) == (3, 0, 0)
+    assert sorted(bot.sent) == [1, 2, 3]
+
+    # Повтор после RetryAfter ждет паузу
+    first, retry = [at for user_id, at in bot.attempts if user_id == 2]
+    assert retry - first >= 0.2
+
+
+def test_failed_users_are_retried_by_next_run(db):
+    async def scenario():
+        async_db = AsyncDatabase(db)
+        forbidden = TelegramForbiddenError(None, 'bot was blocked by the user')
+        first = await Broadcaster(FakeBot(errors={2: [forbidden]}), async_db, rate=1000).run('news', [1, 2, 3], 'текст')
+        bot = FakeBot()
+        second = await Broadcaster(bot, async_db, rate=1000).run('news', [1, 2, 3], 'текст')
+        return first, second, bot
+
+    first, second, bot = asyncio.run(scenario())
+    assert (first.sent, first.failed) == (2, 1)
+    assert (second.total, second.sent, second.skipped) == (3, 1, 2)
+    assert bot.sent == [2]
+
+
+def test_interrupted_broadcast_resumes_from_checkpoint(db, monkeypatch):
+    monkeypatch.setattr(Config, 'BROADCAST_CHECKPOINT_BATCH', 2)
+    register(db, *range(1, 7))
+
+    async def scenario():
+        async_db = AsyncDatabase(db)
+        bot = FakeBot(block={4})
+        task = asyncio.create_task(Broadcaster(bot, async_db, concurrency=1, rate=1000).run('news', None, 'текст'))
+        await bot.blocked.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        # Перезапуск: всем пользователям, доставленные отсеиваются при чтении страниц
+        resumed = FakeBot()
+        result = await Broadcaster(resumed, async_db, rate=1000).run('news', None, 'текст')
+        return bot, resumed, result
+
+    bot, resumed, result = asyncio.run(scenario())
+    assert bot.sent == [1, 2, 3]
+    assert sorted(resumed.sent) == [4, 5, 6]
+    assert (result.total, result.sent) == (3, 3)
@@ -0,0 +1,40 @@
+import asyncio
+from aiohttp.test_utils import TestClient, TestServer
+from calendar_feed import create_calendar_app
+from database import AsyncDatabase
+from utils import get_week_start_date
+
+
+async def fetch(client, token, **headers):
+    response = await client.get(f'/calendar/{token}.ics', headers=headers)
+    return response.status, response.headers, await response.read()
+
+
+def test_feed_conditional_get(db):
+    assert db.register_user(1, 'Иван', 'Петров')
+    assert db.save_schedule(1, get_week_start_date(), {'monday': '9-18'})
+    token = db.get_calendar_token(1)
+
+    async def scenario():
+        async with TestClient(TestServer(create_calendar_app(AsyncDatabase(db)))) as client:
+            status, headers, body = await fetch(client, token)
+            assert status == 200 and headers['Content-Type'].startswith('text/calendar')
+            assert body.count(b'BEGIN:VEVENT') == 1
+            etag, last_modified = headers['ETag'], headers['Last-Modified']
+
+            # Та же версия: 304 без тела, с теми же валидаторами
+            status, headers, body = await fetch(client, token, **{'If-None-Match': etag})
+            assert (status, body, headers['ETag']) == (304, b'', etag)
+            status, _, _ = await fetch(client, token, **{'If-Modified-Since': last_modified})
+            assert status == 304
+
+            # Изменение расписания меняет ETag: старый валидатор уже не подходит
+            assert db.save_schedule(1, get_week_start_date(), {'tuesday': '10-19'})
+            status, headers, body = await fetch(client, token, **{'If-None-Match': etag})
+            assert status == 200 and headers['ETag'] != etag
+            assert b'T100000' in body and b'T090000' not in body
+
+            status, _, _ = await fetch(client, '0' * 32)
+            assert status == 404
+
+    asyncio.run(scenario())
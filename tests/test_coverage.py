@@ -0,0 +1,20 @@
+from coverage import Coverage
+from utils import Shift
+
+
+def test_who_matches_headcount_slots():
+    roster = [
+        {'last_name': 'Петров', 'first_name': 'Иван', 'monday': Shift(9 * 60, 18 * 60)},
+        {'last_name': 'Андреева', 'first_name': 'Анна', 'monday': Shift(14 * 60 + 20, 20 * 60)},
+        {'last_name': 'Орлов', 'first_name': 'Олег', 'sunday': Shift(22 * 60, 6 * 60)},
+    ]
+    coverage = Coverage(roster, slot_minutes=30)
+
+    # Смена с 14:20 занимает слот 14:00-14:30 частично: ее видят и who, и headcount
+    assert coverage.who('monday', 14 * 60 + 5) == ['Андреева Анна', 'Петров Иван']
+    assert coverage.headcount('monday', 14 * 60 + 5) == 2
+    assert coverage.who('monday', 18 * 60) == ['Андреева Анна']
+    assert coverage.who('sunday', 23 * 60 + 59) == ['Орлов Олег']
+    for day in ('monday', 'sunday'):
+        for minute in range(0, 24 * 60, 10):
+            assert len(coverage.who(day, minute)) == coverage.headcount(day, minute)
@@ -0,0 +1,249 @@
+import asyncio
+import time
+from datetime import date, timedelta
+from database import AsyncDatabase, utc_now
+from utils import WEEK_DAYS, Shift
+
+WEEK = date(2024, 1, 29)  # неделя на стыке января и февраля
+NEXT_WEEK = WEEK + timedelta(weeks=1)
+
+
+def register(db, *users):
+    for user_id, first_name, last_name in users:
+        assert db.register_user(user_id, first_name, last_name)
+
+
+def test_register_user(db):
+    assert not db.is_user_registered(1)
+    register(db, (1, 'Иван', 'Петров'))
+    assert db.is_user_registered(1)
+    assert db.get_user_name(1) == 'Петров Иван'
+
+    # Повторная регистрация обновляет ФИО
+    register(db, (1, 'Иван', 'Сидоров'))
+    assert db.load_user_name(1) == 'Сидоров Иван'
+
+
+def test_save_schedule_and_get_week(db):
+    register(db, (1, 'Иван', 'Петров'), (2, 'Анна', 'Андреева'))
+    assert db.save_schedule(1, WEEK, {'monday': '9-18', 'tuesday': '10:30-19:00', 'friday': '22-6'})
+    assert db.save_schedule(2, WEEK, {day: 'выходной' for day in WEEK_DAYS})
+
+    roster = db.get_week_schedule(WEEK)
+    assert [entry['user_id'] for entry in roster] == [2, 1]
+    assert all(roster[0][day] is None for day in WEEK_DAYS)
+    petrov = roster[1]
+    assert petrov['monday'] == Shift(9 * 60, 18 * 60)
+    assert petrov['tuesday'] == Shift(10 * 60 + 30, 19 * 60)
+    assert petrov['friday'] == Shift(22 * 60, 6 * 60)
+    assert petrov['wednesday'] is None
+
+    # Сохранение сбрасывает кэш недели: повторное чтение видит изменение
+    assert db.save_schedule(1, WEEK, {'monday': '8-17'})
+    assert db.get_week_schedule(WEEK)[1]['monday'] == Shift(8 * 60, 17 * 60)
+    assert db.get_week_schedule(NEXT_WEEK) == ()
+
+
+def test_save_schedule_rejects_invalid_time(db):
+    register(db, (1, 'Иван', 'Петров'))
+    assert not db.save_schedule(1, WEEK, {'monday': '25-30'})
+    assert db.get_week_schedule(WEEK) == ()
+
+
+def test_save_schedules_bulk(db):
+    users = [(user_id, f'Имя{user_id}', f'Фамилия{user_id:03d}') for user_id in range(1, 8)]
+    register(db, *users)
+    entries = [(user_id, {day: Shift(9 * 60, 18 * 60) for day in WEEK_DAYS[:5]}) for user_id, _, _ in users]
+    assert db.save_schedules_bulk(WEEK, entries)
+
+    roster = db.load_week_schedule(WEEK)
+    assert [entry['user_id'] for entry in roster] == list(range(1, 8))
+    assert all(entry['saturday'] is None and entry['monday'] == Shift(540, 1080) for entry in roster)
+
+    # Повторная загрузка обновляет существующие строки
+    assert db.save_schedules_bulk(WEEK, [(1, {'sunday': Shift(600, 660)})])
+    roster = db.get_week_schedule(WEEK)
+    assert len(roster) == 7
+    assert roster[0]['monday'] is None and roster[0]['sunday'] == Shift(600, 660)
+
+
+def test_week_cache_revalidates_across_replicas(db):
+    register(db, (1, 'Иван', 'Петров'))
+    replica = type(db)(migrate=False)
+    try:
+        assert db.save_schedule(1, WEEK, {'monday': '9-18'})
+        cached = replica.get_week_schedule(WEEK)
+        replica.rosters.set_view(cached, 'text', 'понедельник 9-18')
+
+        # Без изменений сверка с версией в БД сохраняет снимок и его представления
+        replica.rosters.revalidate = 0
+        assert replica.get_week_schedule(WEEK) is cached
+        assert replica.rosters.get_view(cached, 'text') == 'понедельник 9-18'
+
+        # Запись с другой реплики видна после сверки, представления сбрасываются
+        assert db.save_schedule(1, WEEK, {'monday': '10-19'})
+        roster = replica.get_week_schedule(WEEK)
+        assert roster.version == cached.version + 1
+        assert roster[0]['monday'] == Shift(600, 1140)
+        assert replica.rosters.get_view(roster, 'text') is None
+    finally:
+        replica.close()
+
+
+def test_hours_by_month(db):
+    register(db, (1, 'Иван', 'Петров'))
+    # Понедельник и вторник - январь, суббота - февраль
+    assert db.save_schedule(1, WEEK, {'monday': '9-18', 'tuesday': '9-13', 'saturday': '10-14'})
+    rows = {row['month_start']: row for row in db.get_hours_by_month(date(2024, 1, 1), date(2024, 2, 1))}
+    assert rows[date(2024, 1, 1)]['shifts'] == 2
+    assert rows[date(2024, 1, 1)]['monday_minutes'] == 540
+    assert rows[date(2024, 1, 1)]['tuesday_minutes'] == 240
+    assert rows[date(2024, 2, 1)]['shifts'] == 1
+    assert rows[date(2024, 2, 1)]['saturday_minutes'] == 240
+
+    # Пересохранение недели заменяет ее строки в агрегате, а не добавляет
+    assert db.save_schedule(1, WEEK, {'monday': '9-18'})
+    rows = db.get_hours_by_month(date(2024, 1, 1), date(2024, 2, 1))
+    assert sorted((row['month_start'], row['shifts']) for row in rows) == [(date(2024, 1, 1), 1), (date(2024, 2, 1), 0)]
+
+
+def test_calendar_feed(db):
+    register(db, (1, 'Иван', 'Петров'))
+    token = db.get_calendar_token(1)
+    assert len(token) == 32
+    assert db.get_calendar_token(1) == token
+
+    feed = db.get_calendar_feed(token)
+    assert (feed.user_id, feed.version) == (1, 0)
+
+    # Сохранение расписания увеличивает версию ленты
+    assert db.save_schedule(1, WEEK, {'monday': '9-18'})
+    assert db.get_calendar_feed(token).version == 1
+    assert db.save_schedules_bulk(NEXT_WEEK, [(1, {'monday': Shift(540, 1080)})])
+    assert db.get_calendar_feed(token).version == 2
+    assert [entry['week_start_date'] for entry in db.get_user_schedules(1, WEEK)] == [WEEK, NEXT_WEEK]
+
+    # Новая ссылка заменяет старую
+    renewed = db.get_calendar_token(1, renew=True)
+    assert renewed != token
+    assert db.get_calendar_feed(token) is None
+    assert db.get_calendar_feed(renewed).version == 3
+
+
+def test_refresh_calendar_feeds(db):
+    register(db, (1, 'Иван', 'Петров'))
+    token = db.get_calendar_token(1)
+    since = utc_now() - timedelta(minutes=1)
+    assert db.save_schedule(1, WEEK, {'monday': '9-18'})
+
+    # Изменение из другой реплики попадает в кэш без обращения по токену
+    db.calendar_feeds.discard_users((1,))
+    assert db.refresh_calendar_feeds(since) >= since
+    assert db.calendar_feeds.get(token).version == 1
+
+
+def test_shift_alerts(db):
+    register(db, (1, 'Иван', 'Петров'), (2, 'Анна', 'Андреева'), (3, 'Олег', 'Орлов'))
+    assert db.save_schedule(1, WEEK, {'monday': '9-18'})
+    assert db.save_schedule(3, WEEK, {'tuesday': '9-18'})
+    assert db.set_shift_alert(1, 30)
+    assert db.set_shift_alert(2, 60)
+    assert db.get_shift_alert(1) == 30
+    assert db.get_shift_alert(3) is None
+
+    rows = {row['user_id']: row for row in db.get_shift_alerts(WEEK, NEXT_WEEK)}
+    assert set(rows) == {1, 2}
+    assert rows[1]['lead_minutes'] == 30 and rows[1]['monday'] == Shift(540, 1080)
+    assert rows[2]['week_start_date'] is None
+
+    assert db.set_shift_alert(1, 15)
+    assert db.set_shift_alert(2, None)
+    assert db.get_shift_alert(1) == 15
+    assert [row['user_id'] for row in db.get_shift_alerts(WEEK, NEXT_WEEK)] == [1]
+
+
+def test_iter_users(db):
+    register(db, *[(user_id, 'Имя', f'Фамилия{user_id}') for user_id in (5, 3, 9, 1, 7)])
+    assert [user['user_id'] for user in db.iter_users(batch_size=2)] == [1, 3, 5, 7, 9]
+    assert [user['user_id'] for user in db.iter_users(batch_size=5)] == [1, 3, 5, 7, 9]
+
+
+def test_undelivered_users(db):
+    register(db, *[(user_id, 'Имя', f'Фамилия{user_id}') for user_id in range(1, 8)])
+    assert db.mark_delivered('news', [2, 3, 6])
+    assert db.mark_delivered('other', [1])
+    assert db.get_delivered_users('news', [1, 2, 6, 9]) == {2, 6}
+
+    # Доставленные отсеиваются в запросе, страница продолжается после последнего выданного
+    assert db.get_undelivered_users_page('news', 0, 2) == [1, 4]
+    assert db.get_undelivered_users_page('news', 4, 2) == [5, 7]
+    assert db.get_undelivered_users_page('news', 7, 2) == []
+
+
+def set_heartbeat(db, run_at, heartbeat_at):
+    with db._cursor(commit=True) as cursor:
+        cursor.execute("UPDATE job_runs SET heartbeat_at = %s WHERE run_at = %s", (heartbeat_at, run_at))
+
+
+def test_job_runs_claim_and_heartbeat(db):
+    run_at = utc_now().replace(microsecond=0)
+    assert db.claim_job_run('daily', run_at, 'a', 300)
+    assert not db.claim_job_run('daily', run_at, 'b', 300)
+
+    # Владелец с heartbeat удерживает запуск, без heartbeat запуск перехватывается
+    set_heartbeat(db, run_at, utc_now() - timedelta(hours=1))
+    assert db.heartbeat_job_run('daily', run_at, 'a')
+    assert not db.claim_job_run('daily', run_at, 'b', 60)
+    set_heartbeat(db, run_at, utc_now() - timedelta(hours=1))
+    assert db.claim_job_run('daily', run_at, 'b', 60)
+
+    # Завершенный запуск не перехватывается, завершившийся ошибкой - перехватывается
+    assert db.finish_job_run('daily', run_at, 'b', 'done')
+    assert not db.claim_job_run('daily', run_at, 'a', 0)
+    other = run_at + timedelta(days=1)
+    assert db.claim_job_run('daily', other, 'a', 300)
+    assert db.finish_job_run('daily', other, 'a', 'failed')
+    assert db.claim_job_run('daily', other, 'b', 300)
+
+
+def test_mark_job_missed(db):
+    run_at = utc_now().replace(microsecond=0)
+    assert db.mark_job_missed('daily', run_at)
+    assert not db.mark_job_missed('daily', run_at)
+    assert not db.claim_job_run('daily', run_at, 'a', 300)
+
+
+def test_purge_job_runs(db):
+    now = utc_now().replace(microsecond=0)
+    old, recent = now - timedelta(days=20), now - timedelta(days=2)
+    for run_at in (old, recent):
+        assert db.claim_job_run('shift_alerts', run_at, 'a', 300)
+        assert db.finish_job_run('shift_alerts', run_at, 'a', 'done')
+
+    # Запись о запуске осталась только у недавнего: отметка пропуска вставляется лишь для старого
+    assert db.purge_job_runs(14)
+    assert db.mark_job_missed('shift_alerts', old)
+    assert not db.mark_job_missed('shift_alerts', recent)
+
+
+def test_async_close_does_not_block_loop(db):
+    async def scenario():
+        async_db = AsyncDatabase(db)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        query = asyncio.create_task(async_db._run(time.sleep, 0.3))
+        await asyncio.sleep(0)
+        await async_db.close()
+        task.cancel()
+        assert query.done()
+        return ticks
+
+    # Пока close ждет запрос, event loop продолжает работать
+    assert asyncio.run(scenario()) > 10
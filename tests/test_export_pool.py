@@ -0,0 +1,36 @@
+import asyncio
+import time
+import pytest
+from export_pool import ExportPool, ExportRejected
+
+
+def slow_render(seconds: float) -> bytes:
+    time.sleep(seconds)
+    return b'xlsx'
+
+
+def test_timed_out_export_keeps_slot_until_done():
+    async def scenario():
+        pool = ExportPool('thread', workers=1, max_queue=0, timeout=0.05)
+        try:
+            with pytest.raises(ExportRejected) as rejected:
+                await pool.render('week', slow_render, 0.3)
+            assert rejected.value.reason == 'timeout'
+
+            # Начатая выгрузка еще занимает воркер: новая отклоняется сразу
+            assert pool.pending == 1
+            with pytest.raises(ExportRejected) as rejected:
+                await pool.render('week', slow_render, 0)
+            assert rejected.value.reason == 'queue_full'
+
+            for _ in range(100):
+                if not pool.pending:
+                    break
+                await asyncio.sleep(0.01)
+            assert pool.pending == 0
+            assert await pool.render('week', slow_render, 0) == b'xlsx'
+            assert pool.pending == 0
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,49 @@
+import asyncio
+from aiogram.fsm.storage.base import StorageKey
+from database import AsyncDatabase
+from fsm_storage import DatabaseStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+def test_failed_save_is_retried(db):
+    async def scenario():
+        async_db = AsyncDatabase(db)
+        save = async_db.save_fsm_records
+        calls = []
+
+        async def flaky_save(records):
+            calls.append(records)
+            return len(calls) > 1 and await save(records)
+
+        async_db.save_fsm_records = flaky_save
+        storage = DatabaseStorage(async_db, flush_interval=0.01)
+        await storage.set_state(None, KEY, 'form:name')
+        await storage.set_data(None, KEY, {'name': 'Иван'})
+
+        # Первая запись не проходит, повтор сохраняет изменения без новых set_*
+        for _ in range(100):
+            if len(calls) > 1 and not storage._dirty:
+                break
+            await asyncio.sleep(0.01)
+        assert len(calls) == 2
+        assert await async_db.get_fsm_record(storage._key(KEY)) == ('form:name', '{"name": "Иван"}')
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_reads_see_other_replica_writes(db):
+    async def scenario():
+        async_db = AsyncDatabase(db)
+        first, second = DatabaseStorage(async_db), DatabaseStorage(async_db)
+        assert await first.get_state(None, KEY) is None
+
+        await second.set_state(None, KEY, 'form:name')
+        await second.flush()
+        # Прочитанное из БД не кэшируется: первая реплика видит чужую запись сразу
+        assert await first.get_state(None, KEY) == 'form:name'
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from config import Config
+from database import AsyncDatabase
+from jobs import JobRunner, _run_key, last_fire_time
+
+RUN_AT = datetime(2024, 1, 29, 9, 0)
+
+
+def test_one_replica_runs_each_job_run(db):
+    async def scenario():
+        async_db = AsyncDatabase(db)
+        calls = []
+
+        async def job(run_at):
+            calls.append(run_at)
+            await asyncio.sleep(0.05)
+
+        replicas = [JobRunner(AsyncIOScheduler(), async_db, owner) for owner in ('a', 'b', 'c')]
+        ran = await asyncio.gather(*(replica.run_once('daily', RUN_AT, job) for replica in replicas))
+        return calls, ran
+
+    calls, ran = asyncio.run(scenario())
+    assert calls == [RUN_AT]
+    assert sorted(ran) == [False, False, True]
+
+
+def test_failed_run_is_taken_by_another_replica(db):
+    async def scenario():
+        async_db = AsyncDatabase(db)
+
+        async def failing(run_at):
+            raise RuntimeError("нет связи")
+
+        async def job(run_at):
+            pass
+
+        first = await JobRunner(AsyncIOScheduler(), async_db, 'a').run_once('daily', RUN_AT, failing)
+        second = await JobRunner(AsyncIOScheduler(), async_db, 'b').run_once('daily', RUN_AT, job)
+        third = await JobRunner(AsyncIOScheduler(), async_db, 'c').run_once('daily', RUN_AT, job)
+        return first, second, third
+
+    assert asyncio.run(scenario()) == (False, True, False)
+
+
+def test_catch_up_runs_recent_and_marks_old_runs(db, monkeypatch):
+    monkeypatch.setattr(Config, 'JOB_MISFIRE_GRACE', 3600)
+    now = datetime.now()
+    recent_trigger = CronTrigger(hour=now.hour, minute=now.minute)
+    old_trigger = CronTrigger(hour=(now - timedelta(hours=3)).hour, minute=0)
+
+    async def scenario():
+        async_db = AsyncDatabase(db)
+        calls = []
+
+        async def job(run_at):
+            calls.append(run_at)
+
+        replicas = []
+        for owner in ('a', 'b'):
+            runner = JobRunner(AsyncIOScheduler(), async_db, owner)
+            runner.add_job('recent', job, recent_trigger)
+            runner.add_job('old', job, old_trigger)
+            replicas.append(runner)
+
+        # Вторая реплика при старте не повторяет уже догнанный запуск
+        for runner in replicas:
+            await runner.catch_up()
+        return calls
+
+    calls = asyncio.run(scenario())
+    assert calls == [last_fire_time(recent_trigger, datetime.now(recent_trigger.timezone))]
+
+    # Старый запуск не выполнен, а отмечен как пропущенный: занять его уже нельзя
+    old_run = last_fire_time(old_trigger, datetime.now(old_trigger.timezone))
+    assert not db.claim_job_run('old', _run_key(old_run), 'c', Config.JOB_LEASE)
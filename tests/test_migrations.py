@@ -0,0 +1,39 @@
+from datetime import date, timedelta
+import database
+from migrations import EXPLAIN_MAX_SCAN_ROWS
+from utils import WEEK_DAYS, Shift
+
+# Больше EXPLAIN_MAX_SCAN_ROWS строк в каждой таблице частых запросов:
+# полный просмотр любой из них считается проблемой плана
+USERS = EXPLAIN_MAX_SCAN_ROWS + 20
+WEEKS = EXPLAIN_MAX_SCAN_ROWS + 5
+FIRST_WEEK = date(2024, 1, 1)
+
+
+def populate(db):
+    for user_id in range(1, USERS + 1):
+        assert db.register_user(user_id, f'Имя{user_id}', f'Фамилия{user_id}')
+        assert db.get_calendar_token(user_id)
+        assert db.set_shift_alert(user_id, 30)
+    shifts = {day: Shift(9 * 60, 18 * 60) for day in WEEK_DAYS[:5]}
+    for week in range(WEEKS):
+        assert db.save_schedules_bulk(FIRST_WEEK + timedelta(weeks=week), [(user_id, shifts) for user_id in range(1, USERS + 1)])
+    assert db.save_fsm_records([(f'fsm:{user_id}', None, f'{{"user": {user_id}}}') for user_id in range(1, USERS + 1)])
+    with db._cursor(commit=True) as cursor:
+        if isinstance(db, database.MySQLDatabase):
+            cursor.execute("ANALYZE TABLE users, schedules, week_versions, fsm_states, schedule_hours, calendar_feeds")
+            cursor.fetchall()
+        else:
+            cursor.execute("ANALYZE")
+
+
+def test_hot_queries_use_indexes(db):
+    populate(db)
+    assert db.check_query_plans() == []
+
+
+def test_query_plan_check_reports_full_scan(db, monkeypatch):
+    populate(db)
+    monkeypatch.setitem(database.HOT_QUERIES, 'by_first_name', ("SELECT user_id FROM users WHERE first_name = %s", ('',)))
+    problems = db.check_query_plans()
+    assert len(problems) == 1 and problems[0].startswith('by_first_name: полный просмотр таблицы users')
@@ -0,0 +1,68 @@
+import asyncio
+import heapq
+from datetime import date, timedelta
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from config import Config
+from database import AsyncDatabase
+from jobs import JobRunner
+from shift_alerts import ShiftAlertDispatcher
+from utils import WEEK_DAYS, get_week_start_date
+
+TOMORROW = date.today() + timedelta(days=1)
+WEEK = get_week_start_date(TOMORROW)
+DAY = WEEK_DAYS[TOMORROW.weekday()]
+
+
+class FakeBroadcaster:
+    def __init__(self):
+        self.runs = []
+
+    async def run(self, broadcast_id, user_ids, text, **kwargs):
+        self.runs.append((broadcast_id, sorted(user_ids)))
+
+
+async def drain(dispatcher):
+    """Отправляет все пачки кучи по порядку, не дожидаясь их времени"""
+    while True:
+        while dispatcher._heap and dispatcher._is_stale(dispatcher._heap[0]):
+            heapq.heappop(dispatcher._heap)
+        if not dispatcher._heap:
+            return
+        await dispatcher._fire(dispatcher._heap[0].fire_at)
+
+
+def test_alerts_are_sent_in_order_and_cancelled(db, monkeypatch):
+    monkeypatch.setattr(Config, 'SHIFT_ALERT_WINDOW', 3 * 24 * 3600)
+    shifts = {1: ('10-18', 60), 2: ('9-17', 30), 3: ('10-18', 60), 4: ('8-12', 15)}
+    for user_id, (shift, lead) in shifts.items():
+        assert db.register_user(user_id, 'Имя', f'Фамилия{user_id}')
+        assert db.save_schedule(user_id, WEEK, {DAY: shift})
+        assert db.set_shift_alert(user_id, lead)
+
+    async def scenario():
+        async_db = AsyncDatabase(db)
+        broadcaster = FakeBroadcaster()
+        dispatcher = ShiftAlertDispatcher(broadcaster, async_db, JobRunner(AsyncIOScheduler(), async_db, 'a'))
+        assert await dispatcher.reload()
+
+        # Отписка снимает напоминание, перенос смены переставляет его в куче
+        assert await dispatcher.set_lead(4, None)
+        assert db.save_schedule(2, WEEK, {DAY: '11-19'})
+        dispatcher.schedule_changed(2, WEEK, db.get_user_schedules(2, WEEK)[0])
+        await drain(dispatcher)
+
+        # Другая реплика не отправляет уже отправленные пачки
+        replica = ShiftAlertDispatcher(FakeBroadcaster(), async_db, JobRunner(AsyncIOScheduler(), async_db, 'b'))
+        assert await replica.reload()
+        await drain(replica)
+
+        dispatcher.start()
+        await asyncio.sleep(0)
+        await dispatcher.close()
+        return broadcaster.runs, replica.broadcaster.runs, dispatcher._task
+
+    runs, replica_runs, task = asyncio.run(scenario())
+    day = f"{TOMORROW:%Y%m%d}"
+    assert runs == [(f"shift:{day}1000:1080", [1, 3]), (f"shift:{day}1100:1140", [2])]
+    assert replica_runs == []
+    assert task is None
@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    async def scenario():
+        flights = SingleFlight('test')
+        calls = []
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return len(calls)
+
+        waiters = [asyncio.create_task(flights.run('week', compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert len(flights) == 1
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        # Результат не кэшируется: следующий вызов считает заново
+        assert await flights.run('week', compute) == 2
+        return results, len(flights)
+
+    assert asyncio.run(scenario()) == ([1] * 5, 0)
+
+
+def test_error_reaches_every_waiter():
+    async def scenario():
+        flights = SingleFlight('test')
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("сбой")
+
+        results = await asyncio.gather(*(flights.run('week', compute) for _ in range(3)), return_exceptions=True)
+        return results, len(flights)
+
+    results, pending = asyncio.run(scenario())
+    assert [type(result) for result in results] == [ValueError] * 3
+    assert pending == 0
+
+
+def test_cancelled_waiter_does_not_cancel_others():
+    async def scenario():
+        flights = SingleFlight('test')
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return 'xlsx'
+
+        first = asyncio.create_task(flights.run('week', compute))
+        second = asyncio.create_task(flights.run('week', compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == 'xlsx'
@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+from throttling import THROTTLED_MESSAGE, ThrottlingMiddleware
+
+
+class FakeMessage:
+    def __init__(self):
+        self.answers = []
+
+    async def answer(self, text):
+        self.answers.append(text)
+
+
+def call(middleware, handler, event, user_id=1):
+    return middleware(handler, event, {'event_from_user': SimpleNamespace(id=user_id)})
+
+
+def test_burst_then_refill(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('throttling.time', SimpleNamespace(monotonic=lambda: now[0]))
+
+    async def scenario():
+        middleware = ThrottlingMiddleware(rate=1, burst=2, concurrency=5)
+        message = FakeMessage()
+        handled = []
+
+        async def handler(event, data):
+            handled.append(event)
+            return 'ok'
+
+        results = [await call(middleware, handler, message) for _ in range(4)]
+        # Другой пользователь ограничивается отдельно
+        other = await call(middleware, handler, FakeMessage(), user_id=2)
+        now[0] += 1
+        refilled = await call(middleware, handler, message)
+        return results, other, refilled, message.answers, len(handled)
+
+    results, other, refilled, answers, handled = asyncio.run(scenario())
+    assert results == ['ok', 'ok', None, None]
+    # Предупреждение отправляется один раз, пока лимит не восстановится
+    assert answers == [THROTTLED_MESSAGE]
+    assert (other, refilled, handled) == ('ok', 'ok', 4)
+
+
+def test_concurrency_limit():
+    async def scenario():
+        middleware = ThrottlingMiddleware(rate=100, burst=100, concurrency=1)
+        release = asyncio.Event()
+
+        async def slow(event, data):
+            await release.wait()
+            return 'slow'
+
+        async def fast(event, data):
+            return 'fast'
+
+        running = asyncio.create_task(call(middleware, slow, FakeMessage()))
+        await asyncio.sleep(0)
+        rejected = await call(middleware, fast, FakeMessage())
+        release.set()
+        finished = await running
+        return rejected, finished, await call(middleware, fast, FakeMessage())
+
+    assert asyncio.run(scenario()) == (None, 'slow', 'fast')
+
+
+def test_updates_without_user_are_not_limited():
+    async def scenario():
+        middleware = ThrottlingMiddleware(rate=1, burst=1)
+
+        async def handler(event, data):
+            return 'ok'
+
+        return [await middleware(handler, FakeMessage(), {}) for _ in range(3)]
+
+    assert asyncio.run(scenario()) == ['ok'] * 3
@@ -0,0 +1,62 @@
+import pytest
+from utils import WEEK_DAYS, Shift, parse_schedule, parse_shift
+
+NINE_TO_SIX = Shift(9 * 60, 18 * 60)
+
+
+def test_parse_shift():
+    assert parse_shift('9-18') == NINE_TO_SIX
+    assert parse_shift('10:30 – 19:00') == Shift(10 * 60 + 30, 19 * 60)
+    assert parse_shift('22-6') == Shift(22 * 60, 6 * 60)
+    assert parse_shift(' Выходной ') is None
+    for text in ('25-30', '9-9', '9:60-18', 'утро'):
+        with pytest.raises(ValueError):
+            parse_shift(text)
+
+
+@pytest.mark.parametrize('text', [
+    'пн-пт: 9-18; сб-вс: выходной',
+    'Понедельник 9-18\nвторник 9-18\nсреда 9-18\nчетверг 9-18\nпятница 9-18\nсуббота выходной\nвоскресенье вых',
+    # Тире между днем и значением
+    'Понедельник - 9-18\nВторник - 9-18\nсреда - 9-18\nчт — 9-18\nпт - 9-18\nсб - выходной\nвс - выходной',
+    # Перечисление дней через запятую
+    'пн, вт, ср-пт: 9-18\nсб, вс: выходной',
+])
+def test_parse_schedule_formats(text):
+    schedule, errors = parse_schedule(text)
+    assert errors == []
+    assert schedule == {day: NINE_TO_SIX if day not in ('saturday', 'sunday') else None for day in WEEK_DAYS}
+
+
+def test_parse_schedule_single_days():
+    assert parse_schedule('среда - выходной') == ({day: None for day in WEEK_DAYS}, [])
+    schedule, errors = parse_schedule('Понедельник - 9-18')
+    assert errors == [] and schedule['monday'] == NINE_TO_SIX
+    assert parse_schedule('сб, вс: выходной') == ({day: None for day in WEEK_DAYS}, [])
+
+
+def test_parse_schedule_missing_days_are_days_off():
+    schedule, errors = parse_schedule('пн-пт: 9-18')
+    assert errors == []
+    assert schedule == {day: NINE_TO_SIX if day not in ('saturday', 'sunday') else None for day in WEEK_DAYS}
+
+
+def test_parse_schedule_range_wraps_week():
+    schedule, errors = parse_schedule('пт-пн 9-18, вт-чт вых')
+    assert errors == []
+    assert [day for day, shift in schedule.items() if shift] == ['friday', 'saturday', 'sunday', 'monday']
+
+
+def errors_of(text):
+    return [(error.fragment, error.message) for error in parse_schedule(text)[1]]
+
+
+def test_parse_schedule_errors():
+    assert errors_of('пн-вс 25-30') == [('25-30', 'Некорректное время: 25-30')]
+    assert errors_of('пн-вс 9-9') == [('9-9', 'Смена нулевой длительности: 9-9')]
+    assert errors_of('пн-сб 9-18, сред 9-18') == [('сред', 'неизвестный день недели')]
+    assert errors_of('пн вт-вс 9-18') == [('пн', 'не указано время')]
+    assert errors_of('пн, пн-вс: 9-18') == [('пн, пн-вс', 'день указан повторно')]
+    assert errors_of('9-18 пн-вс 9-18') == [('9-18', 'не указан день')]
+    assert errors_of('пн-вс 9-18 ???') == [('???', 'непонятный фрагмент')]
+    assert errors_of('') == [('', 'не указан ни один день')]
@@ -0,0 +1,78 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from aiogram.types import CallbackQuery
+from config import Config
+from metrics import THROTTLED_UPDATES
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_MESSAGE = "⏳ Слишком много запросов. Подождите несколько секунд."
+
+
+class ThrottlingMiddleware:
+    """Middleware aiogram: ограничивает частоту и параллельность обновлений от одного пользователя.
+
+    У каждого пользователя корзина на burst обновлений, которая пополняется
+    со скоростью rate в секунду, и не больше concurrency обработчиков
+    одновременно. Лишние обновления отбрасываются до обработчиков и запросов
+    к БД: нажатию кнопки отвечает всплывающее уведомление, на сообщения
+    приходит одно предупреждение, пока лимит не восстановится.
+    Один экземпляр нужно подключать ко всем типам событий, чтобы лимит был общим.
+    """
+
+    def __init__(self, rate: float = Config.THROTTLE_RATE, burst: int = Config.THROTTLE_BURST,
+                 concurrency: int = Config.THROTTLE_CONCURRENCY, max_users: int = Config.THROTTLE_MAX_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_users = max_users
+        # user_id -> [токены, время пополнения, обработчиков в работе, предупрежден]
+        self._users: OrderedDict = OrderedDict()
+
+    def _acquire(self, user_id: int) -> Optional[List]:
+        """Занимает место для обновления; None, если лимит пользователя исчерпан"""
+        now = time.monotonic()
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = [float(self.burst), now, 0, False]
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+            state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+
+        if state[0] < 1 or state[2] >= self.concurrency:
+            return None
+        state[0] -= 1
+        state[2] += 1
+        state[3] = False
+        return state
+
+    async def _reject(self, event, user_id: int):
+        state = self._users[user_id]
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(THROTTLED_MESSAGE)
+            elif not state[3] and hasattr(event, 'answer'):
+                state[3] = True
+                await event.answer(THROTTLED_MESSAGE)
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить пользователю {user_id} об ограничении: {e}")
+
+    async def __call__(self, handler, event, data: Dict[str, Any]) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        state = self._acquire(user.id)
+        if state is None:
+            THROTTLED_UPDATES.inc(event=type(event).__name__)
+            await self._reject(event, user.id)
+            return None
+        try:
+            return await handler(event, data)
+        finally:
+            state[2] -= 1
@@ -1,54 +1,204 @@
 import re
+from functools import lru_cache
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, NamedTuple, Tuple
 
-def parse_schedule_text(text: str) -> Dict[str, str]:
-    """Парсит текст с расписанием в словарь"""
-    schedule = {}
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
+WEEK_DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DAY_NAMES_RU = {
+    'понедельник': 'monday',
+    'вторник': 'tuesday',
+    'среда': 'wednesday',
+    'четверг': 'thursday',
+    'пятница': 'friday',
+    'суббота': 'saturday',
+    'воскресенье': 'sunday'
+}
+DAY_ABBREVIATIONS_RU = {
+    'пн': 'monday',
+    'вт': 'tuesday',
+    'ср': 'wednesday',
+    'чт': 'thursday',
+    'пт': 'friday',
+    'сб': 'saturday',
+    'вс': 'sunday'
+}
+MINUTES_IN_DAY = 24 * 60
+DAY_OFF = 'выходной'
+
+SHIFT_PATTERN = re.compile(r'^(\d{1,2})(?::(\d{2}))?\s*[-–—]\s*(\d{1,2})(?::(\d{2}))?$')
+TIME_PATTERN = re.compile(r'^(\d{1,2})(?::(\d{2}))?$')
+
+class Shift(NamedTuple):
+    """Смена: начало и конец в минутах от начала суток.
+
+    Конец меньше начала означает смену через полночь.
+    """
+    start: int
+    end: int
+
+    @property
+    def duration(self) -> int:
+        """Длительность смены в минутах"""
+        return self.end - self.start if self.end > self.start else self.end + MINUTES_IN_DAY - self.start
+
+    def segments(self) -> List[Tuple[int, int]]:
+        """Интервалы смены в пределах суток: [начало, конец)"""
+        if self.end > self.start:
+            return [(self.start, self.end)]
+        return [(self.start, MINUTES_IN_DAY), (0, self.end)]
+
+    def overlaps(self, start: int, end: int) -> bool:
+        """Пересекается ли смена с интервалом [start, end) в минутах"""
+        return any(s < end and start < e for s, e in self.segments())
+
+    def __str__(self) -> str:
+        if self.start % 60 or self.end % 60:
+            return "{}:{:02d}-{}:{:02d}".format(*divmod(self.start, 60), *divmod(self.end, 60))
+        return f"{self.start // 60}-{self.end // 60}"
+
+def parse_shift(text: str) -> Optional[Shift]:
+    """Разбирает время смены ("9-18", "10:30-19:00") или "выходной" (возвращает None).
+
+    При некорректном формате выбрасывает ValueError.
+    """
+    value = text.strip().lower()
+    if value == DAY_OFF:
+        return None
     
-    day_mapping = {
-        'понедельник': 'monday',
-        'вторник': 'tuesday',
-        'среда': 'wednesday',
-        'четверг': 'thursday',
-        'пятница': 'friday',
-        'суббота': 'saturday',
-        'воскресенье': 'sunday'
-    }
+    match = SHIFT_PATTERN.match(value)
+    if not match:
+        raise ValueError(f"Некорректный формат времени: {text}")
     
-    for line in lines:
-        if ':' not in line:
-            continue
-            
-        day_part, time_part = line.split(':', 1)
-        day = day_part.strip().lower()
-        time = time_part.strip().lower()
-        
-        for ru_day, en_day in day_mapping.items():
-            if ru_day in day:
-                schedule[en_day] = time
-                break
+    start_hour, start_min, end_hour, end_min = (int(part or 0) for part in match.groups())
+    if start_hour > 23 or end_hour > 24 or start_min > 59 or end_min > 59 or (end_hour == 24 and end_min):
+        raise ValueError(f"Некорректное время: {text}")
     
-    return schedule
+    shift = Shift(start_hour * 60 + start_min, end_hour * 60 + end_min)
+    if shift.start == shift.end:
+        raise ValueError(f"Смена нулевой длительности: {text}")
+    return shift
 
-def validate_schedule(schedule: Dict[str, str]) -> bool:
-    """Проверяет корректность формата расписания"""
-    if not schedule:
-        return False
-        
-    time_pattern = re.compile(
-        r'^(\d{1,2})\s*-\s*(\d{1,2})$|'
-        r'^(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})$|'
-        r'^выходной$',
-        re.IGNORECASE
+def parse_day(text: str) -> Optional[str]:
+    """Возвращает английское название дня по русскому названию или сокращению"""
+    value = text.strip().lower().rstrip('.')
+    return DAY_NAMES_RU.get(value) or DAY_ABBREVIATIONS_RU.get(value)
+
+def parse_time(text: str) -> int:
+    """Разбирает время "14" или "14:30" в минуты от начала суток, ValueError при ошибке"""
+    match = TIME_PATTERN.match(text.strip())
+    if not match:
+        raise ValueError(f"Некорректное время: {text}")
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Некорректное время: {text}")
+    return hours * 60 + minutes
+
+def format_minute(minute: int) -> str:
+    """Минуты от начала суток в виде ЧЧ:ММ"""
+    return "{:02d}:{:02d}".format(*divmod(minute, 60))
+
+def format_shift(shift: Optional[Shift]) -> str:
+    """Текстовое представление смены или «выходной»"""
+    return DAY_OFF if shift is None else str(shift)
+
+class ScheduleError(NamedTuple):
+    """Ошибка разбора расписания: фрагмент текста, его позиция и описание"""
+    fragment: str
+    position: int
+    message: str
+
+    def __str__(self) -> str:
+        return f"«{self.fragment}»: {self.message}" if self.fragment else self.message
+
+DAY_OFF_WORDS = {DAY_OFF, 'вых'}
+DAY_LOOKUP = {**DAY_NAMES_RU, **DAY_ABBREVIATIONS_RU}
+# Тире между двумя названиями дней - диапазон («пн-пт»); в остальных случаях
+# («среда - выходной», «пн - 9-18») оно отделяет день от значения (sep)
+SCHEDULE_TOKEN_PATTERN = re.compile(rf"""
+    (?P<sep>[\s,;:]*(?:[-–—][\s,;:]*)?)
+    (?:
+        (?P<shift>\d{{1,2}}(?::\d{{2}})?\s*[-–—]\s*\d{{1,2}}(?::\d{{2}})?)(?![\d:\-–—])
+      | (?P<days>(?P<first>[а-яё]+)\.?
+          (?:\s*[-–—]\s*(?P<last>{'|'.join(sorted(DAY_LOOKUP, key=len, reverse=True))})(?![а-яё])\.?)?)
+      | (?P<junk>[^\s,;:]+)
     )
-    
-    for day, time in schedule.items():
-        if not time_pattern.match(time.strip()):
-            return False
-            
-    return True
+""", re.VERBOSE | re.IGNORECASE)
+
+@lru_cache(maxsize=None)
+def _day_range(first: str, last: str) -> Tuple[str, ...]:
+    """Дни от first до last включительно (пт-пн переходит через воскресенье)"""
+    start, end = WEEK_DAYS.index(first), WEEK_DAYS.index(last)
+    return tuple(WEEK_DAYS[(start + offset) % 7] for offset in range((end - start) % 7 + 1))
+
+def parse_schedule(text: str) -> Tuple[Dict[str, Optional[Shift]], List[ScheduleError]]:
+    """Разбирает и проверяет расписание недели за один проход по тексту.
+
+    Понимает полные названия дней и сокращения (пн, вт...), диапазоны
+    («пн-пт: 9-18»), перечисления через запятую («сб, вс: выходной»), тире
+    между днем и значением («среда - выходной»), ввод одной строкой и по
+    строкам, разделители «,» и «;». Время смены проверяет parse_shift.
+    Возвращает смены по всем дням (None - выходной, в том числе для
+    неуказанных дней) и список ошибок; расписание корректно, если ошибок нет.
+    """
+    schedule: Dict[str, Optional[Shift]] = {}
+    errors: List[ScheduleError] = []
+    pending: Tuple[str, ...] = ()  # Дни, ожидающие значения
+    pending_text, pending_position = '', 0
+    skip_value = False  # Время после неизвестного дня уже учтено в ошибке про день
+    lowered = text.lower()
+
+    for match in SCHEDULE_TOKEN_PATTERN.finditer(lowered):
+        sep, shift_text, days_text, first, last, junk = match.groups()
+        if days_text is not None and (last is not None or first not in DAY_OFF_WORDS):
+            first_day = DAY_LOOKUP.get(first)
+            if first_day is None:
+                errors.append(ScheduleError(days_text, match.start('days'), "неизвестный день недели"))
+                pending, skip_value = (), True
+                continue
+            days = _day_range(first_day, DAY_LOOKUP[last] if last else first_day)
+            if pending and ',' in sep:
+                pending += days
+                pending_text = lowered[pending_position:match.end('days')]
+            else:
+                if pending:
+                    errors.append(ScheduleError(pending_text, pending_position, "не указано время"))
+                pending, pending_text, pending_position = days, days_text, match.start('days')
+            skip_value = False
+            continue
+        if junk is not None:
+            errors.append(ScheduleError(junk, match.start('junk'), "непонятный фрагмент"))
+            continue
+
+        # Время смены или выходной
+        value = None
+        if shift_text is not None:
+            try:
+                value = parse_shift(shift_text)
+            except ValueError as err:
+                errors.append(ScheduleError(shift_text, match.start('shift'), str(err)))
+                pending, skip_value = (), False
+                continue
+        if skip_value:
+            skip_value = False
+            continue
+        if not pending:
+            value_text = shift_text or days_text
+            errors.append(ScheduleError(value_text, match.start('shift' if shift_text else 'days'), "не указан день"))
+            continue
+        for day in pending:
+            if day in schedule:
+                errors.append(ScheduleError(pending_text, pending_position, "день указан повторно"))
+                break
+            schedule[day] = value
+        pending = ()
+
+    if pending:
+        errors.append(ScheduleError(pending_text, pending_position, "не указано время"))
+    if not errors and not schedule:
+        errors.append(ScheduleError('', len(text), "не указан ни один день"))
+    for day in WEEK_DAYS:
+        schedule.setdefault(day, None)
+    return schedule, errors
 
 def get_week_start_date(date: Optional[datetime.date] = None) -> datetime.date:
     """Возвращает дату понедельника текущей недели"""
@@ -64,8 +214,7 @@ def get_day_of_week(date: Optional[datetime.date] = None) -> str:
     """Возвращает название дня недели на английском"""
     if date is None:
         date = datetime.now().date()
-    days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-    return days[date.weekday()]
+    return WEEK_DAYS[date.weekday()]
 
 def format_schedule_for_tomorrow(schedule_entries: List[Dict], day_name: str) -> str:
     """Форматирует расписание на завтра в текстовом виде"""
@@ -73,11 +222,11 @@ def format_schedule_for_tomorrow(schedule_entries: List[Dict], day_name: str) ->
     
     for entry in schedule_entries:
         name = f"{entry['last_name']} {entry['first_name']}"
-        time_range = entry.get(day_name, 'выходной')
+        shift = entry.get(day_name)
         
-        if time_range.lower() == 'выходной':
+        if shift is None:
             result += f"👤 {name}: <i>выходной</i>\n"
         else:
-            result += f"👤 {name}: {time_range}\n"
+            result += f"👤 {name}: {shift}\n"
     
     return result
@@ -0,0 +1,86 @@
+import asyncio
+import hmac
+import logging
+import signal
+from typing import Awaitable, Callable
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def secret_token_middleware(path: str, secret: str):
+    """Отклоняет запросы на путь вебхука без правильного секретного токена"""
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        if request.path == path:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, secret):
+                logger.warning(f"Запрос к вебхуку с неверным токеном от {request.remote}")
+                return web.Response(status=401)
+        return await handler(request)
+    return middleware
+
+
+def create_webhook_app(
+    dp: Dispatcher,
+    bot: Bot,
+    on_startup: Callable[[], Awaitable[None]],
+    on_shutdown: Callable[[], Awaitable[None]]
+) -> web.Application:
+    """Создает aiohttp-приложение, принимающее обновления Telegram на Config.WEBHOOK_PATH"""
+    middlewares = []
+    if Config.WEBHOOK_SECRET:
+        middlewares.append(secret_token_middleware(Config.WEBHOOK_PATH, Config.WEBHOOK_SECRET))
+    else:
+        logger.warning("WEBHOOK_SECRET не задан: запросы к вебхуку не проверяются")
+    app = web.Application(middlewares=middlewares)
+
+    async def startup(app: web.Application):
+        await on_startup()
+        if Config.WEBHOOK_URL:
+            await bot.set_webhook(
+                Config.WEBHOOK_URL.rstrip('/') + Config.WEBHOOK_PATH,
+                secret_token=Config.WEBHOOK_SECRET or None,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            logger.info(f"Вебхук установлен: {Config.WEBHOOK_URL}")
+
+    async def shutdown(app: web.Application):
+        # Вебхук не удаляем: остальные реплики продолжают принимать обновления
+        await on_shutdown()
+
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=Config.WEBHOOK_PATH)
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    on_startup: Callable[[], Awaitable[None]],
+    on_shutdown: Callable[[], Awaitable[None]]
+):
+    """Запускает сервер вебхука и работает до SIGINT/SIGTERM"""
+    # Обработчики ставятся до запуска: on_startup может завершить бот по SIGTERM
+    # (ошибка фоновой инициализации), и сигнал не должен убить процесс без cleanup
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    app = create_webhook_app(dp, bot, on_startup, on_shutdown)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, Config.WEBHOOK_HOST, Config.WEBHOOK_PORT)
+        await site.start()
+        logger.info(f"Вебхук слушает {Config.WEBHOOK_HOST}:{Config.WEBHOOK_PORT}{Config.WEBHOOK_PATH}")
+        await stop.wait()
+    finally:
+        await runner.cleanup()